@@ -0,0 +1,114 @@
+"""Cold-start benchmark: import time and time-to-first-response of the WSGI application.
+
+Usage (from the repository root):
+
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --profiles lean --path /api/weather/cache-stats/
+
+Every run starts a fresh interpreter, as a serverless invocation does, that imports
+``weather_project.wsgi`` and serves one request through it against a local mock
+OpenWeatherMap. Each profile (``default`` and ``lean``, i.e. ``WEATHER_LEAN_API=True``)
+reports the median process start-up, application import and first response times in
+milliseconds, plus whether the heavy optional modules were loaded by then.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+PROFILES = {
+    'default': {'WEATHER_LEAN_API': 'False'},
+    'lean': {'WEATHER_LEAN_API': 'True'},
+}
+
+# modules whose import dominates start-up; only the summary endpoint needs the Gemini SDK
+# and only the async views need httpx
+HEAVY_MODULES = ('google.generativeai', 'grpc', 'httpx', 'rest_framework', 'django.contrib.admin')
+
+
+# runs in the child interpreter (``--child PATH``): import the app, serve one request
+def child(path):
+    start = time.perf_counter()
+    from weather_project.wsgi import application
+    imported = time.perf_counter()
+
+    from io import BytesIO
+    from wsgiref.util import setup_testing_defaults
+    path, _, query = path.partition('?')
+    environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'REQUEST_METHOD': 'GET', 'wsgi.input': BytesIO()}
+    setup_testing_defaults(environ)
+    statuses = []
+    body = b''.join(application(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+    responded = time.perf_counter()
+
+    print(json.dumps({
+        'import_ms': (imported - start) * 1000,
+        'first_response_ms': (responded - start) * 1000,
+        'status': statuses[0],
+        'bytes': len(body),
+        'modules': {name: name in sys.modules for name in HEAVY_MODULES},
+    }))
+
+
+def run_once(path, env):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', path], cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    total = time.perf_counter() - start
+    result = json.loads(output.splitlines()[-1])
+    result['process_ms'] = total * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start time of the WSGI application')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/api/weather/?city=London', help='path of the first request')
+    parser.add_argument('--profiles', default=','.join(PROFILES))
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child)
+
+    from benchmarks.mock_upstream import start_mock_upstream
+    mock = start_mock_upstream()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update({
+            'DJANGO_SETTINGS_MODULE': 'weather_project.settings',
+            'DATABASE_URL': f'sqlite:///{Path(tmp) / "cold.sqlite3"}',
+            'OPENWEATHERMAP_API_KEY': 'bench',
+            'GEMINI_API_KEY': 'bench',
+            'OPENWEATHERMAP_BASE_URL': f'http://127.0.0.1:{mock.server_port}/data/2.5',
+            'GEMINI_BASE_URL': f'http://127.0.0.1:{mock.server_port}/v1beta',
+            'WEATHER_WRITE_BEHIND': 'False',
+            'PYTHONPATH': str(ROOT),
+        })
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '-v', '0'], cwd=ROOT, env=env, check=True)
+
+        for profile in args.profiles.split(','):
+            results = [run_once(args.path, dict(env, **PROFILES[profile])) for _ in range(args.runs)]
+            loaded = [name for name, present in results[-1]['modules'].items() if present]
+            print(
+                f'{profile:8} process {statistics.median(r["process_ms"] for r in results):7.1f} ms  '
+                f'import {statistics.median(r["import_ms"] for r in results):7.1f} ms  '
+                f'first response {statistics.median(r["first_response_ms"] for r in results):7.1f} ms  '
+                f'({results[-1]["status"]}; loaded: {", ".join(loaded) or "none"})'
+            )
+
+    mock.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Micro-benchmark of forecast processing on a 40-slot OpenWeatherMap payload.
+
+Usage (from the repository root):
+
+    python benchmarks/forecast_processing.py --number 20000
+
+Compares the previous implementation (one sampled slot per day) with the single-pass
+daily aggregation in ``weather_api.forecast``.
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.mock_upstream import build_forecast  # noqa: E402
+from weather_api.forecast import process_forecast  # noqa: E402
+
+
+# the processing the views used before weather_api.forecast: every 8th slot stands for a day
+def sampled_process_forecast(data, uv=None):
+    processed_data = {
+        'city': data['city']['name'],
+        'country': data['city']['country'],
+        'current': {
+            'temp_c': data['list'][0]['main']['temp'],
+            'description': data['list'][0]['weather'][0]['description'],
+            'wind_speed': data['list'][0]['wind']['speed'],
+            'humidity': data['list'][0]['main']['humidity'],
+            'pressure': data['list'][0]['main']['pressure']
+        },
+        'forecast': [
+            {
+                'date': item['dt_txt'].split()[0],
+                'temp_min': item['main']['temp_min'],
+                'temp_max': item['main']['temp_max'],
+                'description': item['weather'][0]['description']
+            } for item in data['list'][::8]
+        ]
+    }
+    if uv is not None:
+        processed_data['current']['uv'] = uv
+    return processed_data
+
+
+def measure(fn, data, number, repeat):
+    best = min(timeit.repeat(lambda: fn(data), number=number, repeat=repeat))
+    return round(best / number * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000, help='calls per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs, the best one is reported')
+    args = parser.parse_args()
+
+    data = build_forecast('Benchmark City')
+    without_dt = json.loads(json.dumps(data))
+    for item in without_dt['list']:
+        del item['dt']
+
+    results = {
+        'sampled_us': measure(sampled_process_forecast, data, args.number, args.repeat),
+        'single_pass_us': measure(process_forecast, data, args.number, args.repeat),
+        'single_pass_dt_txt_us': measure(process_forecast, without_dt, args.number // 10, args.repeat),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Encode/decode timings of the weather JSON paths.
+
+Usage (from the repository root):
+
+    python benchmarks/json_encoding.py --number 5000
+
+Decoding compares the stdlib parse behind ``response.json()`` with
+``weather_api.serialization.loads`` on a 40-slot OpenWeatherMap payload; encoding compares
+``JsonResponse`` with the ``dumps`` response body the weather views send, on the processed
+forecast in the full and the compact (columnar) shape.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'weather_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.http import HttpResponse, JsonResponse  # noqa: E402
+from benchmarks.mock_upstream import build_forecast  # noqa: E402
+from weather_api.forecast import compact_forecast, process_forecast  # noqa: E402
+from weather_api.serialization import dumps, loads, orjson  # noqa: E402
+
+
+# the response the weather views build (conditional_json without the validators)
+def fast_json_response(data):
+    return HttpResponse(dumps(data), content_type='application/json')
+
+
+def measure(fn, number, repeat):
+    return round(min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=5000, help='calls per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs, the best one is reported')
+    args = parser.parse_args()
+
+    raw = json.dumps(build_forecast('Benchmark City')).encode('utf-8')
+    processed = process_forecast(loads(raw))
+    compact = compact_forecast(processed)
+
+    results = {
+        'backend': 'orjson' if orjson is not None else 'json',
+        'decode_stdlib_us': measure(lambda: json.loads(raw.decode('utf-8')), args.number, args.repeat),
+        'decode_fast_us': measure(lambda: loads(raw), args.number, args.repeat),
+        'encode_jsonresponse_us': measure(lambda: JsonResponse(processed), args.number, args.repeat),
+        'encode_fast_us': measure(lambda: fast_json_response(processed), args.number, args.repeat),
+        'encode_fast_compact_us': measure(lambda: fast_json_response(compact_forecast(processed)), args.number, args.repeat),
+        'bytes_full': len(JsonResponse(processed).content),
+        'bytes_fast': len(fast_json_response(processed).content),
+        'bytes_fast_compact': len(fast_json_response(compact).content),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""Load-test the API under WSGI and ASGI against a local mock OpenWeatherMap/Gemini.
+
+Usage (from the repository root):
+
+    python benchmarks/load_test.py --concurrency 100 --duration 10 --latency 0.2
+    python benchmarks/load_test.py --output benchmarks/baseline.json
+    python benchmarks/load_test.py --compare benchmarks/baseline.json --tolerance 0.25
+
+The WSGI side runs the project's WSGI application on a threaded wsgiref server and the ASGI
+side runs ``weather_project.asgi`` (async views) on uvicorn, if it is installed. Each scenario
+drives one kind of traffic:
+
+    hot          one city, served from the forecast cache
+    cold         a new city on every request, each one an upstream call and a snapshot write
+    coordinates  a new point on every request, more than NEAREST_KM apart
+    summary      AI summaries of already fetched cities, every one generated by the mock Gemini
+    batch        POST /api/weather/batch/ with 10 new cities per request
+
+Results (requests/sec, error count, p50/p95/p99 latency) are printed and written with
+``--output`` as a JSON baseline; ``--compare`` checks a run against a baseline and exits
+with status 1 when a scenario lost more than ``--tolerance`` of its throughput, its p95
+latency grew by more than that share, or its share of failed requests rose by more than
+``--error-tolerance``.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+SUMMARY_CITIES = 20
+BATCH_SIZE = 10
+
+
+def coordinates_request(run, i):
+    # a 0.05 degree grid (about 5.5 km) so requests do not snap onto each other's points
+    latitude = -80 + (i % 3200) * 0.05
+    longitude = -175 + (i // 3200 + run * 7) % 7000 * 0.05
+    return 'GET', f'/api/weather/coordinates/?lat={latitude:.2f}&lon={longitude:.2f}', None
+
+
+def batch_request(run, i):
+    return 'POST', '/api/weather/batch/', {'cities': [f'Batch{run}x{i}x{n}' for n in range(BATCH_SIZE)]}
+
+
+# scenario name -> function of (run number, request number) returning (method, path, JSON body);
+# the run number keeps "new" cities and points new across warm-ups, scenarios and servers
+SCENARIOS = {
+    'hot': lambda run, i: ('GET', '/api/weather/?city=London', None),
+    'cold': lambda run, i: ('GET', f'/api/weather/?city=Cold{run}x{i}', None),
+    'coordinates': coordinates_request,
+    'summary': lambda run, i: ('GET', f'/api/weather/generate-weather-summary/?city=Summary{i % SUMMARY_CITIES}', None),
+    'batch': batch_request,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# environment for the app server: mock upstream, throwaway database, no rate limits or
+# call budgets, no summary cache so summaries always reach the mock Gemini, and a local
+# cache large enough that the cold scenarios do not cull the summary contexts
+def server_env(mock_port, database, pool_size):
+    env = dict(os.environ)
+    env.update({
+        'DJANGO_SETTINGS_MODULE': 'weather_project.settings',
+        'DATABASE_URL': f'sqlite:///{database}',
+        'OPENWEATHERMAP_API_KEY': 'bench',
+        'GEMINI_API_KEY': 'bench',
+        'OPENWEATHERMAP_BASE_URL': f'http://127.0.0.1:{mock_port}/data/2.5',
+        'GEMINI_BASE_URL': f'http://127.0.0.1:{mock_port}/v1beta',
+        'CACHE_URL': 'locmemcache://?max_entries=1000000',
+        'WEATHER_SUMMARY_CACHE_TTL': '0',
+        'WEATHER_RATE_LIMIT_ENABLED': 'False',
+        'UPSTREAM_POOL_SIZE': str(pool_size),
+        'UPSTREAM_ASYNC_POOL_SIZE': str(pool_size),
+        'PYTHONPATH': str(ROOT),
+    })
+    return env
+
+
+# threaded wsgiref server, started in a subprocess with ``--serve-wsgi PORT``
+def serve_wsgi(port):
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+    from weather_project.wsgi import application
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    make_server('127.0.0.1', port, application, ThreadingWSGIServer, QuietHandler).serve_forever()
+
+
+def start_server(kind, port, env):
+    if kind == 'wsgi':
+        command = [sys.executable, __file__, '--serve-wsgi', str(port)]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'weather_project.asgi:application',
+                   '--port', str(port), '--log-level', 'warning', '--no-access-log']
+    return subprocess.Popen(command, cwd=ROOT, env=env)
+
+
+# the mock runs in its own process so it does not share a GIL with the load generator
+def start_mock(port, latency, gemini_latency, error_rate):
+    command = [
+        sys.executable, str(ROOT / 'benchmarks' / 'mock_upstream.py'), '--port', str(port),
+        '--latency', str(latency), '--error-rate', str(error_rate),
+    ]
+    if gemini_latency is not None:
+        command += ['--gemini-latency', str(gemini_latency)]
+    return subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL)
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up')
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+# drive `concurrency` workers through request_for(n) for `duration` seconds
+async def run_load(base_url, request_for, concurrency, duration):
+    latencies = []
+    errors = 0
+    numbers = itertools.count()
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                method, path, body = request_for(next(numbers))
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+_runs = itertools.count(1)
+
+
+# one scenario against a running server: prepare its data, warm up, then measure
+def run_scenario(base_url, scenario, args):
+    make_request = SCENARIOS[scenario]
+    if scenario == 'summary':
+        # the summaries need the forecasts of their cities
+        for n in range(SUMMARY_CITIES):
+            httpx.get(f'{base_url}/api/weather/?city=Summary{n}', timeout=60)
+    run = next(_runs)
+    asyncio.run(run_load(base_url, lambda i: make_request(run, i), min(args.concurrency, 10), args.warmup))
+    run = next(_runs)
+    return asyncio.run(run_load(base_url, lambda i: make_request(run, i), args.concurrency, args.duration))
+
+
+def error_rate(result):
+    return result['errors'] / result['requests'] if result['requests'] else 0.0
+
+
+# (report lines, regressions) of a run against a baseline: a scenario regressed when it lost
+# more than `tolerance` of its throughput, its p95 latency grew by more than that share or
+# the share of failed requests rose by more than `error_tolerance`
+def compare(baseline, results, tolerance, error_tolerance=0.01):
+    lines, regressions = [], []
+    for kind, scenarios in results.items():
+        for scenario, current in scenarios.items():
+            previous = baseline.get('results', {}).get(kind, {}).get(scenario)
+            if not previous:
+                continue
+            rps_change = current['rps'] / previous['rps'] - 1 if previous['rps'] else 0.0
+            p95_change = current['p95_ms'] / previous['p95_ms'] - 1 if previous['p95_ms'] else 0.0
+            errors_before, errors_now = error_rate(previous), error_rate(current)
+            lines.append(
+                f'{kind}/{scenario}: rps {previous["rps"]} -> {current["rps"]} ({rps_change:+.0%}), '
+                f'p95 {previous["p95_ms"]} -> {current["p95_ms"]} ms ({p95_change:+.0%}), '
+                f'errors {errors_before:.1%} -> {errors_now:.1%}'
+            )
+            if rps_change < -tolerance:
+                regressions.append(f'{kind}/{scenario}: throughput down {-rps_change:.0%}')
+            if p95_change > tolerance:
+                regressions.append(f'{kind}/{scenario}: p95 latency up {p95_change:.0%}')
+            if errors_now - errors_before > error_tolerance:
+                regressions.append(f'{kind}/{scenario}: error rate up from {errors_before:.1%} to {errors_now:.1%}')
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WSGI vs ASGI load test against a mock upstream')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10, help='seconds measured per scenario')
+    parser.add_argument('--warmup', type=float, default=1, help='seconds of warm-up traffic per scenario')
+    parser.add_argument('--latency', type=float, default=0.2, help='mock OpenWeatherMap latency in seconds')
+    parser.add_argument('--gemini-latency', type=float, help='mock Gemini latency in seconds (default: --latency)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of mock upstream calls failing with 503')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--servers', default='wsgi,asgi')
+    parser.add_argument('--output', help='write the results as a JSON baseline to this file')
+    parser.add_argument('--compare', help='baseline JSON to compare the results against')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--error-tolerance', type=float, default=0.01, help='allowed rise of the failed request share')
+    parser.add_argument('--serve-wsgi', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        return serve_wsgi(args.serve_wsgi)
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - SCENARIOS.keys()
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    mock_port = free_port()
+    mock = start_mock(mock_port, args.latency, args.gemini_latency, args.error_rate)
+    wait_until_up(f'http://127.0.0.1:{mock_port}/')
+    results = {}
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = server_env(mock_port, Path(tmp) / 'bench.sqlite3', args.concurrency)
+            subprocess.run([sys.executable, 'manage.py', 'migrate', '-v', '0'], cwd=ROOT, env=env, check=True)
+
+            for kind in args.servers.split(','):
+                if kind == 'asgi' and subprocess.run([sys.executable, '-c', 'import uvicorn'], capture_output=True).returncode:
+                    print('uvicorn is not installed, skipping the ASGI run (pip install uvicorn)')
+                    continue
+                port = free_port()
+                server = start_server(kind, port, env)
+                base_url = f'http://127.0.0.1:{port}'
+                try:
+                    wait_until_up(f'{base_url}/api/weather/cache-stats/')
+                    results[kind] = {}
+                    for scenario in scenarios:
+                        results[kind][scenario] = run_scenario(base_url, scenario, args)
+                        print(f'{kind}/{scenario}: {json.dumps(results[kind][scenario])}')
+                finally:
+                    server.terminate()
+                    server.wait()
+    finally:
+        mock.terminate()
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'latency': args.latency,
+            'gemini_latency': args.gemini_latency,
+            'error_rate': args.error_rate,
+        },
+        'results': results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + '\n')
+
+    if args.compare:
+        lines, regressions = compare(json.loads(Path(args.compare).read_text()), results, args.tolerance, args.error_tolerance)
+        for line in lines:
+            print(line)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Local stand-in for the OpenWeatherMap forecast API and the Gemini REST API.
+
+Run standalone with ``python benchmarks/mock_upstream.py --port 8900 --latency 0.05``
+and point the app at it with ``OPENWEATHERMAP_BASE_URL=http://127.0.0.1:8900/data/2.5``
+and ``GEMINI_BASE_URL=http://127.0.0.1:8900/v1beta``. Gemini's ``generateContent`` and
+``streamGenerateContent`` (``alt=sse`` events or the JSON array the SDK's REST transport reads)
+are both answered.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DESCRIPTIONS = ['clear sky', 'few clouds', 'scattered clouds', 'light rain', 'overcast clouds']
+
+
+# deterministic 40-slot forecast so repeated fetches of a city produce identical snapshots
+def build_forecast(name, country='MC'):
+    seed = int(hashlib.md5(name.encode('utf-8')).hexdigest()[:8], 16)
+    start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    slots = []
+    for i in range(40):
+        temp = round(10 + (seed % 15) + 6 * ((i % 8) - 4) / 4, 2)
+        when = start + timedelta(hours=3 * i)
+        slots.append({
+            'dt': int(when.timestamp()),
+            'main': {
+                'temp': temp,
+                'temp_min': temp - 1,
+                'temp_max': temp + 1,
+                'humidity': 40 + (seed + i) % 50,
+                'pressure': 1000 + (seed + i) % 30,
+            },
+            'weather': [{'description': DESCRIPTIONS[(seed + i // 8) % len(DESCRIPTIONS)]}],
+            'wind': {'speed': round(1 + (seed + i) % 9 * 0.7, 2)},
+            'dt_txt': when.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+    return {'city': {'name': name, 'country': country, 'timezone': 0}, 'list': slots}
+
+
+def summary_chunks(prompt):
+    return [f'Mock summary for a {len(prompt)} ', 'character prompt.\n', 'Stay dry.']
+
+
+def build_summary(prompt, chunks=None):
+    text = ''.join(chunks or summary_chunks(prompt))
+    return {'candidates': [{'content': {'parts': [{'text': text}]}}]}
+
+
+class MockUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.0
+    gemini_latency = None
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay_or_fail(self, latency=None):
+        latency = self.latency if latency is None else latency
+        if latency:
+            time.sleep(latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self._send(503, {'message': 'mock upstream error'})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not url.path.endswith('/forecast'):
+            return self._send(404, {'message': 'not found'})
+        if self._delay_or_fail():
+            return
+        query = parse_qs(url.query)
+        if 'q' in query:
+            name = query['q'][0]
+        else:
+            name = f"Point {query.get('lat', ['0'])[0]},{query.get('lon', ['0'])[0]}"
+        self._send(200, build_forecast(name))
+
+    def _send_raw(self, content_type, body):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        url = urlparse(self.path)
+        if not url.path.endswith((':generateContent', ':streamGenerateContent')):
+            return self._send(404, {'message': 'not found'})
+        if self._delay_or_fail(self.gemini_latency):
+            return
+        prompt = body['contents'][0]['parts'][0]['text']
+        if url.path.endswith(':generateContent'):
+            return self._send(200, build_summary(prompt))
+
+        events = [build_summary(prompt, [chunk]) for chunk in summary_chunks(prompt)]
+        if parse_qs(url.query).get('alt') == ['sse']:
+            payload = ''.join(f'data: {json.dumps(event)}\r\n\r\n' for event in events)
+            return self._send_raw('text/event-stream', payload.encode('utf-8'))
+        self._send_raw('application/json', json.dumps(events).encode('utf-8'))
+
+
+# start the mock in a background thread, returns the server (call .shutdown() to stop)
+def start_mock_upstream(port=0, latency=0.0, error_rate=0.0, gemini_latency=None):
+    handler = type('Handler', (MockUpstreamHandler,), {
+        'latency': latency, 'error_rate': error_rate, 'gemini_latency': gemini_latency,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every upstream response')
+    parser.add_argument('--gemini-latency', type=float, help='seconds added to Gemini responses (default: --latency)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answered with 503')
+    args = parser.parse_args()
+    server = start_mock_upstream(args.port, args.latency, args.error_rate, args.gemini_latency)
+    print(f'Mock upstream listening on http://127.0.0.1:{server.server_port}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Weather 
+from .models import Weather, WeatherDailySummary
 
 
 # Register your models here.
-admin.site.register(Weather)
\ No newline at end of file
+admin.site.register(Weather)
+admin.site.register(WeatherDailySummary)
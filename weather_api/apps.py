@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class WeatherApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "weather_api"
+
+    def ready(self):
+        from .gazetteer import get_city_index, get_gazetteer_settings
+
+        # Load the city index once per process before the first request
+        if get_gazetteer_settings()['PRELOAD']:
+            get_city_index()
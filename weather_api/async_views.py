@@ -0,0 +1,119 @@
+from django.http import JsonResponse
+from django.views import View
+from .cache import city_cache_key, coordinates_cache_key
+from .geo import snap_coordinates
+from .upstream import UpstreamUnavailable, agenerate_content, astream_content
+from .services import afetch_city_weather, afetch_coordinates_weather, aweather_response
+from .persistence import snapshot_writer
+from .summaries import SummaryFormatter, sse_event, summary_cache, summary_cache_key, summary_contexts
+from .gazetteer import canonical_city
+from .views import GenerateWeatherSummary, weather_json
+from .warming import city_query, coordinates_query, popularity
+from .metrics import span
+
+# Async variants of the weather endpoints for ASGI deployments. Upstream calls go through
+# a shared httpx.AsyncClient and the Weather lookups/writes use the async ORM, so a single
+# worker can keep many OpenWeatherMap/Gemini calls in flight.
+
+
+# async endpoint for weather data: parameters: city: string
+class AsyncWeatherView(View):
+    async def get(self, request):
+        # Get the city from the request, default to New York
+        city = request.GET.get('city', 'New York')
+        try:
+            city = canonical_city(city)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        popularity.record(*city_query(city))
+
+        cache_key = city_cache_key(city)
+        with span('forecast'):
+            processed_data, status = await aweather_response(cache_key, lambda: self.fetch_weather(city))
+        if status != 200:
+            return JsonResponse(processed_data, status=status)
+        return weather_json(request, processed_data, cache_key)
+
+    async def fetch_weather(self, city):
+        processed_data = await afetch_city_weather(city)
+        await summary_contexts.asave(processed_data, query=city)
+        await snapshot_writer.aenqueue(processed_data)
+        return processed_data
+
+
+# async endpoint for weather data of given coordinates: parameters: lat: float, lon: float
+class AsyncGetWeatherByCoordinates(View):
+    async def get(self, request):
+        latitude = request.GET.get('lat')
+        longitude = request.GET.get('lon')
+
+        if not latitude or not longitude:
+            return JsonResponse({'error': 'Latitude and Longitude are required parameters.'}, status=400)
+
+        # Validate, round onto the cache grid and reuse a nearby cached point
+        try:
+            latitude, longitude = snap_coordinates(latitude, longitude)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        popularity.record(*coordinates_query(latitude, longitude))
+
+        cache_key = coordinates_cache_key(latitude, longitude)
+        with span('forecast'):
+            processed_data, status = await aweather_response(cache_key, lambda: self.fetch_weather(latitude, longitude))
+        if status != 200:
+            return JsonResponse(processed_data, status=status)
+        return weather_json(request, processed_data, cache_key)
+
+    async def fetch_weather(self, latitude, longitude):
+        processed_data = await afetch_coordinates_weather(latitude, longitude)
+        await summary_contexts.asave(processed_data)
+        await snapshot_writer.aenqueue(processed_data)
+        return processed_data
+
+
+# async endpoint for the AI summary, reuses the prompt building and formatting of the sync view
+class AsyncGenerateWeatherSummary(GenerateWeatherSummary):
+    async def get(self, request):
+        last_weather_data = await summary_contexts.aget(*self.summary_city(request))
+
+        if not last_weather_data:
+            return JsonResponse({'error': 'No weather data available.'}, status=400)
+
+        prompt = self.prepare_prompt(last_weather_data)
+
+        if self.wants_stream(request):
+            return self.stream_response(self.astream_events(prompt))
+
+        try:
+            summary = await summary_cache.aget_or_load(summary_cache_key(prompt), lambda: agenerate_content(prompt))
+            return JsonResponse({'summary': self.format_summary(summary)})
+        except UpstreamUnavailable:
+            return JsonResponse({'error': 'AI summaries are unavailable right now, please try again later.'}, status=503)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
+    # async version of stream_events() on Gemini's streaming REST endpoint
+    async def astream_events(self, prompt):
+        cache_key = summary_cache_key(prompt)
+        summary = await summary_cache.aget(cache_key)
+        if summary is not None:
+            summary = self.format_summary(summary)
+            yield sse_event('chunk', {'text': summary})
+            yield sse_event('done', {'summary': summary})
+            return
+
+        formatter = SummaryFormatter(self.format_summary)
+        try:
+            async for chunk in astream_content(prompt):
+                text = formatter.feed(chunk)
+                if text:
+                    yield sse_event('chunk', {'text': text})
+                if formatter.done:
+                    break
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+
+        await summary_cache.aset(cache_key, formatter.summary)
+        yield sse_event('done', {'summary': formatter.summary})
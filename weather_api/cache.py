@@ -0,0 +1,457 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Default cache settings, overridable through settings.WEATHER_CACHE (or the settings
+# name a ForecastCache was created with)
+DEFAULTS = {
+    'TTL': 600,                 # seconds an entry is served as fresh
+    'STALE_TTL': 1800,          # extra seconds an expired entry is served while it is revalidated
+    'MAX_ENTRIES': 512,         # size of the in-process LRU tier
+    'BACKEND': 'default',       # Django cache alias for the shared tier, None disables it
+    'KEY_PREFIX': 'weather',
+    'COORDINATE_PRECISION': 2,  # decimal places kept when rounding lat/lon into a key
+    'NEAREST_KM': 2.0,          # coordinates within this distance of a fetched point share its forecast, 0 disables
+}
+
+
+def get_cache_settings(settings_name='WEATHER_CACHE'):
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, settings_name, {}))
+    return config
+
+
+# build the cache key for a city query ("  New  York" and "new york" share a key)
+def city_cache_key(city):
+    return 'city:' + ' '.join(city.split()).casefold()
+
+
+# parse and range-check coordinates, the ValueError message is meant for the client
+def parse_coordinates(latitude, longitude):
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError('Latitude and Longitude must be numbers.')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('Latitude must be between -90 and 90 and Longitude between -180 and 180.')
+    return latitude, longitude
+
+
+# round coordinates onto the configured grid so nearby lookups share a key
+def round_coordinates(latitude, longitude):
+    precision = get_cache_settings()['COORDINATE_PRECISION']
+    latitude, longitude = parse_coordinates(latitude, longitude)
+    return round(latitude, precision), round(longitude, precision)
+
+
+def coordinates_cache_key(latitude, longitude):
+    latitude, longitude = round_coordinates(latitude, longitude)
+    return f'coord:{latitude}:{longitude}'
+
+
+class CacheEntry:
+    __slots__ = ('value', 'fresh_until', 'stale_until')
+
+    def __init__(self, value, fresh_until, stale_until):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+# thread-safe counters used to tune the cache
+class CacheStats:
+    FIELDS = ('hits', 'misses', 'stale', 'loads', 'coalesced', 'errors')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, field, amount=1):
+        with self._lock:
+            self._counts[field] += amount
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts['hits'] + counts['misses'] + counts['stale']
+        counts['hit_rate'] = round((counts['hits'] + counts['stale']) / lookups, 4) if lookups else 0.0
+        return counts
+
+
+# in-process LRU tier, bounded by number of entries
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'aborted')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.aborted = False
+
+
+# collapses concurrent calls for the same key into a single execution
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    # returns (result, shared) where shared is True if another caller did the work
+    def do(self, key, fn):
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            # the leader was aborted (worker timeout, SystemExit) without a result or an
+            # error; the first follower to get the lock takes over the load
+            if not call.aborted:
+                return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            call.aborted = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+
+# asyncio counterpart of SingleFlight, calls are only shared within one event loop
+class AsyncSingleFlight:
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        future = self._calls.get(flight_key)
+        while future is not None:
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # re-raise our own cancellation; when the leader was cancelled instead (its
+                # client went away) the first follower to wake up takes over the load
+                if not future.cancelled():
+                    raise
+            future = self._calls.get(flight_key)
+
+        future = self._calls[flight_key] = loop.create_future()
+        try:
+            result = await fn()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark as retrieved when nobody else was waiting
+            raise
+        except BaseException:
+            # cancelled: wake the followers instead of leaving them waiting forever
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._calls[flight_key]
+        return result, False
+
+
+# two-tier (in-process LRU + Django cache) forecast cache with stale-while-revalidate
+class ForecastCache:
+    def __init__(self, name='forecast', settings_name='WEATHER_CACHE'):
+        self.name = name
+        self.settings_name = settings_name
+        self.stats = CacheStats()
+        self._flight = SingleFlight()
+        self._aflight = AsyncSingleFlight()
+        self._tasks = set()
+        self._local = None
+        self._local_lock = threading.Lock()
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+
+    def config(self):
+        return get_cache_settings(self.settings_name)
+
+    @property
+    def local(self):
+        if self._local is None:
+            with self._local_lock:
+                if self._local is None:
+                    self._local = LRUCache(self.config()['MAX_ENTRIES'])
+        return self._local
+
+    def _shared(self):
+        alias = self.config()['BACKEND']
+        return caches[alias] if alias else None
+
+    def _shared_key(self, key):
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return f"{self.config()['KEY_PREFIX']}:{self.name}:{digest}"
+
+    def _lookup(self, key):
+        entry = self.local.get(key)
+        if entry is not None and time.time() < entry.fresh_until:
+            return entry
+
+        # the local copy is missing or expired, another worker may have refreshed it
+        shared = self._shared()
+        if shared is None:
+            return entry
+        return self._merge_shared(key, entry, shared.get(self._shared_key(key)))
+
+    async def _alookup(self, key):
+        entry = self.local.get(key)
+        if entry is not None and time.time() < entry.fresh_until:
+            return entry
+
+        shared = self._shared()
+        if shared is None:
+            return entry
+        return self._merge_shared(key, entry, await shared.aget(self._shared_key(key)))
+
+    # prefer the shared tier's copy when it is fresher than the local one
+    def _merge_shared(self, key, entry, stored):
+        if stored is None:
+            return entry
+        shared_entry = CacheEntry(*stored)
+        if entry is None or shared_entry.fresh_until > entry.fresh_until:
+            self.local.set(key, shared_entry)
+            return shared_entry
+        return entry
+
+    def _new_entry(self, key, value):
+        config = self.config()
+        now = time.time()
+        entry = CacheEntry(value, now + config['TTL'], now + config['TTL'] + config['STALE_TTL'])
+        self.local.set(key, entry)
+        return entry, config['TTL'] + config['STALE_TTL']
+
+    def set(self, key, value):
+        entry, timeout = self._new_entry(key, value)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(self._shared_key(key), (entry.value, entry.fresh_until, entry.stale_until), timeout=timeout)
+
+    async def aset(self, key, value):
+        entry, timeout = self._new_entry(key, value)
+        shared = self._shared()
+        if shared is not None:
+            await shared.aset(self._shared_key(key), (entry.value, entry.fresh_until, entry.stale_until), timeout=timeout)
+
+    def delete(self, key):
+        self.local.delete(key)
+        shared = self._shared()
+        if shared is not None:
+            shared.delete(self._shared_key(key))
+
+    # drop the in-process tier and counters, the shared tier expires on its own
+    def clear(self):
+        self.local.clear()
+        self.stats.reset()
+
+    # fresh or stale value for key without loading it, None on a miss
+    def get(self, key):
+        entry = self._lookup(key)
+        if entry is not None and time.time() < entry.stale_until:
+            self.stats.incr('hits')
+            return entry.value
+        self.stats.incr('misses')
+        return None
+
+    async def aget(self, key):
+        entry = await self._alookup(key)
+        if entry is not None and time.time() < entry.stale_until:
+            self.stats.incr('hits')
+            return entry.value
+        self.stats.incr('misses')
+        return None
+
+    # this process's entry for key without touching the stats or the shared tier, used
+    # for the HTTP cache headers of a value just returned by get_or_load()
+    def entry(self, key):
+        return self.local.get(key)
+
+    # last known value for key regardless of age, used when the provider is down
+    def peek(self, key):
+        entry = self._lookup(key)
+        return entry.value if entry is not None else None
+
+    # seconds the entry for key stays fresh, 0 when it is missing or expired
+    def fresh_for(self, key):
+        entry = self._lookup(key)
+        return max(0.0, entry.fresh_until - time.time()) if entry is not None else 0.0
+
+    # load key now whatever the age of its entry, sharing a load already in flight
+    def refresh(self, key, loader):
+        value, shared = self._flight.do(key, lambda: self._load(key, loader))
+        if shared:
+            self.stats.incr('coalesced')
+        return value
+
+    # return the cached value for key, calling loader() on a miss and
+    # refreshing in the background when the entry is stale
+    def get_or_load(self, key, loader):
+        entry = self._lookup(key)
+        now = time.time()
+
+        if entry is not None and now < entry.fresh_until:
+            self.stats.incr('hits')
+            return entry.value
+
+        if entry is not None and now < entry.stale_until:
+            self.stats.incr('stale')
+            self._revalidate(key, loader)
+            return entry.value
+
+        self.stats.incr('misses')
+        value, shared = self._flight.do(key, lambda: self._load(key, loader))
+        if shared:
+            self.stats.incr('coalesced')
+        return value
+
+    def _load(self, key, loader):
+        self.stats.incr('loads')
+        try:
+            value = loader()
+        except Exception:
+            self.stats.incr('errors')
+            raise
+        self.set(key, value)
+        return value
+
+    def _revalidate(self, key, loader):
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._flight.do(key, lambda: self._load(key, loader))
+            except Exception:
+                logger.warning('Background refresh failed for %s', key, exc_info=True)
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+                connections.close_all()
+
+        threading.Thread(target=refresh, name=f'{self.name}-refresh', daemon=True).start()
+
+    async def apeek(self, key):
+        entry = await self._alookup(key)
+        return entry.value if entry is not None else None
+
+    # asyncio version of get_or_load(), aloader is a coroutine function
+    async def aget_or_load(self, key, aloader):
+        entry = await self._alookup(key)
+        now = time.time()
+
+        if entry is not None and now < entry.fresh_until:
+            self.stats.incr('hits')
+            return entry.value
+
+        if entry is not None and now < entry.stale_until:
+            self.stats.incr('stale')
+            self._arevalidate(key, aloader)
+            return entry.value
+
+        self.stats.incr('misses')
+        value, shared = await self._aflight.do(key, lambda: self._aload(key, aloader))
+        if shared:
+            self.stats.incr('coalesced')
+        return value
+
+    async def _aload(self, key, aloader):
+        self.stats.incr('loads')
+        try:
+            value = await aloader()
+        except Exception:
+            self.stats.incr('errors')
+            raise
+        await self.aset(key, value)
+        return value
+
+    def _arevalidate(self, key, aloader):
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                await self._aflight.do(key, lambda: self._aload(key, aloader))
+            except Exception:
+                logger.warning('Background refresh failed for %s', key, exc_info=True)
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        # keep a reference so the task is not garbage collected mid-flight
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def info(self):
+        info = self.stats.snapshot()
+        info['size'] = len(self.local)
+        return info
+
+
+# shared forecast cache used by the weather views
+forecast_cache = ForecastCache('forecast')
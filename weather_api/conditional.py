@@ -0,0 +1,57 @@
+import hashlib
+import time
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .cache import LRUCache, forecast_cache
+from .serialization import dumps
+
+# encoded bodies of recently served payloads, see encoded_payload()
+_encoded = LRUCache(1024)
+
+
+def body_etag(body):
+    return '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+# (body, strong ETag) of a payload. Cached payloads are shared, never mutated dicts, so the
+# encoding is memoized per object (and variant) and repeated hits skip serialization; the
+# memo keeps a reference to the object, so its id cannot be reused while it is stored.
+def encoded_payload(data, variant='', transform=None):
+    key = (id(data), variant)
+    memo = _encoded.get(key)
+    if memo is not None and memo[0] is data:
+        return memo[1], memo[2]
+    body = dumps(transform(data) if transform else data)
+    etag = body_etag(body)
+    _encoded.set(key, (data, body, etag))
+    return body, etag
+
+
+# Last-Modified timestamp and Cache-Control value of a forecast cache entry: clients and
+# CDNs may reuse the response while the entry is fresh and serve it stale while we would
+def forecast_cache_headers(cache_key):
+    entry = forecast_cache.entry(cache_key)
+    if entry is None:
+        return None, 'no-cache'
+    config = forecast_cache.config()
+    max_age = max(0, int(entry.fresh_until - time.time()))
+    stale = max(0, int(entry.stale_until - max(entry.fresh_until, time.time())))
+    cache_control = f'public, max-age={max_age}'
+    if stale:
+        cache_control += f', stale-while-revalidate={stale}'
+    return int(entry.fresh_until - config['TTL']), cache_control
+
+
+# 200 with the body, or 304 when the request's If-None-Match/If-Modified-Since still match
+def conditional_json(request, body, etag, last_modified=None, cache_control=None):
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,51 @@
+import json
+from unittest.mock import MagicMock
+
+from .models import Weather
+
+# the daily forecast of every fixture snapshot
+FORECAST = [{'date': '2024-03-01', 'temp_min': 18, 'temp_max': 22, 'description': 'Clear sky'}]
+
+
+# OpenWeatherMap forecast payload of `slots` identical three-hour slots
+def forecast_payload(city='Test City', country='TC', slots=5):
+    return {
+        'city': {'name': city, 'country': country},
+        'list': [
+            {
+                'main': {'temp': 20, 'temp_min': 18, 'temp_max': 22, 'humidity': 50, 'pressure': 1015},
+                'weather': [{'description': 'Clear sky'}],
+                'wind': {'speed': 5},
+                'dt_txt': '2024-03-01 12:00:00'
+            }
+        ] * slots
+    }
+
+
+# stand-in for an OpenWeatherMap response, from requests or httpx
+def forecast_response(city='Test City', country='TC', slots=5, status_code=200):
+    response = MagicMock()
+    response.status_code = status_code
+    response.content = json.dumps(forecast_payload(city, country, slots)).encode()
+    return response
+
+
+# processed forecast as the views hand it to the snapshot writer
+def processed_forecast(city='Test City', temp=20, country='TC'):
+    return {
+        'city': city,
+        'country': country,
+        'current': {'temp_c': temp, 'description': 'Clear sky', 'wind_speed': 5, 'humidity': 50, 'pressure': 1015},
+        'forecast': FORECAST,
+    }
+
+
+# saved snapshot taken at `moment`; other columns can be overridden through `fields`
+def add_snapshot(moment, temperature, city='Test City', country='TC', **fields):
+    fields = dict({
+        'description': 'clear sky', 'humidity': 50, 'wind_speed': 4.0, 'pressure': 1015, 'forecast': FORECAST,
+    }, **fields)
+    weather = Weather.objects.create(city=city, country=country, temperature=temperature, **fields)
+    # timestamp is auto_now_add, move it into place afterwards
+    Weather.objects.filter(pk=weather.pk).update(timestamp=moment)
+    return weather
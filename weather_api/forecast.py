@@ -0,0 +1,137 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+
+# number of local days returned in processed_data['forecast']
+FORECAST_DAYS = 5
+
+# per-day fields, also the column order of the compact forecast
+FORECAST_FIELDS = ('date', 'temp_min', 'temp_max', 'description', 'wind_speed', 'humidity')
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_date_strings = {}
+
+
+# ISO date of a day number counted from the epoch, memoized (there are only a few per forecast)
+def _day_string(day):
+    text = _date_strings.get(day)
+    if text is None:
+        text = _date_strings[day] = date.fromordinal(_EPOCH_ORDINAL + day).isoformat()
+    return text
+
+
+# unix time of a slot: "dt" when OpenWeatherMap sends it, otherwise its UTC "dt_txt"
+def _slot_time(item):
+    dt = item.get('dt')
+    if dt is None:
+        dt = int(datetime.fromisoformat(item['dt_txt']).replace(tzinfo=timezone.utc).timestamp())
+    return dt
+
+
+# one aggregated day of the forecast
+@dataclass(slots=True)
+class ForecastDay:
+    date: str
+    temp_min: float
+    temp_max: float
+    description: str
+    wind_speed: float
+    humidity: int
+
+    def as_dict(self):
+        return {
+            'date': self.date,
+            'temp_min': self.temp_min,
+            'temp_max': self.temp_max,
+            'description': self.description,
+            'wind_speed': self.wind_speed,
+            'humidity': self.humidity,
+        }
+
+
+# one day of the forecast while its slots are being folded in
+class _Day:
+    __slots__ = ('date', 'temp_min', 'temp_max', 'wind_total', 'humidity_total', 'slots', 'descriptions')
+
+    def __init__(self, day, main, wind_speed, description):
+        self.date = day
+        self.temp_min = main['temp_min']
+        self.temp_max = main['temp_max']
+        self.wind_total = wind_speed
+        self.humidity_total = main['humidity']
+        self.slots = 1
+        self.descriptions = {description: 1}
+
+    def add(self, main, wind_speed, description):
+        if main['temp_min'] < self.temp_min:
+            self.temp_min = main['temp_min']
+        if main['temp_max'] > self.temp_max:
+            self.temp_max = main['temp_max']
+        self.wind_total += wind_speed
+        self.humidity_total += main['humidity']
+        self.slots += 1
+        self.descriptions[description] = self.descriptions.get(description, 0) + 1
+
+    def finish(self):
+        return ForecastDay(
+            _day_string(self.date),
+            self.temp_min,
+            self.temp_max,
+            # the most frequent description of the day, the earliest one on a tie
+            max(self.descriptions, key=self.descriptions.get),
+            round(self.wind_total / self.slots, 2),
+            round(self.humidity_total / self.slots),
+        )
+
+
+# daily aggregates of the 3-hour slots (in time order, as OpenWeatherMap sends them),
+# grouped by the city's local date in one pass
+def forecast_days(slots, utc_offset=0, days=FORECAST_DAYS):
+    result = []
+    day = None
+    for item in slots:
+        local_day = (_slot_time(item) + utc_offset) // 86400
+        main = item['main']
+        wind_speed = item['wind']['speed']
+        description = item['weather'][0]['description']
+        if day is not None and day.date == local_day:
+            day.add(main, wind_speed, description)
+            continue
+        if len(result) == days:
+            break
+        day = _Day(local_day, main, wind_speed, description)
+        result.append(day)
+    return [day.finish() for day in result]
+
+
+def daily_forecast(slots, utc_offset=0, days=FORECAST_DAYS):
+    return [day.as_dict() for day in forecast_days(slots, utc_offset, days)]
+
+
+# function to turn the raw OpenWeatherMap forecast into the API response format
+def process_forecast(data, uv=None):
+    city = data['city']
+    slots = data['list']
+    current = slots[0]
+    main = current['main']
+    processed_data = {
+        'city': city['name'],
+        'country': city['country'],
+        'current': {
+            'temp_c': main['temp'],
+            'description': current['weather'][0]['description'],
+            'wind_speed': current['wind']['speed'],
+            'humidity': main['humidity'],
+            'pressure': main['pressure'],
+        },
+        'forecast': daily_forecast(slots, city.get('timezone', 0)),
+    }
+    if uv is not None:
+        processed_data['current']['uv'] = uv
+    return processed_data
+
+
+# processed_data with the forecast as columns ({"date": [...], "temp_min": [...], ...})
+# instead of a list of day objects, for ?compact=1
+def compact_forecast(processed_data):
+    days = processed_data['forecast']
+    return dict(processed_data, forecast={field: [day.get(field) for day in days] for field in FORECAST_FIELDS})
@@ -0,0 +1,152 @@
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+
+# Default gazetteer settings, overridable through settings.WEATHER_GAZETTEER
+DEFAULTS = {
+    'PATH': Path(__file__).resolve().parent / 'data' / 'cities.tsv',
+    'PRELOAD': True,        # load the index when the app starts instead of on first use
+    'STRICT': False,        # reject cities missing from the gazetteer instead of asking OpenWeatherMap
+    'SUGGEST_LIMIT': 10,
+    'SUGGEST_MAX_LIMIT': 50,
+}
+
+City = namedtuple('City', 'name country latitude longitude population')
+
+
+def get_gazetteer_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'WEATHER_GAZETTEER', {}))
+    return config
+
+
+# case, accent and punctuation insensitive form of a name ("São Paulo" -> "sao paulo")
+def normalize_name(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c if c.isalnum() else ' ' for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+
+# split "Paris, FR" into ("Paris", "FR"); anything else is a bare name
+def split_country(query):
+    name, sep, country = query.rpartition(',')
+    country = country.strip()
+    if sep and len(country) == 2 and country.isalpha():
+        return name.strip(), country.upper()
+    return query.strip(), None
+
+
+# cities in parallel arrays plus a sorted array of their normalized names and aliases,
+# so exact and prefix lookups are a binary search without per-city objects or dicts
+class CityIndex:
+    def __init__(self, rows):
+        self.names = []
+        self.countries = []
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.populations = array('q')
+
+        entries = []
+        for name, country, latitude, longitude, population, aliases in rows:
+            city_id = len(self.names)
+            self.names.append(name)
+            self.countries.append(country)
+            self.latitudes.append(latitude)
+            self.longitudes.append(longitude)
+            self.populations.append(population)
+            keys = {normalize_name(name)} | {normalize_name(alias) for alias in aliases}
+            entries.extend((key, city_id) for key in keys if key)
+
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.key_ids = array('i', (city_id for _, city_id in entries))
+
+    @classmethod
+    def from_file(cls, path):
+        rows = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                name, country, latitude, longitude, population = fields[:5]
+                aliases = [alias for alias in (fields[5] if len(fields) > 5 else '').split('|') if alias]
+                rows.append((name, country, float(latitude), float(longitude), int(population), aliases))
+        return cls(rows)
+
+    def city(self, city_id):
+        return City(
+            self.names[city_id], self.countries[city_id],
+            self.latitudes[city_id], self.longitudes[city_id], self.populations[city_id],
+        )
+
+    # ids of the cities with a name or alias starting with the normalized prefix (or equal to it)
+    def _ids(self, key, exact=False, scan_limit=None):
+        ids = []
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i].startswith(key):
+            if exact and self.keys[i] != key:
+                break
+            if self.key_ids[i] not in ids:
+                ids.append(self.key_ids[i])
+            if scan_limit and len(ids) >= scan_limit:
+                break
+            i += 1
+        return ids
+
+    def __len__(self):
+        return len(self.names)
+
+    # the most populous city matching "Name" or "Name, CC" exactly (aliases included), or None
+    def resolve(self, query):
+        name, country = split_country(query)
+        key = normalize_name(name)
+        if not key:
+            return None
+        ids = [i for i in self._ids(key, exact=True) if country is None or self.countries[i] == country]
+        if not ids:
+            return None
+        return self.city(max(ids, key=lambda i: self.populations[i]))
+
+    # cities whose name or alias starts with prefix, exact matches first, then by population
+    def suggest(self, prefix, limit=10):
+        key = normalize_name(prefix)
+        if not key:
+            return []
+        exact = set(self._ids(key, exact=True))
+        ids = self._ids(key, scan_limit=1000)
+        ids.sort(key=lambda i: (i not in exact, -self.populations[i]))
+        return [self.city(i) for i in ids[:limit]]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_city_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = CityIndex.from_file(get_gazetteer_settings()['PATH'])
+    return _index
+
+
+# the city query sent to OpenWeatherMap and used for cache keys: "Name,CC" for cities in
+# the gazetteer so every spelling and alias shares one key, otherwise the trimmed query.
+# Raises ValueError for queries that cannot be a city name (or unknown cities in STRICT mode).
+def canonical_city(query):
+    query = ' '.join(str(query).split())
+    city = get_city_index().resolve(query)
+    if city is not None:
+        return f'{city.name},{city.country}'
+    if not any(c.isalpha() for c in query) or len(query) > 100:
+        raise ValueError('City must be a place name.')
+    if get_gazetteer_settings()['STRICT']:
+        raise ValueError('Unknown city.')
+    return query
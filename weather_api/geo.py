@@ -0,0 +1,104 @@
+import math
+import threading
+from collections import OrderedDict
+
+from .cache import get_cache_settings, round_coordinates
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+
+
+# great-circle distance between two points in kilometers
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# uniform lat/lon grid over the most recently fetched points, with cells as wide as the
+# search radius so a nearest lookup only scans the neighbouring cells
+class PointIndex:
+    def __init__(self, radius_km, max_points):
+        self.radius_km = radius_km
+        self.max_points = max_points
+        self.cell_degrees = radius_km / KM_PER_DEGREE
+        self.lon_cells = max(1, math.ceil(360 / self.cell_degrees))
+        self._points = OrderedDict()
+        self._cells = {}
+        self._lock = threading.Lock()
+
+    def _cell(self, latitude, longitude):
+        return (
+            math.floor((latitude + 90) / self.cell_degrees),
+            math.floor((longitude + 180) / self.cell_degrees) % self.lon_cells,
+        )
+
+    def add(self, latitude, longitude):
+        point = (latitude, longitude)
+        with self._lock:
+            if point in self._points:
+                self._points.move_to_end(point)
+                return
+            self._points[point] = self._cell(latitude, longitude)
+            self._cells.setdefault(self._points[point], set()).add(point)
+            while len(self._points) > self.max_points:
+                old, cell = self._points.popitem(last=False)
+                self._cells[cell].discard(old)
+                if not self._cells[cell]:
+                    del self._cells[cell]
+
+    # closest indexed point within radius_km, or None
+    def nearest(self, latitude, longitude):
+        row, column = self._cell(latitude, longitude)
+        # a degree of longitude shrinks towards the poles, widen the scan to match
+        cos_lat = math.cos(math.radians(min(89.9, abs(latitude) + self.cell_degrees)))
+        span = min(self.lon_cells, math.ceil(1 / cos_lat))
+
+        best, best_distance = None, self.radius_km
+        with self._lock:
+            for r in (row - 1, row, row + 1):
+                for c in range(column - span, column + span + 1):
+                    for point in self._cells.get((r, c % self.lon_cells), ()):
+                        distance = haversine_km(latitude, longitude, *point)
+                        if distance <= best_distance:
+                            best, best_distance = point, distance
+            if best is not None:
+                self._points.move_to_end(best)
+        return best
+
+    def clear(self):
+        with self._lock:
+            self._points.clear()
+            self._cells.clear()
+
+    def __len__(self):
+        return len(self._points)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_point_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                config = get_cache_settings()
+                _index = PointIndex(config['NEAREST_KM'], config['MAX_ENTRIES'])
+    return _index
+
+
+# validated coordinates on the cache grid, moved onto the nearest recently fetched point
+# within NEAREST_KM so nearby users share one cached forecast; raises ValueError
+def snap_coordinates(latitude, longitude):
+    latitude, longitude = round_coordinates(latitude, longitude)
+    if get_cache_settings()['NEAREST_KM'] <= 0:
+        return latitude, longitude
+    return get_point_index().nearest(latitude, longitude) or (latitude, longitude)
+
+
+# remember a fetched point for snap_coordinates()
+def index_point(latitude, longitude):
+    if get_cache_settings()['NEAREST_KM'] > 0:
+        get_point_index().add(latitude, longitude)
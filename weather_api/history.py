@@ -0,0 +1,208 @@
+import base64
+from datetime import datetime, time, timedelta, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Min, Q
+from django.db.models.functions import Trunc
+from django.utils.dateparse import parse_date, parse_datetime
+from .gazetteer import get_city_index, split_country
+from .models import Weather
+from .serialization import dumps
+
+# Default history settings, overridable through settings.WEATHER_HISTORY
+DEFAULTS = {
+    'DEFAULT_DAYS': 7,          # range when no start is given
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 5000,
+    'STREAM_CHUNK_SIZE': 2000,  # rows fetched per database round trip when streaming
+}
+
+# resolution -> (Trunc kind, bucket width); 'raw' returns the snapshots themselves
+RESOLUTIONS = {
+    'raw': (None, None),
+    'hour': ('hour', timedelta(hours=1)),
+    'day': ('day', timedelta(days=1)),
+}
+
+# snapshot columns of a raw history row, the forecast JSON is left in the database
+RAW_FIELDS = ('timestamp', 'temperature', 'description', 'humidity', 'wind_speed', 'pressure')
+
+
+def get_history_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'WEATHER_HISTORY', {}))
+    return config
+
+
+# (city, country) as the snapshots store them: the gazetteer name for known cities,
+# otherwise the query itself with the country of a "Name, CC" query
+def history_city(query, country=None):
+    query = ' '.join(str(query).split())
+    city = get_city_index().resolve(f'{query},{country}' if country else query)
+    if city is not None:
+        return city.name, city.country
+    name, query_country = split_country(query)
+    return name, (country or query_country or None)
+
+
+# aware UTC datetime from an ISO 8601 date or datetime; a bare end date covers that whole day.
+# Raises ValueError
+def parse_time(value, end=False):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is not None:
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+# opaque "next page" token holding the sort key of the last row
+def encode_cursor(timestamp, row_id=None):
+    value = timestamp.isoformat() if row_id is None else f'{timestamp.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+# (timestamp, id or None) of a cursor, raises ValueError for anything we did not issue
+def decode_cursor(cursor):
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, _, row_id = value.partition('|')
+        timestamp = datetime.fromisoformat(timestamp)
+        row_id = int(row_id) if row_id else None
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor.')
+    if timestamp.tzinfo is None:
+        raise ValueError('Invalid cursor.')
+    return timestamp, row_id
+
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+def raw_row(row):
+    row['timestamp'] = row['timestamp'].isoformat()
+    return row
+
+
+def bucket_row(row):
+    return {
+        'timestamp': row['bucket'].isoformat(),
+        'samples': row['samples'],
+        'temp_min': row['temp_min'],
+        'temp_max': row['temp_max'],
+        'temp_avg': _round(row['temp_avg']),
+        'humidity_avg': _round(row['humidity_avg']),
+        'wind_speed_avg': _round(row['wind_speed_avg']),
+        'pressure_avg': _round(row['pressure_avg']),
+    }
+
+
+# one history query: the snapshots of a city between start (inclusive) and end (exclusive),
+# raw or downsampled, read in (timestamp, id) order from the (city, country, timestamp) index
+class HistoryQuery:
+    def __init__(self, city, country, start, end, resolution='raw'):
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}.")
+        self.city = city
+        self.country = country
+        self.start = start
+        self.end = end
+        self.resolution = resolution
+        self.kind, self.step = RESOLUTIONS[resolution]
+
+    def snapshots(self):
+        rows = Weather.objects.filter(city=self.city, timestamp__gte=self.start, timestamp__lt=self.end)
+        if self.country:
+            rows = rows.filter(country=self.country)
+        return rows
+
+    # rows after the cursor: keyset on (timestamp, id) for raw rows, on the bucket start otherwise.
+    # The timestamp__gte bound keeps the OR inside one index range scan.
+    def queryset(self, cursor=None):
+        rows = self.snapshots()
+        if self.kind is None:
+            if cursor is not None:
+                timestamp, row_id = cursor
+                rows = rows.filter(timestamp__gte=timestamp).filter(
+                    Q(timestamp__gt=timestamp) | Q(id__gt=row_id or 0)
+                )
+            return rows.order_by('timestamp', 'id').values('id', *RAW_FIELDS)
+
+        if cursor is not None:
+            rows = rows.filter(timestamp__gte=cursor[0] + self.step)
+        # min/max/avg per bucket are computed by the database, only one row per bucket comes back
+        return rows.annotate(
+            bucket=Trunc('timestamp', self.kind, tzinfo=timezone.utc),
+        ).values('bucket').annotate(
+            samples=Count('id'),
+            temp_min=Min('temperature'),
+            temp_max=Max('temperature'),
+            temp_avg=Avg('temperature'),
+            humidity_avg=Avg('humidity'),
+            wind_speed_avg=Avg('wind_speed'),
+            pressure_avg=Avg('pressure'),
+        ).order_by('bucket')
+
+    def format(self, row):
+        if self.kind is None:
+            row.pop('id')
+            return raw_row(row)
+        return bucket_row(row)
+
+    def cursor_of(self, row):
+        if self.kind is None:
+            return encode_cursor(row['timestamp'], row['id'])
+        return encode_cursor(row['bucket'])
+
+    def meta(self):
+        return {
+            'city': self.city,
+            'country': self.country,
+            'resolution': self.resolution,
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+        }
+
+    # one page of `limit` rows plus the cursor of the next page (None on the last one)
+    def page(self, limit, cursor=None):
+        rows = list(self.queryset(cursor)[:limit + 1])
+        next_cursor = self.cursor_of(rows[limit - 1]) if len(rows) > limit else None
+        return dict(self.meta(), results=[self.format(row) for row in rows[:limit]], next=next_cursor)
+
+    # the whole range as chunks of JSON bytes: rows are read with a server-side iterator and
+    # encoded as they arrive instead of being collected into one list
+    def stream(self, cursor=None, chunk_size=None):
+        chunk_size = chunk_size or get_history_settings()['STREAM_CHUNK_SIZE']
+        yield dumps(self.meta())[:-1] + b',"results":['
+        encoded = []
+        separator = b''
+        for row in self.queryset(cursor).iterator(chunk_size=chunk_size):
+            encoded.append(dumps(self.format(row)))
+            # a few hundred rows per chunk keeps gzip effective and the write count low
+            if len(encoded) == 256:
+                yield separator + b','.join(encoded)
+                encoded, separator = [], b','
+        if encoded:
+            yield separator + b','.join(encoded)
+        yield b'],"next":null}'
+
+    # the same chunks as an async iterator for ASGI servers, which would otherwise collect
+    # a sync iterator into a list before sending anything; each chunk is read in the thread
+    # sync views run in, so the server-side cursor stays on its connection
+    async def astream(self, cursor=None, chunk_size=None):
+        chunks = self.stream(cursor, chunk_size)
+        next_chunk = sync_to_async(next)
+        try:
+            while (chunk := await next_chunk(chunks, None)) is not None:
+                yield chunk
+        finally:
+            await sync_to_async(chunks.close)()
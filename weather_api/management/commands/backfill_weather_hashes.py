@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from weather_api.models import Weather
+from weather_api.services import weather_hash
+
+
+# fills Weather.content_hash for rows saved before change detection used hashes
+class Command(BaseCommand):
+    help = 'Compute content_hash for existing Weather rows, in batches ordered by id.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help='Recompute hashes of rows that already have one.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Weather.objects.order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(content_hash='')
+
+        # keyset pagination on id so every batch is an indexed range scan
+        last_id = 0
+        updated = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not rows:
+                break
+            for weather in rows:
+                weather.content_hash = weather_hash(weather)
+            Weather.objects.bulk_update(rows, ['content_hash'])
+            updated += len(rows)
+            last_id = rows[-1].id
+            self.stdout.write(f'Backfilled {updated} rows (last id {last_id})')
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {updated} rows updated.'))
@@ -0,0 +1,40 @@
+import gzip
+
+from django.core.management.base import BaseCommand
+from weather_api.retention import get_retention_settings, purge_snapshots, retention_cutoff, rollup_snapshots
+
+
+# keeps the Weather table bounded: run it daily, e.g. from cron
+class Command(BaseCommand):
+    help = ('Roll Weather snapshots older than the retention window up into daily summaries, '
+            'then delete them in batches.')
+
+    def add_arguments(self, parser):
+        config = get_retention_settings()
+        parser.add_argument('--days', type=int, default=config['DAYS'], help='Full days of raw snapshots to keep.')
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'])
+        parser.add_argument('--pause', type=float, default=config['PAUSE'], help='Seconds to wait between delete batches.')
+        parser.add_argument('--archive', help='Append the deleted rows to this JSON Lines file (gzipped when it ends in .gz).')
+        parser.add_argument('--rollup-only', action='store_true', help='Write the daily summaries without deleting anything.')
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options['days'])
+        self.stdout.write(f'Rolling up snapshots before {cutoff.isoformat()}')
+        aggregated = rollup_snapshots(cutoff)
+        self.stdout.write(f'Summarized {aggregated} city days')
+        if options['rollup_only']:
+            return
+
+        archive = None
+        if options['archive']:
+            opener = gzip.open if options['archive'].endswith('.gz') else open
+            archive = opener(options['archive'], 'ab')
+        try:
+            deleted = purge_snapshots(
+                cutoff, options['batch_size'], archive=archive, pause=options['pause'],
+                progress=lambda count: self.stdout.write(f'Deleted {count} rows'),
+            )
+        finally:
+            if archive is not None:
+                archive.close()
+        self.stdout.write(self.style.SUCCESS(f'Done, {deleted} rows deleted.'))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from weather_api.views import GetWeatherByCoordinates, WeatherView
+from weather_api.persistence import snapshot_writer
+from weather_api.warming import CacheWarmer, get_warming_settings
+
+
+# keeps the most requested forecasts warm, run it next to the web workers
+class Command(BaseCommand):
+    help = 'Refresh the most requested cities/coordinates in the forecast cache before they expire.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single warming round and exit.')
+
+    def handle(self, *args, **options):
+        # the same fetch, process and persist path as the weather views
+        warmer = CacheWarmer(WeatherView().fetch_weather, GetWeatherByCoordinates().fetch_weather)
+        try:
+            while True:
+                started = time.monotonic()
+                result = warmer.warm()
+                self.stdout.write(
+                    f"Checked {result['checked']}, refreshed {result['refreshed']}, "
+                    f"skipped {result['skipped']}, errors {result['errors']}"
+                )
+                if options['once']:
+                    break
+                time.sleep(max(0.0, get_warming_settings()['INTERVAL'] - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            snapshot_writer.close()
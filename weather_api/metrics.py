@@ -0,0 +1,219 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Default instrumentation settings, overridable through settings.WEATHER_METRICS
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,   # clients may ask for a Server-Timing header with "X-Server-Timing: 1"
+}
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (stage, seconds) spans of the request being served, None outside of TimingMiddleware
+_timings = ContextVar('weather_timings', default=None)
+
+
+def get_metrics_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'WEATHER_METRICS', {}))
+    return config
+
+
+# fixed-bucket latency histogram; quantiles are interpolated within a bucket like
+# Prometheus' histogram_quantile()
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    # (cumulative bucket counts, sum, count) read under one lock
+    def snapshot(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative, total, count
+
+    def quantile(self, q, snapshot=None):
+        cumulative, _, count = snapshot or self.snapshot()
+        if not count:
+            return 0.0
+        rank = q * count
+        for i, running in enumerate(cumulative):
+            if running >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                previous = cumulative[i - 1] if i else 0
+                in_bucket = running - previous
+                return lower + (self.buckets[i] - lower) * ((rank - previous) / in_bucket if in_bucket else 1.0)
+        return self.buckets[-1]
+
+
+# histograms per metric name and label values
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    # {name: [(labels, histogram), ...]}
+    def families(self):
+        with self._lock:
+            items = sorted(self._histograms.items())
+        families = {}
+        for (name, labels), histogram in items:
+            families.setdefault(name, []).append((dict(labels), histogram))
+        return families
+
+    # p50/p95/p99 in milliseconds per metric and label set, for the JSON view
+    def percentiles(self):
+        result = {}
+        for name, series in self.families().items():
+            rows = result[name] = []
+            for labels, histogram in series:
+                snapshot = histogram.snapshot()
+                row = dict(labels, count=snapshot[2])
+                for q in (0.5, 0.95, 0.99):
+                    row[f'p{int(q * 100)}'] = round(histogram.quantile(q, snapshot) * 1000, 2)
+                rows.append(row)
+        return result
+
+
+registry = MetricsRegistry()
+
+
+# time a stage of the request ("upstream.openweathermap", "serialize", ...): the duration
+# goes to the stage histogram and, inside a request, to its Server-Timing header
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe('weather_stage_duration_seconds', elapsed, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+# Prometheus text exposition of one metric family, samples are (labels, value) pairs
+def prometheus_family(name, kind, help_text, samples):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    lines.extend(f'{name}{_labels(labels)} {value}' for labels, value in samples)
+    return '\n'.join(lines)
+
+
+# every histogram of the registry in the Prometheus text format
+def prometheus_histograms(help_texts=None):
+    chunks = []
+    for name, series in registry.families().items():
+        lines = [f'# HELP {name} {(help_texts or {}).get(name, name)}', f'# TYPE {name} histogram']
+        for labels, histogram in series:
+            cumulative, total, count = histogram.snapshot()
+            for bound, running in zip(histogram.buckets + ('+Inf',), cumulative):
+                lines.append(f'{name}_bucket{_labels(dict(labels, le=bound))} {running}')
+            lines.append(f'{name}_sum{_labels(labels)} {total}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        chunks.append('\n'.join(lines))
+    return chunks
+
+
+# "stage;dur=12.3, ..." in milliseconds, spans of the same stage added together
+def server_timing(timings, total):
+    durations = {}
+    for name, elapsed in timings:
+        durations[name] = durations.get(name, 0.0) + elapsed
+    durations['total'] = total
+    return ', '.join(f'{name};dur={elapsed * 1000:.1f}' for name, elapsed in durations.items())
+
+
+# times every request by endpoint, method and status, and adds the Server-Timing header
+# for clients that send "X-Server-Timing: 1". Streaming responses are timed until their
+# first byte is ready, not until the stream ends.
+class TimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def finish(self, request, response, start, timings, token):
+        elapsed = time.perf_counter() - start
+        _timings.reset(token)
+        match = getattr(request, 'resolver_match', None)
+        registry.observe(
+            'weather_request_duration_seconds', elapsed,
+            endpoint=match.url_name if match is not None and match.url_name else 'unmatched',
+            method=request.method,
+            status=f'{response.status_code // 100}xx',
+        )
+        if request.headers.get('X-Server-Timing') == '1' and get_metrics_settings()['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(timings, elapsed)
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not get_metrics_settings()['ENABLED']:
+            return self.get_response(request)
+        timings = []
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        return self.finish(request, response, start, timings, token)
+
+    async def __acall__(self, request):
+        if not get_metrics_settings()['ENABLED']:
+            return await self.get_response(request)
+        timings = []
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        return self.finish(request, response, start, timings, token)
@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-17 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Weather',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100)),
+                ('country', models.CharField(max_length=100)),
+                ('temperature', models.FloatField()),
+                ('description', models.CharField(max_length=200)),
+                ('humidity', models.IntegerField()),
+                ('wind_speed', models.FloatField()),
+                ('pressure', models.FloatField()),
+                ('forecast', models.JSONField()),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1 on 2026-10-17 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weather',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='weather',
+            index=models.Index(fields=['city', 'country', 'timestamp'], name='weather_city_country_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-17 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_api', '0002_weather_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherDailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100)),
+                ('country', models.CharField(max_length=100)),
+                ('date', models.DateField()),
+                ('samples', models.IntegerField()),
+                ('temp_min', models.FloatField()),
+                ('temp_max', models.FloatField()),
+                ('temp_avg', models.FloatField()),
+                ('humidity_min', models.IntegerField()),
+                ('humidity_max', models.IntegerField()),
+                ('humidity_avg', models.FloatField()),
+                ('wind_speed_min', models.FloatField()),
+                ('wind_speed_max', models.FloatField()),
+                ('wind_speed_avg', models.FloatField()),
+                ('pressure_min', models.FloatField()),
+                ('pressure_max', models.FloatField()),
+                ('pressure_avg', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='weather',
+            index=models.Index(fields=['timestamp'], name='weather_ts_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='weatherdailysummary',
+            constraint=models.UniqueConstraint(fields=('city', 'country', 'date'), name='weather_daily_city_country_date_uniq'),
+        ),
+    ]
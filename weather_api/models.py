@@ -10,6 +10,45 @@ class Weather(models.Model):
     pressure = models.FloatField()
     forecast = models.JSONField() 
     timestamp = models.DateTimeField(auto_now_add=True)
+    # sha256 of the canonical snapshot (see services.snapshot_hash), used for change detection
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # latest snapshot of a city: filter on (city, country), order by timestamp
+            models.Index(fields=['city', 'country', 'timestamp'], name='weather_city_country_ts_idx'),
+            # retention: snapshots older than a cutoff across all cities
+            models.Index(fields=['timestamp'], name='weather_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.city}, {self.country}"
+
+
+# one UTC day of a city's snapshots, kept after the raw rows pass the retention window
+# (see retention.py and the rollup_weather_history command)
+class WeatherDailySummary(models.Model):
+    city = models.CharField(max_length=100)
+    country = models.CharField(max_length=100)
+    date = models.DateField()
+    samples = models.IntegerField()
+    temp_min = models.FloatField()
+    temp_max = models.FloatField()
+    temp_avg = models.FloatField()
+    humidity_min = models.IntegerField()
+    humidity_max = models.IntegerField()
+    humidity_avg = models.FloatField()
+    wind_speed_min = models.FloatField()
+    wind_speed_max = models.FloatField()
+    wind_speed_avg = models.FloatField()
+    pressure_min = models.FloatField()
+    pressure_max = models.FloatField()
+    pressure_avg = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['city', 'country', 'date'], name='weather_daily_city_country_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.city}, {self.country} {self.date}"
@@ -0,0 +1,246 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from .cache import LRUCache
+from .services import asave_snapshot, save_snapshot, save_snapshots, snapshot_hash
+
+logger = logging.getLogger(__name__)
+
+# Default write-behind settings, overridable through settings.WEATHER_PERSISTENCE
+DEFAULTS = {
+    'WRITE_BEHIND': True,      # False saves snapshots synchronously in the request thread
+    'QUEUE_SIZE': 1000,        # bounded queue between request threads and the flusher
+    'BATCH_SIZE': 100,         # flush once this many snapshots are waiting...
+    'FLUSH_INTERVAL': 2.0,     # ...or after this many seconds
+    'ENQUEUE_TIMEOUT': 0.05,   # seconds a request waits for room before writing itself
+    'DEDUPE_CITIES': 4096,     # cities whose last written snapshot hash is remembered in memory
+}
+
+_STOP = object()
+
+
+def get_persistence_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'WEATHER_PERSISTENCE', {}))
+    return config
+
+
+# write-behind stage: request threads enqueue processed forecasts and a background
+# flusher drops consecutive duplicates per city and saves the rest with bulk_create
+class SnapshotWriter:
+    def __init__(self, background=True):
+        self.background = background
+        self._queue = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_written = None
+        self._pending = 0
+        self._metrics_lock = threading.Lock()
+        self._counts = dict.fromkeys(('enqueued', 'written', 'deduped', 'overflow', 'flushes', 'errors'), 0)
+        self._flush_times = {'last': 0.0, 'max': 0.0, 'total': 0.0}
+
+    def _incr(self, field, amount=1):
+        with self._metrics_lock:
+            self._counts[field] += amount
+
+    @property
+    def queue(self):
+        if self._queue is None:
+            with self._start_lock:
+                if self._queue is None:
+                    config = get_persistence_settings()
+                    self._queue = queue.Queue(maxsize=config['QUEUE_SIZE'])
+                    self._last_written = LRUCache(config['DEDUPE_CITIES'])
+        return self._queue
+
+    def _ensure_started(self):
+        if not self.background or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='weather-snapshot-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    # put one snapshot on the queue without blocking longer than `timeout`, False when full
+    def _offer(self, processed_data, timeout):
+        try:
+            if timeout:
+                self.queue.put(processed_data, timeout=timeout)
+            else:
+                self.queue.put_nowait(processed_data)
+        except queue.Full:
+            self._incr('overflow')
+            return False
+        with self._metrics_lock:
+            self._counts['enqueued'] += 1
+            self._pending += 1
+        self._ensure_started()
+        return True
+
+    # queue a processed forecast for saving; when the queue is full the caller writes
+    # it synchronously, so a slow database slows requests down instead of losing data
+    def enqueue(self, processed_data):
+        config = get_persistence_settings()
+        if not config['WRITE_BEHIND'] or not self._offer(processed_data, config['ENQUEUE_TIMEOUT']):
+            save_snapshot(processed_data)
+
+    def enqueue_many(self, processed_list):
+        config = get_persistence_settings()
+        if not config['WRITE_BEHIND']:
+            save_snapshots(processed_list)
+            return
+        overflow = [item for item in processed_list if not self._offer(item, config['ENQUEUE_TIMEOUT'])]
+        if overflow:
+            save_snapshots(overflow)
+
+    # async views never block the event loop on the queue, overflow uses the async ORM
+    async def aenqueue(self, processed_data):
+        config = get_persistence_settings()
+        if not config['WRITE_BEHIND'] or not self._offer(processed_data, 0):
+            await asave_snapshot(processed_data)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                close_old_connections()
+                self._write(batch)
+
+    # wait for up to BATCH_SIZE snapshots or FLUSH_INTERVAL seconds, whichever comes first
+    def _collect(self):
+        config = get_persistence_settings()
+        deadline = time.monotonic() + config['FLUSH_INTERVAL']
+        batch = []
+        while len(batch) < config['BATCH_SIZE']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._stop.set()
+                break
+            batch.append(item)
+        return batch
+
+    # drop snapshots identical to the last one written for their city and country (Paris FR
+    # and Paris US are tracked apart), then bulk insert
+    def _write(self, batch):
+        try:
+            self._save(batch)
+        finally:
+            with self._metrics_lock:
+                self._pending -= len(batch)
+
+    def _save(self, batch):
+        start = time.perf_counter()
+        with self._write_lock:
+            fresh = []
+            for processed_data in batch:
+                content_hash = snapshot_hash(processed_data)
+                location = (processed_data['city'], processed_data['country'])
+                if self._last_written.get(location) == content_hash:
+                    self._incr('deduped')
+                    continue
+                self._last_written.set(location, content_hash)
+                fresh.append(processed_data)
+            try:
+                written = len(save_snapshots(fresh))
+            except Exception:
+                self._incr('errors')
+                # forget what was (not) written so the next fetch of these cities is retried
+                for processed_data in fresh:
+                    self._last_written.delete((processed_data['city'], processed_data['country']))
+                logger.exception('Failed to save %d weather snapshots', len(fresh))
+                return
+        elapsed = time.perf_counter() - start
+        with self._metrics_lock:
+            self._counts['written'] += written
+            self._counts['deduped'] += len(fresh) - written
+            self._counts['flushes'] += 1
+            self._flush_times['last'] = elapsed
+            self._flush_times['max'] = max(self._flush_times['max'], elapsed)
+            self._flush_times['total'] += elapsed
+
+    # snapshots accepted by enqueue() and not written (or dropped) yet, queued or in a flush
+    @property
+    def pending(self):
+        with self._metrics_lock:
+            return self._pending
+
+    # drain everything queued so far in the calling thread
+    def flush(self):
+        batch = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            self._write(batch)
+
+    # stop the flusher and write whatever is left (registered with atexit)
+    def close(self, timeout=5):
+        if self._thread is not None and self._thread.is_alive():
+            self._stop.set()
+            try:
+                self.queue.put_nowait(_STOP)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+        self.flush()
+
+    def info(self):
+        with self._metrics_lock:
+            info = dict(self._counts)
+            flushes = info['flushes']
+            info['flush_ms'] = {
+                'last': round(self._flush_times['last'] * 1000, 2),
+                'max': round(self._flush_times['max'] * 1000, 2),
+                'avg': round(self._flush_times['total'] * 1000 / flushes, 2) if flushes else 0.0,
+            }
+        info['write_behind'] = get_persistence_settings()['WRITE_BEHIND']
+        info['queue_depth'] = self.queue.qsize()
+        info['queue_size'] = self.queue.maxsize
+        return info
+
+
+# collects the forecasts fetched during a batch request so they are saved in one bulk
+# operation; loads finishing after flush() (background refreshes) are queued individually
+class SnapshotBatch:
+    def __init__(self, writer=None):
+        self.writer = writer or snapshot_writer
+        self._lock = threading.Lock()
+        self._pending = []
+        self._open = True
+
+    def add(self, processed_data):
+        with self._lock:
+            if self._open:
+                self._pending.append(processed_data)
+                return
+        self.writer.enqueue(processed_data)
+
+    def flush(self):
+        with self._lock:
+            self._open = False
+            pending, self._pending = self._pending, []
+        if pending:
+            self.writer.enqueue_many(pending)
+
+
+# shared writer used by the weather views
+snapshot_writer = SnapshotWriter()
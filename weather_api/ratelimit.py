@@ -0,0 +1,319 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+# Default rate limit and quota settings, overridable through settings.WEATHER_RATE_LIMITS
+DEFAULTS = {
+    'ENABLED': True,
+    'BACKEND': None,               # cache alias shared by all workers; None keeps the counters in each process
+    'KEY_PREFIX': 'weather:ratelimit',
+    'MAX_CLIENTS': 10000,          # in-process buckets kept, least recently seen clients are dropped first
+    'TRUST_X_FORWARDED_FOR': False,  # identify clients by the first X-Forwarded-For address (behind a proxy)
+    'API_KEY_HEADER': 'HTTP_X_API_KEY',
+    'API_KEYS': [],                # known keys get their own bucket with the limits multiplied
+    'API_KEY_MULTIPLIER': 5,
+    # URL name -> (requests per minute, burst); routes without a rule are not limited
+    'RULES': {
+        'weather_by_city': (60, 20),
+        'weather_by_coordinates': (60, 20),
+        'weather_batch': (10, 5),
+        'weather_history': (30, 10),
+        'generate_weather_summary': (10, 3),
+        'city_suggest': (300, 60),
+    },
+    # upstream provider -> calls allowed per minute and per day (None for no limit)
+    'BUDGETS': {
+        'openweathermap': {'PER_MINUTE': 60, 'PER_DAY': 30000},
+        'gemini': {'PER_MINUTE': 15, 'PER_DAY': 1500},
+    },
+    'LOW_WATER': 0.1,              # below this share of a budget left, serve cached forecasts of any age
+}
+
+BUDGET_WINDOWS = (('PER_MINUTE', 60), ('PER_DAY', 86400))
+
+
+def get_ratelimit_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'WEATHER_RATE_LIMITS', {}))
+    return config
+
+
+# token buckets in this process: `rate` tokens per minute up to `burst`, one per request
+class TokenBuckets:
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    # (allowed, seconds until the next token)
+    def take(self, key, rate, burst, now=None):
+        now = time.monotonic() if now is None else now
+        per_second = rate / 60.0
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / per_second
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# fixed window counters in this process
+class LocalWindows:
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    # count in the current window after adding `amount`, and seconds until the window ends
+    def hit(self, key, window, amount=1, now=None):
+        now = time.time() if now is None else now
+        slot = (key, window, int(now // window))
+        with self._lock:
+            count = self._counts.pop(slot, 0) + amount
+            self._counts[slot] = count
+            while len(self._counts) > self.max_keys:
+                self._counts.popitem(last=False)
+        return count, window - now % window
+
+    def count(self, key, window, now=None):
+        return self.hit(key, window, 0, now)[0]
+
+    # in memory, so the async versions never wait
+    async def ahit(self, key, window, amount=1, now=None):
+        return self.hit(key, window, amount, now)
+
+    async def acount(self, key, window, now=None):
+        return self.count(key, window, now)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+# fixed window counters in a shared cache (add + incr, atomic on Redis and Memcached)
+class CacheWindows:
+    def __init__(self, alias, prefix):
+        self.alias = alias
+        self.prefix = prefix
+
+    def _key(self, key, window, now):
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return f'{self.prefix}:{digest}:{window}:{int(now // window)}'
+
+    def hit(self, key, window, amount=1, now=None):
+        now = time.time() if now is None else now
+        cache, cache_key = caches[self.alias], self._key(key, window, now)
+        cache.add(cache_key, 0, timeout=window + 1)
+        try:
+            count = cache.incr(cache_key, amount) if amount else cache.get(cache_key, 0)
+        except ValueError:
+            # expired between add and incr
+            cache.set(cache_key, amount, timeout=window + 1)
+            count = amount
+        return count, window - now % window
+
+    async def ahit(self, key, window, amount=1, now=None):
+        now = time.time() if now is None else now
+        cache, cache_key = caches[self.alias], self._key(key, window, now)
+        await cache.aadd(cache_key, 0, timeout=window + 1)
+        try:
+            count = await cache.aincr(cache_key, amount) if amount else await cache.aget(cache_key, 0)
+        except ValueError:
+            await cache.aset(cache_key, amount, timeout=window + 1)
+            count = amount
+        return count, window - now % window
+
+    def count(self, key, window, now=None):
+        return self.hit(key, window, 0, now)[0]
+
+    async def acount(self, key, window, now=None):
+        return (await self.ahit(key, window, 0, now))[0]
+
+    def clear(self):
+        pass
+
+
+_local_windows = LocalWindows(100000)
+
+
+def window_store(config):
+    if config['BACKEND']:
+        return CacheWindows(config['BACKEND'], config['KEY_PREFIX'])
+    return _local_windows
+
+
+# per-minute and per-day call budget of one upstream provider, shared by all workers when
+# a BACKEND is configured
+class UpstreamBudget:
+    def __init__(self, name):
+        self.name = name
+
+    # (name, limit, window seconds) of the configured budgets
+    def limits(self, config):
+        budget = config['BUDGETS'].get(self.name) or {}
+        return [(field.lower(), budget[field], window) for field, window in BUDGET_WINDOWS if budget.get(field)]
+
+    # count one call, False when a budget is already spent (the call must not be made)
+    def spend(self):
+        config = get_ratelimit_settings()
+        if not config['ENABLED']:
+            return True
+        store = window_store(config)
+        for _, limit, window in self.limits(config):
+            if store.hit(f'budget:{self.name}', window)[0] > limit:
+                return False
+        return True
+
+    # spend() for async callers, a shared BACKEND is reached without blocking the event loop
+    async def aspend(self):
+        config = get_ratelimit_settings()
+        if not config['ENABLED']:
+            return True
+        store = window_store(config)
+        for _, limit, window in self.limits(config):
+            if (await store.ahit(f'budget:{self.name}', window))[0] > limit:
+                return False
+        return True
+
+    # smallest share of a budget left, 1.0 without limits
+    def remaining(self):
+        config = get_ratelimit_settings()
+        if not config['ENABLED']:
+            return 1.0
+        store = window_store(config)
+        shares = [1 - store.count(f'budget:{self.name}', window) / limit for _, limit, window in self.limits(config)]
+        return max(0.0, min(shares, default=1.0))
+
+    async def aremaining(self):
+        config = get_ratelimit_settings()
+        if not config['ENABLED']:
+            return 1.0
+        store = window_store(config)
+        shares = [1 - await store.acount(f'budget:{self.name}', window) / limit for _, limit, window in self.limits(config)]
+        return max(0.0, min(shares, default=1.0))
+
+    def low(self):
+        return self.remaining() < get_ratelimit_settings()['LOW_WATER']
+
+    async def alow(self):
+        return await self.aremaining() < get_ratelimit_settings()['LOW_WATER']
+
+    def info(self):
+        config = get_ratelimit_settings()
+        store = window_store(config)
+        return {
+            name: {'limit': limit, 'used': min(limit, store.count(f'budget:{self.name}', window))}
+            for name, limit, window in self.limits(config)
+        }
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def get_buckets():
+    global _buckets
+    if _buckets is None:
+        with _buckets_lock:
+            if _buckets is None:
+                _buckets = TokenBuckets(get_ratelimit_settings()['MAX_CLIENTS'])
+    return _buckets
+
+
+# forget this process's buckets and counters (tests, or after changing the limits)
+def reset_rate_limits():
+    get_buckets().clear()
+    _local_windows.clear()
+
+
+# "key:<digest>" for a known API key, otherwise "ip:<address>"; and the limit multiplier
+def client_identity(request, config):
+    api_key = request.META.get(config['API_KEY_HEADER'])
+    if api_key and api_key in config['API_KEYS']:
+        return 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16], config['API_KEY_MULTIPLIER']
+    address = request.META.get('REMOTE_ADDR', '')
+    if config['TRUST_X_FORWARDED_FOR'] and request.META.get('HTTP_X_FORWARDED_FOR'):
+        address = request.META['HTTP_X_FORWARDED_FOR'].split(',')[0].strip()
+    return 'ip:' + address, 1
+
+
+def too_many_requests(retry_after):
+    response = JsonResponse({'error': 'Too many requests, please slow down.'}, status=429)
+    response['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+# per client and endpoint token buckets in front of the API views; a rejected request
+# never reaches the views, the caches or the upstream providers
+class RateLimitMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    # (bucket key, requests per minute, burst) for the request, None when it is not limited
+    def rule(self, request):
+        config = get_ratelimit_settings()
+        if not config['ENABLED']:
+            return None
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+        rule = config['RULES'].get(url_name)
+        if rule is None:
+            return None
+        client, multiplier = client_identity(request, config)
+        rate, burst = rule
+        return config, f'{client}:{url_name}', rate * multiplier, burst * multiplier
+
+    # the in-process store is a token bucket; the shared one approximates it with fixed
+    # windows allowing `burst` requests every burst/rate minutes
+    def check(self, config, key, rate, burst):
+        if not config['BACKEND']:
+            return get_buckets().take(key, rate, burst)
+        count, retry_after = window_store(config).hit(key, 60.0 * burst / rate)
+        return count <= burst, retry_after
+
+    async def acheck(self, config, key, rate, burst):
+        if not config['BACKEND']:
+            return get_buckets().take(key, rate, burst)
+        count, retry_after = await window_store(config).ahit(key, 60.0 * burst / rate)
+        return count <= burst, retry_after
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        rule = self.rule(request)
+        if rule is not None:
+            allowed, retry_after = self.check(*rule)
+            if not allowed:
+                return too_many_requests(retry_after)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        rule = self.rule(request)
+        if rule is not None:
+            allowed, retry_after = await self.acheck(*rule)
+            if not allowed:
+                return too_many_requests(retry_after)
+        return await self.get_response(request)
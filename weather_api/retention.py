@@ -0,0 +1,98 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Min
+from .models import Weather, WeatherDailySummary
+from .serialization import dumps
+
+# Default retention settings, overridable through settings.WEATHER_RETENTION
+DEFAULTS = {
+    'DAYS': 90,            # raw snapshots older than this many full days are rolled up and deleted
+    'BATCH_SIZE': 1000,    # rows deleted per statement, each batch is its own short transaction
+    'PAUSE': 0.0,          # seconds to sleep between delete batches, to let other writers in
+}
+
+SUMMARY_FIELDS = ('temperature', 'humidity', 'wind_speed', 'pressure')
+
+
+def get_retention_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'WEATHER_RETENTION', {}))
+    return config
+
+
+def _day_start(moment):
+    return datetime.combine(moment.astimezone(timezone.utc).date(), datetime.min.time(), tzinfo=timezone.utc)
+
+
+# start of the UTC day `days` days ago: everything before it is past the retention window,
+# and only whole days are rolled up
+def retention_cutoff(days, now=None):
+    return _day_start((now or datetime.now(timezone.utc)) - timedelta(days=days))
+
+
+# earliest snapshot time before `before` (and not before `after`), read from the timestamp index
+def _first_timestamp(before, after=None):
+    rows = Weather.objects.filter(timestamp__lt=before)
+    if after is not None:
+        rows = rows.filter(timestamp__gte=after)
+    return rows.order_by('timestamp').values_list('timestamp', flat=True).first()
+
+
+# per-city aggregates of one UTC day, computed by the database
+def _day_summaries(day_start):
+    aggregates = {'samples': Count('id')}
+    for field in SUMMARY_FIELDS:
+        prefix = 'temp' if field == 'temperature' else field
+        aggregates[f'{prefix}_min'] = Min(field)
+        aggregates[f'{prefix}_max'] = Max(field)
+        aggregates[f'{prefix}_avg'] = Avg(field)
+    rows = Weather.objects.filter(
+        timestamp__gte=day_start, timestamp__lt=day_start + timedelta(days=1),
+    ).values('city', 'country').annotate(**aggregates).order_by()
+    return [WeatherDailySummary(date=day_start.date(), **row) for row in rows]
+
+
+# write a WeatherDailySummary for every city and UTC day with snapshots before cutoff, one
+# day at a time. Days that already have a summary keep it (ignore_conflicts), so a run that
+# was interrupted while deleting never replaces a full day with the rows that are left.
+# Returns the number of (city, day) groups aggregated.
+def rollup_snapshots(cutoff):
+    aggregated = 0
+    timestamp = _first_timestamp(cutoff)
+    while timestamp is not None:
+        day_start = _day_start(timestamp)
+        summaries = _day_summaries(day_start)
+        WeatherDailySummary.objects.bulk_create(summaries, ignore_conflicts=True)
+        aggregated += len(summaries)
+        # jump over days without snapshots
+        timestamp = _first_timestamp(cutoff, after=day_start + timedelta(days=1))
+    return aggregated
+
+
+# delete the snapshots before cutoff in batches of batch_size, oldest first, optionally
+# writing each batch as JSON lines to the binary file `archive` before it is deleted.
+# Returns the number of rows deleted.
+def purge_snapshots(cutoff, batch_size, archive=None, pause=0.0, sleep=time.sleep, progress=None):
+    deleted = 0
+    old = Weather.objects.filter(timestamp__lt=cutoff).order_by('timestamp', 'id')
+    while True:
+        if archive is not None:
+            rows = list(old.values()[:batch_size])
+            for row in rows:
+                row['timestamp'] = row['timestamp'].isoformat()
+                archive.write(dumps(row) + b'\n')
+            ids = [row['id'] for row in rows]
+        else:
+            ids = list(old.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += Weather.objects.filter(id__in=ids).delete()[0]
+        if progress is not None:
+            progress(deleted)
+        if len(ids) < batch_size:
+            break
+        if pause:
+            sleep(pause)
+    return deleted
@@ -0,0 +1,21 @@
+import json
+
+# orjson is optional (pip install orjson); without it the stdlib encoder is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# compact UTF-8 JSON bytes
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def loads(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
@@ -0,0 +1,229 @@
+import hashlib
+import json
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from .models import Weather
+from .cache import forecast_cache
+from .forecast import process_forecast
+from .serialization import loads
+from .geo import index_point
+from .metrics import span
+from .upstream import UpstreamUnavailable, afetch_forecast, fetch_forecast, openweathermap
+
+
+# raised by the forecast loaders when OpenWeatherMap does not answer with a forecast
+class WeatherFetchError(Exception):
+    pass
+
+
+# function to check the upstream response (requests or httpx) and process its payload
+def parse_forecast_response(response, uv=None):
+    if response.status_code != 200:
+        raise WeatherFetchError(f'OpenWeatherMap responded with {response.status_code}')
+    with span('parse'):
+        return process_forecast(loads(response.content), uv=uv)
+
+
+# loaders: fetch and process the forecast for a city or for coordinates (no persistence)
+def fetch_city_weather(city):
+    return parse_forecast_response(fetch_forecast(q=city))
+
+
+def fetch_coordinates_weather(latitude, longitude):
+    # Note: UV index is hardcoded to 1
+    processed_data = parse_forecast_response(fetch_forecast(lat=latitude, lon=longitude), uv=1)
+    index_point(latitude, longitude)
+    return processed_data
+
+
+async def afetch_city_weather(city):
+    return parse_forecast_response(await afetch_forecast(q=city))
+
+
+async def afetch_coordinates_weather(latitude, longitude):
+    processed_data = parse_forecast_response(await afetch_forecast(lat=latitude, lon=longitude), uv=1)
+    index_point(latitude, longitude)
+    return processed_data
+
+
+# error payload and status code for a failed forecast lookup
+def weather_error(error):
+    if isinstance(error, UpstreamUnavailable):
+        return {'error': 'Weather provider is unavailable, please try again later.'}, 503
+    return {'error': 'Unable to fetch weather data'}, 400
+
+
+# function to build the (payload, status) of a weather response through the forecast cache,
+# falling back to the last known forecast when the provider is down or its budget is spent
+def weather_response(cache_key, loader):
+    # With the OpenWeatherMap budget running low any cached forecast beats a new call
+    if openweathermap.budget.low():
+        processed_data = forecast_cache.peek(cache_key)
+        if processed_data is not None:
+            return processed_data, 200
+    try:
+        return forecast_cache.get_or_load(cache_key, loader), 200
+    except UpstreamUnavailable as e:
+        processed_data = forecast_cache.peek(cache_key)
+        if processed_data is None:
+            return weather_error(e)
+        return processed_data, 200
+    except WeatherFetchError as e:
+        return weather_error(e)
+
+
+async def aweather_response(cache_key, aloader):
+    if await openweathermap.budget.alow():
+        processed_data = await forecast_cache.apeek(cache_key)
+        if processed_data is not None:
+            return processed_data, 200
+    try:
+        return await forecast_cache.aget_or_load(cache_key, aloader), 200
+    except UpstreamUnavailable as e:
+        processed_data = await forecast_cache.apeek(cache_key)
+        if processed_data is None:
+            return weather_error(e)
+        return processed_data, 200
+    except WeatherFetchError as e:
+        return weather_error(e)
+
+
+# columns that make up a snapshot, compared through their content hash
+SNAPSHOT_FIELDS = ('city', 'country', 'temperature', 'description', 'humidity', 'wind_speed', 'pressure', 'forecast')
+
+# seconds the latest snapshot hash of a city is kept in the cache
+LATEST_HASH_TIMEOUT = 24 * 60 * 60
+
+# stands in for the cache of latest hashes when the default cache is per-process
+_no_hash_cache = DummyCache('weather-latest-hash', {})
+
+
+# the Weather model fields for a processed forecast
+def snapshot_fields(processed_data):
+    return {
+        'city': processed_data['city'],
+        'country': processed_data['country'],
+        'temperature': processed_data['current']['temp_c'],
+        'description': processed_data['current']['description'],
+        'humidity': processed_data['current']['humidity'],
+        'wind_speed': processed_data['current']['wind_speed'],
+        'pressure': processed_data['current']['pressure'],
+        'forecast': processed_data['forecast'],
+    }
+
+
+# sha256 of the canonical JSON of a snapshot; numeric columns are normalized to the
+# types the database returns so a row and the forecast it came from hash the same
+def fields_hash(fields):
+    canonical = dict(
+        fields,
+        temperature=float(fields['temperature']),
+        humidity=int(fields['humidity']),
+        wind_speed=float(fields['wind_speed']),
+        pressure=float(fields['pressure']),
+    )
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def snapshot_hash(processed_data):
+    return fields_hash(snapshot_fields(processed_data))
+
+
+def weather_hash(weather):
+    return fields_hash({name: getattr(weather, name) for name in SNAPSHOT_FIELDS})
+
+
+def _latest_hash_key(city, country):
+    digest = hashlib.md5(f'{city}\x00{country}'.encode('utf-8')).hexdigest()
+    return f'weather:latest-hash:{digest}'
+
+
+def latest_snapshot_query(city, country):
+    return Weather.objects.filter(city=city, country=country).order_by('-timestamp', '-id')
+
+
+# the latest hashes are only cached in a backend shared by every worker: with the per-process
+# locmem default a worker would compare against its own stale hash and save duplicate
+# snapshots, so the indexed query runs on every save instead
+def latest_hash_cache():
+    cache = caches['default']
+    if isinstance(cache, LocMemCache):
+        return _no_hash_cache
+    return cache
+
+
+# hash of the latest saved snapshot of a city, from the cache or a single indexed query
+def latest_snapshot_hash(city, country):
+    cache = latest_hash_cache()
+    key = _latest_hash_key(city, country)
+    content_hash = cache.get(key)
+    if content_hash is None:
+        content_hash = latest_snapshot_query(city, country).values_list('content_hash', flat=True).first() or ''
+        cache.set(key, content_hash, LATEST_HASH_TIMEOUT)
+    return content_hash
+
+
+async def alatest_snapshot_hash(city, country):
+    cache = latest_hash_cache()
+    key = _latest_hash_key(city, country)
+    content_hash = await cache.aget(key)
+    if content_hash is None:
+        content_hash = await latest_snapshot_query(city, country).values_list('content_hash', flat=True).afirst() or ''
+        await cache.aset(key, content_hash, LATEST_HASH_TIMEOUT)
+    return content_hash
+
+
+# function to save the forecast unless it matches the last saved snapshot of the city
+def save_snapshot(processed_data):
+    content_hash = snapshot_hash(processed_data)
+    city, country = processed_data['city'], processed_data['country']
+    with span('db.latest_hash'):
+        latest_hash = latest_snapshot_hash(city, country)
+    if latest_hash != content_hash:
+        with span('db.insert'):
+            Weather.objects.create(**snapshot_fields(processed_data), content_hash=content_hash)
+        latest_hash_cache().set(_latest_hash_key(city, country), content_hash, LATEST_HASH_TIMEOUT)
+
+
+# async ORM version of save_snapshot for the ASGI views
+async def asave_snapshot(processed_data):
+    content_hash = snapshot_hash(processed_data)
+    city, country = processed_data['city'], processed_data['country']
+    with span('db.latest_hash'):
+        latest_hash = await alatest_snapshot_hash(city, country)
+    if latest_hash != content_hash:
+        with span('db.insert'):
+            await Weather.objects.acreate(**snapshot_fields(processed_data), content_hash=content_hash)
+        await latest_hash_cache().aset(_latest_hash_key(city, country), content_hash, LATEST_HASH_TIMEOUT)
+
+
+# function to save many forecasts with one cache lookup of the latest hashes, one indexed
+# query per city missing from it and one bulk insert
+def save_snapshots(processed_list):
+    if not processed_list:
+        return []
+    cache = latest_hash_cache()
+    keys = {(p['city'], p['country']): _latest_hash_key(p['city'], p['country']) for p in processed_list}
+    cached = cache.get_many(list(keys.values()))
+    latest = {pair: cached[key] for pair, key in keys.items() if key in cached}
+
+    for city, country in keys.keys() - latest.keys():
+        query = latest_snapshot_query(city, country).values_list('content_hash', flat=True)
+        latest[(city, country)] = query.first() or ''
+
+    new_snapshots = []
+    for processed_data in processed_list:
+        pair = (processed_data['city'], processed_data['country'])
+        content_hash = snapshot_hash(processed_data)
+        if latest[pair] != content_hash:
+            # later items of the same city are compared against this one
+            latest[pair] = content_hash
+            new_snapshots.append(Weather(**snapshot_fields(processed_data), content_hash=content_hash))
+
+    with span('db.bulk_insert'):
+        created = Weather.objects.bulk_create(new_snapshots)
+    cache.set_many({key: latest[pair] for pair, key in keys.items()}, LATEST_HASH_TIMEOUT)
+    return created
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import threading
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import caches
+from .cache import ForecastCache
+from .gazetteer import split_country
+from .history import history_city
+from .models import Weather
+from .persistence import snapshot_writer
+
+GEMINI_MODEL = 'gemini-1.5-flash'
+GEMINI_BASE_URL = 'https://generativelanguage.googleapis.com/v1beta'
+
+# maximum length of a formatted summary
+SUMMARY_MAX_LENGTH = 5000
+
+# AI summaries keyed on a hash of the prompt, configured through settings.WEATHER_SUMMARY_CACHE;
+# concurrent requests for the same prompt share one in-flight generation
+summary_cache = ForecastCache('summary', settings_name='WEATHER_SUMMARY_CACHE')
+
+# Default summary context settings, overridable through settings.WEATHER_SUMMARY_CONTEXT
+CONTEXT_DEFAULTS = {
+    'TTL': 3600,                      # seconds the forecast behind a city's summary is kept
+    'MISS_TTL': 60,                   # seconds a city without any snapshot is remembered as such
+    'BACKEND': 'default',             # Django cache alias shared by every worker
+    'KEY_PREFIX': 'weather:context',
+}
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def summary_cache_key(prompt):
+    return 'summary:' + hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+# the processed forecast of a saved Weather row, used when no context is cached
+def weather_context(weather):
+    return {
+        'city': weather.city,
+        'country': weather.country,
+        'current': {
+            'temp_c': weather.temperature,
+            'description': weather.description,
+            'wind_speed': weather.wind_speed,
+            'humidity': weather.humidity,
+            'pressure': weather.pressure,
+        },
+        'forecast': weather.forecast,
+    }
+
+
+# the forecast each city's summary is generated from, kept per city/country in the Django
+# cache so every worker sees the same context; entries expire after TTL and the cache
+# backend bounds the total size. Misses fall back to the latest saved Weather row.
+class SummaryContextStore:
+    def __init__(self, settings_name='WEATHER_SUMMARY_CONTEXT'):
+        self.settings_name = settings_name
+
+    @property
+    def config(self):
+        config = dict(CONTEXT_DEFAULTS)
+        config.update(getattr(settings, self.settings_name, {}))
+        return config
+
+    @property
+    def _cache(self):
+        return caches[self.config['BACKEND']]
+
+    # city alone, city and country, or no city for the most recently stored forecast;
+    # a canonical "Name,CC" city is the same key as Name with country CC
+    def key(self, city=None, country=None):
+        if not city:
+            return self.config['KEY_PREFIX'] + ':latest'
+        if not country:
+            city, country = split_country(city)
+        name = ' '.join(city.split()).casefold() + '\x00' + (country or '').strip().casefold()
+        return self.config['KEY_PREFIX'] + ':' + hashlib.md5(name.encode('utf-8')).hexdigest()
+
+    # entries written for a forecast: its city with and without country, the city name
+    # that was queried (which may be spelled differently) and the "latest" slot
+    def _entries(self, processed_data, query=None):
+        keys = {
+            self.key(processed_data['city'], processed_data['country']),
+            self.key(processed_data['city']),
+            self.key(),
+        }
+        if query:
+            keys.add(self.key(query))
+        return dict.fromkeys(keys, processed_data)
+
+    def save(self, processed_data, query=None):
+        self._cache.set_many(self._entries(processed_data, query), self.config['TTL'])
+
+    async def asave(self, processed_data, query=None):
+        await self._cache.aset_many(self._entries(processed_data, query), self.config['TTL'])
+
+    # latest snapshot of the city under its stored (gazetteer) name, an exact match the
+    # (city, country, timestamp) index serves
+    def _query(self, city, country):
+        snapshots = Weather.objects.all()
+        if city:
+            city, country = history_city(city, country)
+            snapshots = snapshots.filter(city=city)
+        if country:
+            snapshots = snapshots.filter(country=country.strip().upper())
+        return snapshots.order_by('-timestamp', '-id')
+
+    # a miss is only remembered while no snapshot waits in the write-behind queue, one of
+    # them may be the city's and save() does not know every name it was looked up by
+    def _remember(self, context):
+        return bool(context) or not snapshot_writer.pending
+
+    # the forecast to summarize for a city (None when it was never fetched); cities
+    # without snapshots are remembered for MISS_TTL so unknown names do not query again
+    def get(self, city=None, country=None):
+        key = self.key(city, country)
+        context = self._cache.get(key)
+        if context is None:
+            weather = self._query(city, country).first()
+            context = weather_context(weather) if weather is not None else False
+            if self._remember(context):
+                self._cache.set(key, context, self.config['TTL'] if context else self.config['MISS_TTL'])
+        return context or None
+
+    async def aget(self, city=None, country=None):
+        key = self.key(city, country)
+        context = await self._cache.aget(key)
+        if context is None:
+            weather = await self._query(city, country).afirst()
+            context = weather_context(weather) if weather is not None else False
+            if self._remember(context):
+                await self._cache.aset(key, context, self.config['TTL'] if context else self.config['MISS_TTL'])
+        return context or None
+
+
+# shared store used by the weather and summary views
+summary_contexts = SummaryContextStore()
+
+
+# the Gemini model is configured once per process and reused by every request. The SDK
+# (with grpc and protobuf) is imported on the first summary rather than at startup, so
+# cold starts serving plain weather requests do not pay for it. A GEMINI_BASE_URL other
+# than Google's (e.g. the benchmark mock) is reached through the SDK's REST transport,
+# which appends the /v1beta path itself.
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+
+                options = {}
+                base_url = urlsplit(getattr(settings, 'GEMINI_BASE_URL', GEMINI_BASE_URL))
+                if base_url.netloc != urlsplit(GEMINI_BASE_URL).netloc:
+                    options = {
+                        'transport': 'rest',
+                        'client_options': {'api_endpoint': f'{base_url.scheme}://{base_url.netloc}'},
+                    }
+                genai.configure(api_key=settings.GEMINI_API_KEY, **options)
+                _model = genai.GenerativeModel(GEMINI_MODEL)
+    return _model
+
+
+# one Server-Sent Events frame
+def sse_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+# applies format_summary to streamed chunks while keeping the overall length cap
+class SummaryFormatter:
+    def __init__(self, format_summary, max_length=SUMMARY_MAX_LENGTH):
+        self.format_summary = format_summary
+        self.max_length = max_length
+        self.parts = []
+        self.length = 0
+
+    @property
+    def done(self):
+        return self.length >= self.max_length
+
+    @property
+    def summary(self):
+        return ''.join(self.parts)
+
+    # formatted text to send for this chunk ('' once the cap is reached)
+    def feed(self, chunk):
+        text = self.format_summary(chunk)[:self.max_length - self.length]
+        if text:
+            self.parts.append(text)
+            self.length += len(text)
+        return text
@@ -0,0 +1,94 @@
+from django.test import TestCase, AsyncRequestFactory, override_settings
+from django.core.cache import cache
+from unittest.mock import patch
+from .async_views import AsyncWeatherView, AsyncGetWeatherByCoordinates, AsyncGenerateWeatherSummary
+from .models import Weather
+from .cache import forecast_cache
+from .geo import get_point_index
+from .ratelimit import reset_rate_limits
+from .summaries import summary_cache, summary_contexts
+from .factories import forecast_response
+import json
+
+
+# Save snapshots in the request so the assertions can see them
+@override_settings(WEATHER_PERSISTENCE={'WRITE_BEHIND': False})
+class AsyncWeatherViewTestCase(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        reset_rate_limits()
+        forecast_cache.clear()
+        get_point_index().clear()
+        summary_cache.clear()
+        cache.clear()
+
+    @patch('weather_api.services.afetch_forecast')
+    async def test_get_weather_data_success(self, mock_fetch):
+        mock_fetch.return_value = forecast_response()
+
+        response = await AsyncWeatherView.as_view()(self.factory.get('/weather/?city=Test City'))
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['city'], 'Test City')
+        self.assertEqual(data['current']['temp_c'], 20)
+        mock_fetch.assert_called_once_with(q='Test City')
+        self.assertEqual(await Weather.objects.acount(), 1)
+        self.assertEqual((await summary_contexts.aget('test city'))['current']['temp_c'], 20)
+
+        # A second identical forecast is served from cache and not saved again
+        await AsyncWeatherView.as_view()(self.factory.get('/weather/?city=test city'))
+        self.assertEqual(mock_fetch.call_count, 1)
+        self.assertEqual(await Weather.objects.acount(), 1)
+
+    @patch('weather_api.services.afetch_forecast')
+    async def test_get_weather_data_failure(self, mock_fetch):
+        mock_fetch.return_value = forecast_response(status_code=404)
+
+        response = await AsyncWeatherView.as_view()(self.factory.get('/weather/?city=NonexistentCity'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['error'], 'Unable to fetch weather data')
+
+    @patch('weather_api.services.afetch_forecast')
+    async def test_coordinates_are_rounded(self, mock_fetch):
+        mock_fetch.return_value = forecast_response()
+
+        response = await AsyncGetWeatherByCoordinates.as_view()(self.factory.get('/weather/coordinates/?lat=40.71281&lon=-74.00601'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['current']['uv'], 1)
+        mock_fetch.assert_called_once_with(lat=40.71, lon=-74.01)
+
+    @patch('weather_api.async_views.agenerate_content')
+    async def test_generate_summary(self, mock_generate):
+        mock_generate.return_value = 'Sunny all week.\nEnjoy it.'
+        await summary_contexts.asave(json.loads(json.dumps({
+            'city': 'Test City', 'country': 'TC',
+            'current': {'temp_c': 20, 'description': 'Clear sky', 'wind_speed': 5, 'humidity': 50, 'pressure': 1015},
+            'forecast': [{'date': '2024-03-01', 'temp_min': 18, 'temp_max': 22, 'description': 'Clear sky'}],
+        })))
+
+        response = await AsyncGenerateWeatherSummary.as_view()(self.factory.get('/weather/generate-weather-summary/'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['summary'], 'Sunny all week. Enjoy it.')
+
+    @patch('weather_api.async_views.astream_content')
+    async def test_stream_summary(self, mock_stream):
+        async def chunks(prompt):
+            yield 'Sunny all\n'
+            yield 'week.'
+        mock_stream.side_effect = chunks
+        await summary_contexts.asave({
+            'city': 'Test City', 'country': 'TC',
+            'current': {'temp_c': 20, 'description': 'Clear sky', 'wind_speed': 5, 'humidity': 50, 'pressure': 1015},
+            'forecast': [{'date': '2024-03-01', 'temp_min': 18, 'temp_max': 22, 'description': 'Clear sky'}],
+        })
+
+        response = await AsyncGenerateWeatherSummary.as_view()(self.factory.get('/weather/generate-weather-summary/?stream=1'))
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.startswith('event: chunk\ndata: {"text": "Sunny all "}\n\n'))
+        self.assertTrue(body.endswith('event: done\ndata: {"summary": "Sunny all week."}\n\n'))
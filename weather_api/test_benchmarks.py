@@ -0,0 +1,67 @@
+import json
+
+import httpx
+from django.test import SimpleTestCase
+
+from benchmarks.load_test import SCENARIOS, compare
+from benchmarks.mock_upstream import start_mock_upstream
+
+
+class MockUpstreamTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = start_mock_upstream()
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/v1beta/models/gemini-1.5-flash'
+        self.body = {'contents': [{'parts': [{'text': 'prompt'}]}]}
+
+    def test_generate_and_stream_content(self):
+        response = httpx.post(f'{self.url}:generateContent', json=self.body)
+        text = response.json()['candidates'][0]['content']['parts'][0]['text']
+        self.assertEqual(text, 'Mock summary for a 6 character prompt.\nStay dry.')
+
+        response = httpx.post(f'{self.url}:streamGenerateContent', json=self.body)
+        chunks = [event['candidates'][0]['content']['parts'][0]['text'] for event in response.json()]
+        self.assertEqual(''.join(chunks), text)
+
+        response = httpx.post(f'{self.url}:streamGenerateContent?alt=sse', json=self.body)
+        events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith('data: ')]
+        self.assertEqual(len(events), len(chunks))
+
+    def test_errors(self):
+        server = start_mock_upstream(error_rate=1.0)
+        self.addCleanup(server.shutdown)
+        response = httpx.get(f'http://127.0.0.1:{server.server_port}/data/2.5/forecast?q=Paris')
+        self.assertEqual(response.status_code, 503)
+
+
+class LoadTestCompareTestCase(SimpleTestCase):
+    def test_regressions_beyond_tolerance(self):
+        baseline = {'results': {'wsgi': {
+            'hot': {'requests': 100, 'errors': 0, 'rps': 100.0, 'p95_ms': 50.0},
+            'cold': {'requests': 10, 'errors': 0, 'rps': 10.0, 'p95_ms': 500.0},
+        }}}
+        results = {'wsgi': {
+            'hot': {'requests': 90, 'errors': 0, 'rps': 90.0, 'p95_ms': 80.0},
+            'cold': {'requests': 5, 'errors': 0, 'rps': 5.0, 'p95_ms': 450.0},
+            'batch': {'requests': 1, 'errors': 0, 'rps': 1.0, 'p95_ms': 900.0},
+        }}
+
+        lines, regressions = compare(baseline, results, 0.25)
+
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(regressions, [
+            'wsgi/hot: p95 latency up 60%',
+            'wsgi/cold: throughput down 50%',
+        ])
+
+    def test_failing_fast_is_a_regression(self):
+        baseline = {'results': {'wsgi': {'hot': {'requests': 100, 'errors': 0, 'rps': 100.0, 'p95_ms': 50.0}}}}
+        # every request answered quickly with a 503
+        results = {'wsgi': {'hot': {'requests': 500, 'errors': 500, 'rps': 500.0, 'p95_ms': 5.0}}}
+
+        self.assertEqual(compare(baseline, results, 0.25)[1], ['wsgi/hot: error rate up from 0.0% to 100.0%'])
+
+    def test_runs_get_their_own_cities(self):
+        self.assertNotEqual(SCENARIOS['cold'](1, 0), SCENARIOS['cold'](2, 0))
+        self.assertNotEqual(SCENARIOS['coordinates'](1, 0), SCENARIOS['coordinates'](2, 0))
+        self.assertEqual(len(SCENARIOS['batch'](1, 0)[2]['cities']), 10)
@@ -0,0 +1,156 @@
+from django.test import SimpleTestCase, override_settings
+from unittest.mock import patch
+from .cache import AsyncSingleFlight, ForecastCache, LRUCache, SingleFlight, city_cache_key, coordinates_cache_key
+import asyncio
+import threading
+import time
+
+
+@override_settings(WEATHER_CACHE={'TTL': 60, 'STALE_TTL': 60, 'MAX_ENTRIES': 8, 'BACKEND': None})
+class ForecastCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache = ForecastCache('test')
+
+    def test_miss_then_hit(self):
+        loads = []
+        loader = lambda: loads.append(1) or {'city': 'Test City'}
+
+        self.assertEqual(self.cache.get_or_load('city:test city', loader), {'city': 'Test City'})
+        self.assertEqual(self.cache.get_or_load('city:test city', loader), {'city': 'Test City'})
+
+        stats = self.cache.info()
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_stale_entry_served_while_revalidating(self):
+        self.cache.set('city:test city', 'old')
+        refreshed = threading.Event()
+
+        def loader():
+            refreshed.set()
+            return 'new'
+
+        # Jump past the fresh window but stay inside the stale window
+        with patch('weather_api.cache.time.time', return_value=time.time() + 90):
+            self.assertEqual(self.cache.get_or_load('city:test city', loader), 'old')
+        self.assertTrue(refreshed.wait(2))
+        for _ in range(100):
+            if self.cache.local.get('city:test city').value == 'new':
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(self.cache.get_or_load('city:test city', loader), 'new')
+        self.assertEqual(self.cache.info()['stale'], 1)
+
+    def test_failed_load_is_not_cached(self):
+        def loader():
+            raise ValueError('upstream down')
+
+        with self.assertRaises(ValueError):
+            self.cache.get_or_load('city:nowhere', loader)
+        self.assertIsNone(self.cache.local.get('city:nowhere'))
+        self.assertEqual(self.cache.info()['errors'], 1)
+
+    def test_concurrent_misses_collapse_into_one_load(self):
+        release = threading.Event()
+        loads = []
+
+        def loader():
+            loads.append(1)
+            release.wait(2)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_load('city:busy', loader)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(loads), 1)
+
+    def test_cancelled_async_leader_hands_the_load_over(self):
+        loads = []
+
+        async def loader():
+            loads.append(1)
+            await asyncio.sleep(0.05)
+            return 'value'
+
+        async def scenario():
+            leader = asyncio.create_task(self.cache.aget_or_load('city:busy', loader))
+            await asyncio.sleep(0.01)
+            followers = [asyncio.create_task(self.cache.aget_or_load('city:busy', loader)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            # the leader's client disconnects in the middle of the load
+            leader.cancel()
+            results = await asyncio.wait_for(asyncio.gather(*followers), 2)
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return results
+
+        self.assertEqual(asyncio.run(scenario()), ['value'] * 3)
+        self.assertEqual(len(loads), 2)
+        self.assertEqual(self.cache.local.get('city:busy').value, 'value')
+
+
+class CacheHelpersTestCase(SimpleTestCase):
+    def test_city_key_is_normalized(self):
+        self.assertEqual(city_cache_key(' New   York '), city_cache_key('new york'))
+
+    def test_coordinates_key_is_rounded(self):
+        self.assertEqual(coordinates_cache_key('40.71281', '-74.00601'), coordinates_cache_key(40.7149, -74.0051))
+
+    def test_lru_evicts_least_recently_used(self):
+        lru = LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+
+    def test_single_flight_reports_errors_to_leader(self):
+        def boom():
+            raise RuntimeError('boom')
+
+        flight = SingleFlight()
+        with self.assertRaises(RuntimeError):
+            flight.do('key', boom)
+        self.assertEqual(flight.do('key', lambda: 'ok'), ('ok', False))
+
+    def test_aborted_leader_hands_the_load_over(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        results = []
+
+        def abort():
+            started.set()
+            time.sleep(0.05)
+            # what a worker timeout or SystemExit looks like to the leader's thread
+            raise KeyboardInterrupt
+
+        def lead():
+            try:
+                flight.do('key', abort)
+            except KeyboardInterrupt:
+                pass
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait()
+        load = lambda: time.sleep(0.05) or 'ok'
+        followers = [threading.Thread(target=lambda: results.append(flight.do('key', load))) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        for thread in [leader] + followers:
+            thread.join(2)
+
+        self.assertEqual(sorted(results), [('ok', False), ('ok', True), ('ok', True)])
@@ -0,0 +1,100 @@
+from django.test import SimpleTestCase
+from unittest.mock import patch
+from .forecast import ForecastDay, compact_forecast, daily_forecast, forecast_days, process_forecast
+from . import serialization
+
+# 2024-03-01 00:00:00 UTC
+START = 1709251200
+
+
+def slot(hours, temp, description='clear sky', wind=2.0, humidity=50):
+    return {
+        'dt': START + hours * 3600,
+        'main': {'temp': temp, 'temp_min': temp - 1, 'temp_max': temp + 1, 'humidity': humidity, 'pressure': 1010},
+        'weather': [{'description': description}],
+        'wind': {'speed': wind},
+    }
+
+
+class ForecastProcessingTestCase(SimpleTestCase):
+    def test_daily_extremes_means_and_dominant_description(self):
+        slots = [
+            slot(0, 10, 'light rain', wind=1.0, humidity=80),
+            slot(3, 4, 'clear sky', wind=3.0, humidity=60),
+            slot(6, 16, 'light rain', wind=2.0, humidity=70),
+            slot(24, 20, 'few clouds'),
+        ]
+
+        days = daily_forecast(slots)
+
+        self.assertEqual(days[0], {
+            'date': '2024-03-01', 'temp_min': 3, 'temp_max': 17,
+            'description': 'light rain', 'wind_speed': 2.0, 'humidity': 70,
+        })
+        self.assertEqual(days[1]['date'], '2024-03-02')
+        self.assertEqual(days[1]['temp_max'], 21)
+
+    def test_days_follow_the_city_timezone(self):
+        slots = [slot(hours, 10) for hours in (0, 3, 21)]
+
+        # UTC-5: 00:00 and 03:00 UTC are still on February 29th locally
+        days = daily_forecast(slots, utc_offset=-5 * 3600)
+
+        self.assertEqual([day['date'] for day in days], ['2024-02-29', '2024-03-01'])
+
+    def test_forty_slots_give_five_days(self):
+        data = {
+            'city': {'name': 'Test City', 'country': 'TC', 'timezone': 3600},
+            'list': [slot(3 * i, 10 + i % 8) for i in range(40)],
+        }
+
+        processed = process_forecast(data, uv=1)
+
+        self.assertEqual(len(processed['forecast']), 5)
+        self.assertEqual(processed['current'], {
+            'temp_c': 10, 'description': 'clear sky', 'wind_speed': 2.0, 'humidity': 50, 'pressure': 1010, 'uv': 1,
+        })
+        self.assertEqual(processed['forecast'][1]['temp_min'], 9)
+        self.assertEqual(processed['forecast'][1]['temp_max'], 18)
+
+    def test_dt_txt_is_used_without_dt(self):
+        slots = [slot(0, 10), slot(3, 12)]
+        for item in slots:
+            del item['dt']
+        slots[0]['dt_txt'] = '2024-03-01 21:00:00'
+        slots[1]['dt_txt'] = '2024-03-02 00:00:00'
+
+        self.assertEqual([day['date'] for day in daily_forecast(slots)], ['2024-03-01', '2024-03-02'])
+
+    def test_forecast_days_are_slotted(self):
+        day = forecast_days([slot(0, 10)])[0]
+
+        self.assertIsInstance(day, ForecastDay)
+        self.assertFalse(hasattr(day, '__dict__'))
+        self.assertEqual(day.as_dict()['temp_max'], 11)
+
+    def test_compact_forecast(self):
+        processed = process_forecast({'city': {'name': 'Test City', 'country': 'TC'}, 'list': [slot(0, 10), slot(24, 20)]})
+
+        compact = compact_forecast(processed)
+
+        self.assertEqual(compact['current'], processed['current'])
+        self.assertEqual(compact['forecast'], {
+            'date': ['2024-03-01', '2024-03-02'],
+            'temp_min': [9, 19],
+            'temp_max': [11, 21],
+            'description': ['clear sky', 'clear sky'],
+            'wind_speed': [2.0, 2.0],
+            'humidity': [50, 50],
+        })
+
+
+class SerializationTestCase(SimpleTestCase):
+    def test_round_trip_with_and_without_orjson(self):
+        data = {'city': 'São Paulo', 'forecast': [{'temp_min': 18.5, 'humidity': 50}], 'uv': None}
+        for backend in (serialization.orjson, None):
+            with patch.object(serialization, 'orjson', backend):
+                encoded = serialization.dumps(data)
+                self.assertIsInstance(encoded, bytes)
+                self.assertNotIn(b': ', encoded)
+                self.assertEqual(serialization.loads(encoded), data)
@@ -0,0 +1,85 @@
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from unittest.mock import patch
+from .cache import forecast_cache
+from .factories import forecast_response
+from .gazetteer import CityIndex, canonical_city, get_city_index, normalize_name
+from .ratelimit import reset_rate_limits
+from .views import CitySuggestView, WeatherView
+import json
+
+
+class CityIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        self.index = CityIndex([
+            ('São Paulo', 'BR', -23.5475, -46.6361, 12330000, ['Sao Paulo', 'Sampa']),
+            ('Paris', 'FR', 48.8534, 2.3488, 2140000, []),
+            ('Paris', 'US', 33.6609, -95.5555, 25000, []),
+            ('Parma', 'IT', 44.8015, 10.3279, 190000, []),
+            ('New York', 'US', 40.7143, -74.0060, 8800000, ['NYC', 'New York City']),
+        ])
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name('  São  PAULO '), 'sao paulo')
+        self.assertEqual(normalize_name('St. Louis'), 'st louis')
+
+    def test_resolve(self):
+        self.assertEqual(self.index.resolve('sao paulo').name, 'São Paulo')
+        self.assertEqual(self.index.resolve('NYC').name, 'New York')
+        self.assertEqual(self.index.resolve('paris').country, 'FR')
+        self.assertEqual(self.index.resolve('Paris, us').country, 'US')
+        self.assertIsNone(self.index.resolve('Paris, DE'))
+        self.assertIsNone(self.index.resolve('Par'))
+
+    def test_suggest(self):
+        self.assertEqual(
+            [(city.name, city.country) for city in self.index.suggest('par')],
+            [('Paris', 'FR'), ('Parma', 'IT'), ('Paris', 'US')],
+        )
+        self.assertEqual([city.name for city in self.index.suggest('par', limit=1)], ['Paris'])
+        self.assertEqual(self.index.suggest('  '), [])
+
+    def test_bundled_gazetteer(self):
+        index = get_city_index()
+        self.assertGreater(len(index), 200)
+        self.assertEqual(canonical_city('  new   york '), 'New York,US')
+        self.assertEqual(canonical_city('Smallville'), 'Smallville')
+        with self.assertRaises(ValueError):
+            canonical_city('1234')
+        with override_settings(WEATHER_GAZETTEER={'STRICT': True}):
+            with self.assertRaises(ValueError):
+                canonical_city('Smallville')
+
+
+@override_settings(WEATHER_PERSISTENCE={'WRITE_BEHIND': False})
+class CityResolutionViewTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        reset_rate_limits()
+        forecast_cache.clear()
+        cache.clear()
+
+    @patch('weather_api.services.fetch_forecast')
+    def test_aliases_share_one_upstream_call(self, mock_fetch):
+        mock_fetch.return_value = forecast_response('New York', 'US')
+
+        for city in ('nyc', 'New York ', 'new%20york%20city'):
+            self.assertEqual(WeatherView.as_view()(self.factory.get(f'/weather/?city={city}')).status_code, 200)
+
+        mock_fetch.assert_called_once_with(q='New York,US')
+
+    def test_garbage_is_rejected_before_upstream(self):
+        response = WeatherView.as_view()(self.factory.get('/weather/?city=%2B%2B%2B'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_suggest(self):
+        response = CitySuggestView.as_view()(self.factory.get('/cities/suggest/?q=san&limit=3'))
+
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)['results']
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result['name'].lower().startswith('san') for result in results))
+        self.assertEqual(set(results[0]), {'name', 'country', 'lat', 'lon'})
+
+        response = CitySuggestView.as_view()(self.factory.get('/cities/suggest/?q=san&limit=x'))
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,81 @@
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from unittest.mock import patch
+from .cache import forecast_cache, parse_coordinates
+from .factories import forecast_response
+from .geo import PointIndex, get_point_index, haversine_km
+from .ratelimit import reset_rate_limits
+from .views import GetWeatherByCoordinates
+import json
+
+
+class PointIndexTestCase(SimpleTestCase):
+    def test_haversine(self):
+        # Paris - London
+        self.assertAlmostEqual(haversine_km(48.8566, 2.3522, 51.5074, -0.1278), 343.5, delta=1)
+        self.assertEqual(haversine_km(10, 10, 10, 10), 0)
+
+    def test_nearest_within_radius(self):
+        index = PointIndex(radius_km=2, max_points=10)
+        index.add(40.71, -74.01)
+        index.add(40.75, -73.99)
+
+        self.assertEqual(index.nearest(40.72, -74.0), (40.71, -74.01))
+        self.assertEqual(index.nearest(40.745, -73.985), (40.75, -73.99))
+        self.assertIsNone(index.nearest(40.8, -74.2))
+
+    def test_nearest_across_the_antimeridian_and_near_the_poles(self):
+        index = PointIndex(radius_km=5, max_points=10)
+        index.add(-16.5, 179.99)
+        index.add(89.5, 10.0)
+
+        self.assertEqual(index.nearest(-16.5, -179.99), (-16.5, 179.99))
+        self.assertEqual(index.nearest(89.5, 13.0), (89.5, 10.0))
+
+    def test_least_recently_used_points_are_evicted(self):
+        index = PointIndex(radius_km=2, max_points=2)
+        index.add(1.0, 1.0)
+        index.add(2.0, 2.0)
+        index.nearest(1.0, 1.0)
+        index.add(3.0, 3.0)
+
+        self.assertEqual(len(index), 2)
+        self.assertIsNone(index.nearest(2.0, 2.0))
+        self.assertEqual(index.nearest(1.0, 1.0), (1.0, 1.0))
+
+    def test_parse_coordinates(self):
+        self.assertEqual(parse_coordinates('40.7', '-74'), (40.7, -74.0))
+        for latitude, longitude in (('abc', '1'), ('91', '0'), ('0', '-180.5'), ('nan', '0'), (None, '0')):
+            with self.assertRaises(ValueError):
+                parse_coordinates(latitude, longitude)
+
+
+@override_settings(WEATHER_PERSISTENCE={'WRITE_BEHIND': False})
+class NearestCoordinatesViewTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = GetWeatherByCoordinates.as_view()
+        reset_rate_limits()
+        forecast_cache.clear()
+        get_point_index().clear()
+        cache.clear()
+
+    @patch('weather_api.services.fetch_forecast')
+    def test_nearby_requests_share_a_forecast(self, mock_fetch):
+        mock_fetch.side_effect = lambda **query: forecast_response(f"Point {query['lat']}")
+
+        first = self.view(self.factory.get('/weather/coordinates/?lat=40.71281&lon=-74.00601'))
+        # about 1.5 km away, on another grid cell
+        second = self.view(self.factory.get('/weather/coordinates/?lat=40.7225&lon=-73.9950'))
+        # about 9 km away
+        third = self.view(self.factory.get('/weather/coordinates/?lat=40.79&lon=-73.97'))
+
+        self.assertEqual(json.loads(second.content), json.loads(first.content))
+        self.assertEqual(json.loads(third.content)['city'], 'Point 40.79')
+        self.assertEqual(mock_fetch.call_count, 2)
+
+    def test_out_of_range_coordinates_are_rejected(self):
+        response = self.view(self.factory.get('/weather/coordinates/?lat=123&lon=0'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('between -90 and 90', json.loads(response.content)['error'])
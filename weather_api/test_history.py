@@ -0,0 +1,146 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from django.test import TestCase
+from django.urls import reverse
+from .history import HistoryQuery, decode_cursor, encode_cursor, history_city, parse_time
+from .factories import add_snapshot
+from .ratelimit import reset_rate_limits
+
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+
+class HistoryQueryTestCase(TestCase):
+    def setUp(self):
+        # two days of snapshots every 30 minutes, plus one for another city
+        for i in range(96):
+            add_snapshot(START + timedelta(minutes=30 * i), float(i), 'New York', 'US')
+        add_snapshot(START, 99.0, 'Paris', 'FR')
+
+    def test_history_city_uses_the_gazetteer_name(self):
+        self.assertEqual(history_city('nyc'), ('New York', 'US'))
+        self.assertEqual(history_city('Springfield, ZZ'), ('Springfield', 'ZZ'))
+        self.assertEqual(history_city('Springfield'), ('Springfield', None))
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time('2024-03-01'), START)
+        self.assertEqual(parse_time('2024-03-01', end=True), START + timedelta(days=1))
+        self.assertEqual(parse_time('2024-03-01T02:00:00+02:00'), START)
+        with self.assertRaises(ValueError):
+            parse_time('yesterday')
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(START, 7)), (START, 7))
+        self.assertEqual(decode_cursor(encode_cursor(START)), (START, None))
+        with self.assertRaises(ValueError):
+            decode_cursor('not-a-cursor')
+
+    def test_keyset_pages_cover_the_range_once(self):
+        # rows sharing a timestamp are split across pages by id
+        add_snapshot(START + timedelta(minutes=30), 1.5, 'New York', 'US')
+        query = HistoryQuery('New York', 'US', START, START + timedelta(days=2))
+
+        temperatures, cursor = [], None
+        while True:
+            page = query.page(10, cursor and decode_cursor(cursor))
+            temperatures.extend(row['temperature'] for row in page['results'])
+            cursor = page['next']
+            if cursor is None:
+                break
+
+        self.assertEqual(len(temperatures), 97)
+        self.assertEqual(temperatures[:3], [0.0, 1.0, 1.5])
+
+    def test_hourly_buckets_are_aggregated_in_the_database(self):
+        query = HistoryQuery('New York', 'US', START, START + timedelta(hours=3), 'hour')
+
+        with self.assertNumQueries(1):
+            page = query.page(10)
+
+        self.assertEqual([row['samples'] for row in page['results']], [2, 2, 2])
+        self.assertEqual(page['results'][1], {
+            'timestamp': '2024-03-01T01:00:00+00:00', 'samples': 2,
+            'temp_min': 2.0, 'temp_max': 3.0, 'temp_avg': 2.5,
+            'humidity_avg': 50.0, 'wind_speed_avg': 4.0, 'pressure_avg': 1015.0,
+        })
+
+    def test_daily_buckets_paginate_by_bucket(self):
+        query = HistoryQuery('New York', 'US', START, START + timedelta(days=2), 'day')
+
+        first = query.page(1)
+        second = query.page(1, decode_cursor(first['next']))
+
+        self.assertEqual(first['results'][0]['temp_max'], 47.0)
+        self.assertEqual(second['results'][0]['temp_min'], 48.0)
+        self.assertIsNone(second['next'])
+
+    def test_stream_matches_a_single_page(self):
+        query = HistoryQuery('New York', 'US', START, START + timedelta(days=2))
+
+        streamed = json.loads(b''.join(query.stream(chunk_size=7)))
+
+        self.assertEqual(streamed, query.page(1000))
+
+    def test_unknown_resolution(self):
+        with self.assertRaises(ValueError):
+            HistoryQuery('New York', 'US', START, START, 'minute')
+
+
+class WeatherHistoryViewTestCase(TestCase):
+    def setUp(self):
+        reset_rate_limits()
+        for i in range(6):
+            add_snapshot(START + timedelta(hours=i), float(i), 'New York', 'US')
+
+    def test_page_with_next_cursor(self):
+        url = reverse('weather_history')
+        response = self.client.get(url, {'city': 'nyc', 'start': '2024-03-01', 'end': '2024-03-01', 'limit': 4})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['city'], data['country'], data['resolution']), ('New York', 'US', 'raw'))
+        self.assertEqual(len(data['results']), 4)
+        self.assertNotIn('forecast', data['results'][0])
+
+        response = self.client.get(url, {'city': 'nyc', 'start': '2024-03-01', 'end': '2024-03-01', 'cursor': data['next']})
+        self.assertEqual([row['temperature'] for row in response.json()['results']], [4.0, 5.0])
+        self.assertIsNone(response.json()['next'])
+
+    def test_etag_revalidation(self):
+        url = reverse('weather_history')
+        params = {'city': 'New York', 'start': '2024-03-01', 'end': '2024-03-02', 'resolution': 'day'}
+        response = self.client.get(url, params)
+
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_stream_is_gzipped(self):
+        response = self.client.get(
+            reverse('weather_history'),
+            {'city': 'New York', 'start': '2024-03-01', 'end': '2024-03-02', 'stream': '1'},
+            HTTP_ACCEPT_ENCODING='gzip',
+        )
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    async def test_stream_is_async_under_asgi(self):
+        response = await self.async_client.get(
+            reverse('weather_history'), {'city': 'New York', 'start': '2024-03-01', 'end': '2024-03-02', 'stream': '1'},
+        )
+
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([row['temperature'] for row in json.loads(body)['results']], [0.0, 1.0, 2.0, 3.0, 4.0, 5.0])
+
+    def test_invalid_parameters(self):
+        url = reverse('weather_history')
+        for params in (
+            {},
+            {'city': 'New York', 'start': 'soon'},
+            {'city': 'New York', 'start': '2024-03-02', 'end': '2024-03-01'},
+            {'city': 'New York', 'limit': 'all'},
+            {'city': 'New York', 'resolution': 'minute'},
+            {'city': 'New York', 'cursor': '!!'},
+        ):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# serve a couple of requests in a fresh interpreter and report what got loaded
+SCRIPT = '''
+import json, sys
+import django
+django.setup()
+from django.conf import settings
+from django.test import Client
+client = Client(HTTP_HOST='localhost')
+print(json.dumps({
+    'apps': settings.INSTALLED_APPS,
+    'middleware': settings.MIDDLEWARE,
+    'suggest': client.get('/api/cities/suggest/', {'q': 'par'}).status_code,
+    'admin': client.get('/admin/').status_code,
+    'genai': 'google.generativeai' in sys.modules,
+    'httpx': 'httpx' in sys.modules,
+}))
+'''
+
+
+class LeanStartupTestCase(SimpleTestCase):
+    def run_app(self, **env):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='weather_project.settings', **env)
+        output = subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+        return json.loads(output.stdout.splitlines()[-1])
+
+    def test_sdks_are_not_imported_by_weather_requests(self):
+        result = self.run_app(WEATHER_LEAN_API='False')
+
+        self.assertEqual(result['suggest'], 200)
+        self.assertFalse(result['genai'])
+        self.assertFalse(result['httpx'])
+        self.assertIn('django.contrib.admin', result['apps'])
+
+    def test_lean_profile_drops_unused_apps_and_middleware(self):
+        result = self.run_app(WEATHER_LEAN_API='True')
+
+        self.assertEqual(result['suggest'], 200)
+        self.assertEqual(result['admin'], 404)
+        for app in ('django.contrib.admin', 'django.contrib.sessions', 'django.contrib.messages', 'rest_framework'):
+            self.assertNotIn(app, result['apps'])
+        self.assertNotIn('django.contrib.sessions.middleware.SessionMiddleware', result['middleware'])
+        self.assertIn('weather_api.ratelimit.RateLimitMiddleware', result['middleware'])
@@ -0,0 +1,91 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from .metrics import Histogram, registry, server_timing, span
+from .ratelimit import reset_rate_limits
+
+
+class HistogramTestCase(SimpleTestCase):
+    def test_quantiles_are_interpolated_within_buckets(self):
+        histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+        for _ in range(50):
+            histogram.observe(0.005)
+        for _ in range(50):
+            histogram.observe(0.05)
+
+        cumulative, total, count = histogram.snapshot()
+        self.assertEqual((cumulative, count), ([50, 100, 100, 100], 100))
+        self.assertAlmostEqual(total, 2.75)
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.01)
+        self.assertAlmostEqual(histogram.quantile(0.75), 0.055)
+        self.assertEqual(Histogram().quantile(0.99), 0.0)
+
+    def test_bucket_bounds_are_inclusive(self):
+        histogram = Histogram(buckets=(0.01, 0.1))
+        histogram.observe(0.01)
+        histogram.observe(5)
+
+        self.assertEqual(histogram.snapshot()[0], [1, 1, 2])
+
+    def test_server_timing_adds_up_repeated_stages(self):
+        header = server_timing([('upstream.openweathermap', 0.1), ('parse', 0.002), ('upstream.openweathermap', 0.05)], 0.2)
+
+        self.assertEqual(header, 'upstream.openweathermap;dur=150.0, parse;dur=2.0, total;dur=200.0')
+
+
+class MetricsEndpointTestCase(TestCase):
+    def setUp(self):
+        registry.clear()
+        reset_rate_limits()
+        cache.clear()
+
+    def test_requests_are_timed_per_endpoint(self):
+        self.client.get(reverse('city_suggest'), {'q': 'par'})
+        with span('serialize'):
+            pass
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE weather_request_duration_seconds histogram', text)
+        self.assertIn('weather_request_duration_seconds_count{endpoint="city_suggest",method="GET",status="2xx"} 1', text)
+        self.assertIn('weather_stage_duration_seconds_bucket{stage="serialize",le="+Inf"} 1', text)
+        self.assertIn('weather_upstream_circuit_open{upstream="openweathermap"} 0', text)
+        self.assertIn('weather_cache_events_total{cache="forecast",event="hits"}', text)
+        self.assertIn('weather_snapshot_queue_depth 0', text)
+
+    def test_json_percentiles(self):
+        self.client.get(reverse('city_suggest'), {'q': 'par'})
+
+        data = self.client.get(reverse('metrics'), {'format': 'json'}).json()
+
+        row = data['latency_ms']['weather_request_duration_seconds'][0]
+        self.assertEqual((row['endpoint'], row['count']), ('city_suggest', 1))
+        self.assertLessEqual(row['p50'], row['p99'])
+        self.assertIn('openweathermap', data['upstream'])
+
+    def test_server_timing_is_opt_in(self):
+        url = reverse('weather_cache_stats')
+        self.assertNotIn('Server-Timing', self.client.get(url))
+
+        response = self.client.get(url, HTTP_X_SERVER_TIMING='1')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=\d+\.\d$')
+
+        with override_settings(WEATHER_METRICS={'SERVER_TIMING': False}):
+            self.assertNotIn('Server-Timing', self.client.get(url, HTTP_X_SERVER_TIMING='1'))
+
+    def test_browser_clients_can_opt_in_cross_origin(self):
+        origin = 'https://weather-front-end-sigma.vercel.app'
+        url = reverse('weather_cache_stats')
+        preflight = self.client.options(
+            url, HTTP_ORIGIN=origin, HTTP_ACCESS_CONTROL_REQUEST_METHOD='GET',
+            HTTP_ACCESS_CONTROL_REQUEST_HEADERS='x-server-timing, x-api-key',
+        )
+        allowed = preflight['Access-Control-Allow-Headers'].split(', ')
+        self.assertIn('x-server-timing', allowed)
+        self.assertIn('x-api-key', allowed)
+
+        response = self.client.get(url, HTTP_ORIGIN=origin, HTTP_X_SERVER_TIMING='1')
+        self.assertIn('server-timing', response['Access-Control-Expose-Headers'])
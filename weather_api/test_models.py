@@ -0,0 +1,68 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from unittest.mock import patch
+from .factories import processed_forecast
+from .models import Weather
+from .services import save_snapshot, save_snapshots, snapshot_fields, snapshot_hash, weather_hash
+from io import StringIO
+
+
+class WeatherContentHashTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_saved_row_hashes_like_its_forecast(self):
+        save_snapshot(processed_forecast())
+
+        weather = Weather.objects.get()
+        # The integer temperature comes back from the database as a float
+        self.assertEqual(weather.temperature, 20.0)
+        self.assertEqual(weather.content_hash, snapshot_hash(processed_forecast()))
+        self.assertEqual(weather_hash(weather), weather.content_hash)
+
+    def test_change_detection_uses_the_latest_hash(self):
+        save_snapshot(processed_forecast(temp=20))
+        save_snapshot(processed_forecast(temp=20))
+        save_snapshot(processed_forecast(temp=21))
+
+        self.assertEqual(Weather.objects.count(), 2)
+
+        # The per-process default cache is not trusted: the latest row's hash is read from the database
+        with self.assertNumQueries(1):
+            save_snapshot(processed_forecast(temp=21))
+        self.assertEqual(Weather.objects.count(), 2)
+
+    def test_shared_cache_keeps_the_latest_hash(self):
+        with patch('weather_api.services.latest_hash_cache', return_value=LocMemCache('shared', {})):
+            save_snapshot(processed_forecast(temp=20))
+            with self.assertNumQueries(0):
+                save_snapshot(processed_forecast(temp=20))
+        self.assertEqual(Weather.objects.count(), 1)
+
+    def test_batch_compares_against_the_newest_snapshot(self):
+        # the row with the higher id is not the latest one
+        latest, previous = processed_forecast(temp=21), processed_forecast(temp=20)
+        newest = Weather.objects.create(**snapshot_fields(latest), content_hash=snapshot_hash(latest))
+        older = Weather.objects.create(**snapshot_fields(previous), content_hash=snapshot_hash(previous))
+        Weather.objects.filter(pk=older.pk).update(timestamp=newest.timestamp - timedelta(hours=1))
+        other = processed_forecast('Other City', 5)
+
+        # one query per city plus the insert
+        with self.assertNumQueries(3):
+            created = save_snapshots([processed_forecast(temp=21), other])
+
+        self.assertEqual([weather.city for weather in created], ['Other City'])
+
+    def test_backfill_command(self):
+        Weather.objects.create(**snapshot_fields(processed_forecast(temp=20)))
+        Weather.objects.create(**snapshot_fields(processed_forecast(temp=21)))
+
+        out = StringIO()
+        call_command('backfill_weather_hashes', batch_size=1, stdout=out)
+
+        self.assertFalse(Weather.objects.filter(content_hash='').exists())
+        self.assertEqual(Weather.objects.order_by('id').last().content_hash, snapshot_hash(processed_forecast(temp=21)))
+        self.assertIn('2 rows updated', out.getvalue())
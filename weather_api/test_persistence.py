@@ -0,0 +1,77 @@
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from .factories import processed_forecast
+from .models import Weather
+from .persistence import SnapshotBatch, SnapshotWriter
+
+
+@override_settings(WEATHER_PERSISTENCE={'WRITE_BEHIND': True, 'QUEUE_SIZE': 10, 'ENQUEUE_TIMEOUT': 0})
+class SnapshotWriterTestCase(TestCase):
+    def setUp(self):
+        # No flusher thread, the test drains the queue itself
+        self.writer = SnapshotWriter(background=False)
+        cache.clear()
+
+    def test_enqueue_defers_writes_until_flush(self):
+        self.writer.enqueue(processed_forecast('Alpha'))
+        self.writer.enqueue(processed_forecast('Beta'))
+
+        self.assertEqual(Weather.objects.count(), 0)
+        self.assertEqual(self.writer.info()['queue_depth'], 2)
+
+        self.writer.flush()
+
+        self.assertEqual(Weather.objects.count(), 2)
+        info = self.writer.info()
+        self.assertEqual(info['queue_depth'], 0)
+        self.assertEqual(info['written'], 2)
+        self.assertEqual(info['flushes'], 1)
+
+    def test_consecutive_duplicates_are_dropped(self):
+        for temp in (20, 20, 21, 21, 20):
+            self.writer.enqueue(processed_forecast('Alpha', temp))
+        self.writer.flush()
+
+        self.assertEqual(list(Weather.objects.order_by('id').values_list('temperature', flat=True)), [20, 21, 20])
+        self.assertEqual(self.writer.info()['deduped'], 2)
+
+        # The same snapshot arriving in a later flush is dropped without touching the database
+        self.writer.enqueue(processed_forecast('Alpha', 20))
+        self.writer.flush()
+        self.assertEqual(Weather.objects.count(), 3)
+
+    def test_same_name_cities_are_tracked_apart(self):
+        self.writer.enqueue(processed_forecast('Paris'))
+        self.writer.flush()
+        self.writer.enqueue(processed_forecast('Paris', country='US'))
+        self.writer.flush()
+
+        # Paris, TC is still known to be unchanged
+        self.writer.enqueue(processed_forecast('Paris'))
+        with self.assertNumQueries(0):
+            self.writer.flush()
+        self.assertEqual(Weather.objects.count(), 2)
+
+    @override_settings(WEATHER_PERSISTENCE={'WRITE_BEHIND': True, 'QUEUE_SIZE': 1, 'ENQUEUE_TIMEOUT': 0})
+    def test_full_queue_applies_backpressure(self):
+        writer = SnapshotWriter(background=False)
+        writer.enqueue(processed_forecast('Alpha'))
+        writer.enqueue(processed_forecast('Beta'))
+
+        # The second snapshot did not fit and was written by the caller
+        self.assertEqual(list(Weather.objects.values_list('city', flat=True)), ['Beta'])
+        self.assertEqual(writer.info()['overflow'], 1)
+
+    def test_batch_is_queued_on_flush(self):
+        batch = SnapshotBatch(self.writer)
+        batch.add(processed_forecast('Alpha'))
+        batch.add(processed_forecast('Beta'))
+        self.assertEqual(self.writer.info()['queue_depth'], 0)
+
+        batch.flush()
+        self.assertEqual(self.writer.info()['queue_depth'], 2)
+
+    @override_settings(WEATHER_PERSISTENCE={'WRITE_BEHIND': False})
+    def test_synchronous_mode_writes_immediately(self):
+        self.writer.enqueue(processed_forecast('Alpha'))
+        self.assertEqual(Weather.objects.count(), 1)
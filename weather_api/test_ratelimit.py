@@ -0,0 +1,153 @@
+import time
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from unittest.mock import patch, MagicMock
+from .cache import forecast_cache
+from .ratelimit import CacheWindows, TokenBuckets, UpstreamBudget, reset_rate_limits
+from .services import weather_response
+from .upstream import CircuitBreaker, QuotaExceeded, UpstreamClient, UpstreamUnavailable
+
+RULES = {'city_suggest': (60, 2)}
+
+
+class TokenBucketsTestCase(SimpleTestCase):
+    def test_burst_then_refill(self):
+        buckets = TokenBuckets(10)
+
+        self.assertEqual([buckets.take('a', 60, 2, now=0)[0] for _ in range(3)], [True, True, False])
+        # 60 per minute: one token per second
+        self.assertEqual(buckets.take('a', 60, 2, now=0.5), (False, 0.5))
+        self.assertTrue(buckets.take('a', 60, 2, now=1.0)[0])
+        # other clients have their own bucket
+        self.assertTrue(buckets.take('b', 60, 2, now=1.0)[0])
+
+    def test_least_recent_clients_are_dropped(self):
+        buckets = TokenBuckets(2)
+        for key in 'abc':
+            buckets.take(key, 60, 1, now=0)
+
+        # "a" was forgotten and starts with a full bucket again
+        self.assertTrue(buckets.take('a', 60, 1, now=0)[0])
+        self.assertFalse(buckets.take('c', 60, 1, now=0)[0])
+
+
+class RateLimitMiddlewareTestCase(TestCase):
+    def setUp(self):
+        reset_rate_limits()
+        cache.clear()
+
+    def get(self, **extra):
+        return self.client.get(reverse('city_suggest'), {'q': 'par'}, **extra)
+
+    @override_settings(WEATHER_RATE_LIMITS={'RULES': RULES})
+    def test_requests_over_the_burst_get_429(self):
+        self.assertEqual([self.get().status_code for _ in range(3)], [200, 200, 429])
+
+        response = self.get()
+        self.assertEqual(response.json(), {'error': 'Too many requests, please slow down.'})
+        self.assertEqual(response['Retry-After'], '1')
+        # routes without a rule are not limited
+        self.assertEqual(self.client.get(reverse('weather_cache_stats')).status_code, 200)
+
+    @override_settings(WEATHER_RATE_LIMITS={'RULES': RULES, 'API_KEYS': ['secret'], 'API_KEY_MULTIPLIER': 2})
+    def test_known_api_keys_get_their_own_larger_bucket(self):
+        self.get(), self.get()
+        self.assertEqual(self.get().status_code, 429)
+
+        statuses = [self.get(HTTP_X_API_KEY='secret').status_code for _ in range(5)]
+        self.assertEqual(statuses, [200, 200, 200, 200, 429])
+        # unknown keys are limited by address
+        self.assertEqual(self.get(HTTP_X_API_KEY='guess').status_code, 429)
+
+    @override_settings(WEATHER_RATE_LIMITS={'RULES': RULES, 'BACKEND': 'default'})
+    def test_shared_backend(self):
+        self.assertEqual([self.get().status_code for _ in range(3)], [200, 200, 429])
+
+    @override_settings(WEATHER_RATE_LIMITS={'RULES': RULES, 'ENABLED': False})
+    def test_disabled(self):
+        self.assertEqual({self.get().status_code for _ in range(5)}, {200})
+
+
+@override_settings(
+    WEATHER_RATE_LIMITS={'BUDGETS': {'test': {'PER_MINUTE': 10, 'PER_DAY': 100}}, 'LOW_WATER': 0.15},
+    WEATHER_CACHE={'TTL': 0, 'STALE_TTL': 0, 'MAX_ENTRIES': 8, 'BACKEND': None},
+)
+class UpstreamBudgetTestCase(SimpleTestCase):
+    def setUp(self):
+        reset_rate_limits()
+        forecast_cache.clear()
+        self.budget = UpstreamBudget('test')
+
+    def test_spend_until_the_minute_budget_is_gone(self):
+        self.assertTrue(all(self.budget.spend() for _ in range(8)))
+        self.assertAlmostEqual(self.budget.remaining(), 0.2)
+        self.assertFalse(self.budget.low())
+
+        self.budget.spend(), self.budget.spend()
+        self.assertTrue(self.budget.low())
+        self.assertFalse(self.budget.spend())
+        self.assertEqual(self.budget.info(), {'per_minute': {'limit': 10, 'used': 10}, 'per_day': {'limit': 100, 'used': 10}})
+
+    @override_settings(WEATHER_RATE_LIMITS={'BUDGETS': {'test': {'PER_MINUTE': 10}}, 'BACKEND': 'default', 'LOW_WATER': 0.15})
+    async def test_async_spend_does_not_block_on_the_shared_backend(self):
+        await cache.aclear()
+        # the sync store methods would block the event loop on a network cache
+        with patch.object(CacheWindows, 'hit', side_effect=AssertionError('blocking cache call')):
+            self.assertTrue(all([await self.budget.aspend() for _ in range(9)]))
+            self.assertTrue(await self.budget.alow())
+            self.assertTrue(await self.budget.aspend())
+            self.assertFalse(await self.budget.aspend())
+        self.assertEqual(self.budget.info(), {'per_minute': {'limit': 10, 'used': 10}})
+
+    @patch('requests.Session.request')
+    def test_client_raises_quota_exceeded_without_calling(self, mock_request):
+        client = UpstreamClient('test', 'http://upstream.test')
+        mock_request.return_value = MagicMock(status_code=200)
+        for _ in range(10):
+            client.get('/forecast')
+
+        with self.assertRaises(QuotaExceeded):
+            client.get('/forecast')
+        self.assertEqual(mock_request.call_count, 10)
+        self.assertEqual(client.info()['over_budget'], 1)
+
+    @override_settings(UPSTREAM_HTTP={'RETRIES': 2, 'BACKOFF': 0, 'BACKOFF_MAX': 0})
+    @patch('requests.Session.request')
+    def test_every_retry_spends_budget(self, mock_request):
+        client = UpstreamClient('test', 'http://upstream.test')
+        mock_request.return_value = MagicMock(status_code=429, headers={})
+        for _ in range(3):
+            with self.assertRaises(UpstreamUnavailable):
+                client.get('/forecast')
+        self.assertEqual(mock_request.call_count, 9)
+
+        # the 10th attempt of the minute is the last one the budget allows, its retry is not made
+        with self.assertRaises(QuotaExceeded):
+            client.get('/forecast')
+        self.assertEqual(mock_request.call_count, 10)
+
+    def test_spent_budget_keeps_the_half_open_trial(self):
+        client = UpstreamClient('test', 'http://upstream.test')
+        client.breaker.opened_at = time.monotonic() - 3600
+        for _ in range(10):
+            self.budget.spend()
+
+        with self.assertRaises(QuotaExceeded):
+            client.get('/forecast')
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_low_budget_serves_expired_forecasts(self):
+        forecast_cache.set('city:paris', {'city': 'Paris'})
+        loader = MagicMock(return_value={'city': 'Paris', 'fresh': True})
+
+        with patch('weather_api.services.openweathermap.budget', self.budget):
+            # expired entries are reloaded while the budget lasts...
+            self.assertEqual(weather_response('city:paris', loader), ({'city': 'Paris', 'fresh': True}, 200))
+            for _ in range(9):
+                self.budget.spend()
+            # ...and served as they are once it runs low
+            self.assertEqual(weather_response('city:paris', loader)[0], {'city': 'Paris', 'fresh': True})
+
+        self.assertEqual(loader.call_count, 1)
@@ -0,0 +1,73 @@
+import gzip
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from .factories import FORECAST, add_snapshot
+from .models import Weather, WeatherDailySummary
+from .retention import purge_snapshots, retention_cutoff, rollup_snapshots
+
+NOW = datetime(2024, 6, 15, 12, 30, tzinfo=timezone.utc)
+
+
+class RetentionTestCase(TestCase):
+    def setUp(self):
+        self.cutoff = retention_cutoff(30, now=NOW)
+        old_day = datetime(2024, 5, 1, tzinfo=timezone.utc)
+        add_snapshot(old_day + timedelta(hours=1), 10.0, 'Paris', 'FR', humidity=40)
+        add_snapshot(old_day + timedelta(hours=13), 20.0, 'Paris', 'FR', humidity=60)
+        add_snapshot(old_day + timedelta(hours=2), 5.0, 'Lyon', 'FR')
+        add_snapshot(old_day + timedelta(days=3), 15.0, 'Paris', 'FR')
+        add_snapshot(self.cutoff + timedelta(hours=1), 25.0, 'Paris', 'FR')
+
+    def test_cutoff_is_the_start_of_a_utc_day(self):
+        self.assertEqual(self.cutoff, datetime(2024, 5, 16, tzinfo=timezone.utc))
+
+    def test_rollup_aggregates_per_city_and_day(self):
+        self.assertEqual(rollup_snapshots(self.cutoff), 3)
+
+        summary = WeatherDailySummary.objects.get(city='Paris', date=date(2024, 5, 1))
+        self.assertEqual(summary.samples, 2)
+        self.assertEqual((summary.temp_min, summary.temp_max, summary.temp_avg), (10.0, 20.0, 15.0))
+        self.assertEqual((summary.humidity_min, summary.humidity_max, summary.humidity_avg), (40, 60, 50.0))
+        self.assertEqual(summary.pressure_avg, 1015.0)
+        # rows inside the retention window are left alone
+        self.assertFalse(WeatherDailySummary.objects.filter(date__gte=self.cutoff.date()).exists())
+
+    def test_rollup_keeps_existing_summaries(self):
+        rollup_snapshots(self.cutoff)
+        # an interrupted purge left one row of the day behind
+        Weather.objects.filter(city='Paris', temperature=20.0).delete()
+
+        rollup_snapshots(self.cutoff)
+
+        self.assertEqual(WeatherDailySummary.objects.get(city='Paris', date=date(2024, 5, 1)).samples, 2)
+        self.assertEqual(WeatherDailySummary.objects.count(), 3)
+
+    def test_purge_deletes_old_rows_in_batches(self):
+        sleeps = []
+        deleted = purge_snapshots(self.cutoff, 3, pause=0.5, sleep=sleeps.append)
+
+        self.assertEqual(deleted, 4)
+        self.assertEqual(list(Weather.objects.values_list('temperature', flat=True)), [25.0])
+        self.assertEqual(sleeps, [0.5])
+
+    def test_command_archives_deleted_rows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'weather.jsonl.gz')
+            out = StringIO()
+            # every row is older than 30 days from today
+            call_command('rollup_weather_history', days=30, batch_size=2, archive=path, stdout=out)
+            with gzip.open(path) as f:
+                rows = [json.loads(line) for line in f]
+
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['temperature'], 10.0)
+        self.assertEqual(rows[0]['forecast'], FORECAST)
+        self.assertFalse(Weather.objects.exists())
+        self.assertEqual(WeatherDailySummary.objects.count(), 4)
+        self.assertIn('5 rows deleted', out.getvalue())
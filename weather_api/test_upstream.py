@@ -0,0 +1,55 @@
+from django.test import SimpleTestCase, override_settings
+from unittest.mock import patch, MagicMock
+from .upstream import CircuitBreaker, UpstreamClient, UpstreamUnavailable
+import requests
+
+
+def make_response(status_code):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = {}
+    return response
+
+
+@override_settings(UPSTREAM_HTTP={'RETRIES': 2, 'BACKOFF': 0, 'BACKOFF_MAX': 0, 'BREAKER_THRESHOLD': 2, 'BREAKER_RESET': 30})
+class UpstreamClientTestCase(SimpleTestCase):
+    def setUp(self):
+        self.client = UpstreamClient('test', 'http://upstream.test')
+
+    @patch('requests.Session.request')
+    def test_retries_server_errors_then_succeeds(self, mock_get):
+        mock_get.side_effect = [make_response(503), make_response(429), make_response(200)]
+
+        response = self.client.get('/forecast', params={'q': 'Test City'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(self.client.info()['retries'], 2)
+        # Every call carries a connect/read timeout
+        self.assertIn('timeout', mock_get.call_args.kwargs)
+
+    @patch('requests.Session.request')
+    def test_client_errors_are_not_retried(self, mock_get):
+        mock_get.return_value = make_response(404)
+
+        self.assertEqual(self.client.get('/forecast').status_code, 404)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+
+    @patch('requests.Session.request', side_effect=requests.ConnectionError('refused'))
+    def test_circuit_opens_and_fails_fast(self, mock_get):
+        with self.assertLogs('weather_api.upstream', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(UpstreamUnavailable):
+                    self.client.get('/forecast')
+        calls = mock_get.call_count
+
+        with self.assertRaises(UpstreamUnavailable):
+            self.client.get('/forecast')
+
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(mock_get.call_count, calls)
+        self.assertEqual(self.client.info()['rejected'], 1)
+
+    def test_session_is_reused(self):
+        self.assertIs(self.client.session, self.client.session)
@@ -1,23 +1,38 @@
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
 from django.conf import settings
-from unittest.mock import patch, MagicMock
-from .views import WeatherView
+from django.core.cache import cache
+from unittest.mock import ANY, patch, MagicMock
+from .views import WeatherView, BatchWeatherView, GenerateWeatherSummary, GetWeatherByCoordinates
 from .models import Weather
+from .persistence import SnapshotWriter
+from .cache import forecast_cache
+from .geo import get_point_index
+from .ratelimit import reset_rate_limits
+from .summaries import summary_cache, summary_contexts
+from .upstream import UpstreamUnavailable
+from .serialization import dumps
+from .factories import forecast_response, processed_forecast
+import gzip
 import json
 
+# Save snapshots in the request so the assertions can see them
+@override_settings(WEATHER_PERSISTENCE={'WRITE_BEHIND': False})
 class WeatherViewTestCase(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
         self.view = WeatherView.as_view()
+        reset_rate_limits()
         self.api_key = 'test_api_key'
         settings.OPENWEATHERMAP_API_KEY = self.api_key
+        forecast_cache.clear()
+        cache.clear()
 
-    @patch('requests.get')
+    @patch('requests.Session.request')
     def test_get_weather_data_success(self, mock_get):
         # Mock the API response
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             'city': {'name': 'Test City', 'country': 'TC'},
             'list': [
                 {
@@ -27,7 +42,7 @@ class WeatherViewTestCase(TestCase):
                     'dt_txt': '2024-03-01 12:00:00'
                 }
             ] * 5  # Repeat the same data 5 times for simplicity
-        }
+        }).encode()
         mock_get.return_value = mock_response
 
         # Make a GET request to the view
@@ -48,10 +63,10 @@ class WeatherViewTestCase(TestCase):
 
         # Check if the weather data was saved to the database
         saved_weather = Weather.objects.first()
-        self.assertIsNotNull(saved_weather)
+        self.assertIsNotNone(saved_weather)
         self.assertEqual(saved_weather.city, 'Test City')
 
-    @patch('requests.get')
+    @patch('requests.Session.request')
     def test_get_weather_data_failure(self, mock_get):
         # Mock a failed API response
         mock_response = MagicMock()
@@ -71,12 +86,47 @@ class WeatherViewTestCase(TestCase):
         # Check if the error message is correct
         self.assertEqual(data['error'], 'Unable to fetch weather data')
 
+    @patch('requests.Session.request')
+    def test_compact_mode(self, mock_get):
+        mock_get.return_value = forecast_response(slots=1)
+
+        full = json.loads(self.view(self.factory.get('/weather/?city=Test City')).content)
+        compact = json.loads(self.view(self.factory.get('/weather/?city=Test City&compact=1')).content)
+
+        self.assertEqual(compact['current'], full['current'])
+        self.assertEqual(compact['forecast']['date'], ['2024-03-01'])
+        self.assertEqual(compact['forecast']['temp_max'], [22])
+        self.assertEqual(mock_get.call_count, 1)
+
+    @override_settings(WEATHER_CACHE={'TTL': 600, 'STALE_TTL': 1800, 'MAX_ENTRIES': 8, 'BACKEND': None})
+    @patch('weather_api.conditional.dumps', wraps=dumps)
+    @patch('requests.Session.request')
+    def test_conditional_requests(self, mock_get, mock_dumps):
+        mock_get.return_value = forecast_response(slots=1)
+
+        response = self.view(self.factory.get('/weather/?city=Test City'))
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertRegex(response['Cache-Control'], r'^public, max-age=(599|600), stale-while-revalidate=1800$')
+
+        # A matching validator gets an empty 304 and the body is not encoded again
+        not_modified = self.view(self.factory.get('/weather/?city=Test City', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], etag)
+        self.assertEqual(mock_dumps.call_count, 1)
+
+        compact = self.view(self.factory.get('/weather/?city=Test City&compact=1', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(compact.status_code, 200)
+        self.assertNotEqual(compact['ETag'], etag)
+
     def test_default_city(self):
         # Test that the default city is New York if no city is provided
-        with patch('requests.get') as mock_get:
+        with patch('requests.Session.request') as mock_get:
             mock_response = MagicMock()
             mock_response.status_code = 200
-            mock_response.json.return_value = {
+            mock_response.content = json.dumps({
                 'city': {'name': 'New York', 'country': 'US'},
                 'list': [
                     {
@@ -86,7 +136,7 @@ class WeatherViewTestCase(TestCase):
                         'dt_txt': '2024-03-01 12:00:00'
                     }
                 ] * 5
-            }
+            }).encode()
             mock_get.return_value = mock_response
 
             request = self.factory.get('/weather/')  # No city parameter
@@ -94,4 +144,249 @@ class WeatherViewTestCase(TestCase):
 
             self.assertEqual(response.status_code, 200)
             data = json.loads(response.content)
-            self.assertEqual(data['city'], 'New York')
\ No newline at end of file
+            self.assertEqual(data['city'], 'New York')
+
+    @patch('requests.Session.request')
+    def test_repeated_city_served_from_cache(self, mock_get):
+        mock_get.return_value = forecast_response()
+
+        # Differently formatted queries for the same city share one cache entry
+        first = self.view(self.factory.get('/weather/?city=Test City'))
+        second = self.view(self.factory.get('/weather/?city=  test   city'))
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(json.loads(first.content), json.loads(second.content))
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(forecast_cache.info()['hits'], 1)
+
+    @patch('weather_api.services.fetch_forecast', side_effect=UpstreamUnavailable('openweathermap circuit is open'))
+    def test_provider_unavailable_without_cached_data(self, mock_fetch):
+        response = self.view(self.factory.get('/weather/?city=Test City'))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('error', json.loads(response.content))
+
+
+# Save snapshots in the request so the assertions can see them
+@override_settings(WEATHER_PERSISTENCE={'WRITE_BEHIND': False})
+class BatchWeatherViewTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = BatchWeatherView.as_view()
+        reset_rate_limits()
+        forecast_cache.clear()
+        get_point_index().clear()
+        cache.clear()
+
+    def fake_forecast(self, **query):
+        name = query.get('q') or 'Point'
+        return forecast_response(name, status_code=404 if name == 'Nowhere' else 200)
+
+    @patch('weather_api.services.fetch_forecast')
+    def test_batch_post_mixes_successes_and_errors(self, mock_fetch):
+        mock_fetch.side_effect = self.fake_forecast
+        body = {'cities': ['Alpha', 'Beta', 'Nowhere'], 'coordinates': [[40.7128, -74.006], ['north', 'pole']]}
+
+        request = self.factory.post('/weather/batch/', data=json.dumps(body), content_type='application/json')
+        response = self.view(request)
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['count'], 5)
+        self.assertEqual([item['status'] for item in data['results']], [200, 200, 400, 200, 400])
+        self.assertEqual(data['results'][0]['data']['city'], 'Alpha')
+        self.assertEqual(data['results'][3]['query'], {'lat': 40.71, 'lon': -74.01})
+        # One row per successfully fetched location, written in a single bulk insert
+        self.assertEqual(sorted(Weather.objects.values_list('city', flat=True)), ['Alpha', 'Beta', 'Point'])
+
+    @patch('weather_api.services.fetch_forecast')
+    def test_batch_get_reuses_cache_and_skips_unchanged_snapshots(self, mock_fetch):
+        mock_fetch.side_effect = self.fake_forecast
+
+        self.view(self.factory.get('/weather/batch/?city=Alpha&city=Beta'))
+        response = self.view(self.factory.get('/weather/batch/?city=alpha&coords=40.7128,-74.006'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_fetch.call_count, 3)
+        self.assertEqual(Weather.objects.count(), 3)
+
+    @patch('weather_api.services.fetch_forecast')
+    def test_batch_is_compressed(self, mock_fetch):
+        mock_fetch.side_effect = self.fake_forecast
+        cities = '&'.join(f'city=City{n}' for n in range(5))
+
+        response = self.view(self.factory.get(f'/weather/batch/?{cities}', HTTP_ACCEPT_ENCODING='gzip'))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['count'], 5)
+
+    def test_batch_requires_locations(self):
+        response = self.view(self.factory.post('/weather/batch/', data='{}', content_type='application/json'))
+        self.assertEqual(response.status_code, 400)
+
+        response = self.view(self.factory.post('/weather/batch/', data='not json', content_type='application/json'))
+        self.assertEqual(response.status_code, 400)
+
+    @patch('weather_api.services.fetch_forecast')
+    def test_batch_rejects_malformed_locations(self, mock_fetch):
+        mock_fetch.side_effect = self.fake_forecast
+        for body in ({'cities': 'Paris'}, {'coordinates': {'lat': 1, 'lon': 2}}):
+            request = self.factory.post('/weather/batch/', data=json.dumps(body), content_type='application/json')
+            self.assertEqual(self.view(request).status_code, 400)
+
+        body = {'cities': [{'a': 1}, 42, 'Alpha']}
+        request = self.factory.post('/weather/batch/', data=json.dumps(body), content_type='application/json')
+        data = json.loads(self.view(request).content)
+
+        self.assertEqual([item['status'] for item in data['results']], [400, 400, 200])
+        self.assertEqual(mock_fetch.call_count, 1)
+
+
+class GenerateWeatherSummaryTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = GenerateWeatherSummary.as_view()
+        reset_rate_limits()
+        summary_cache.clear()
+        cache.clear()
+        self.context = {
+            'city': 'Test City', 'country': 'TC',
+            'current': {'temp_c': 20, 'description': 'Clear sky', 'wind_speed': 5, 'humidity': 50, 'pressure': 1015},
+            'forecast': [{'date': '2024-03-01', 'temp_min': 18, 'temp_max': 22, 'description': 'Clear sky'}],
+        }
+        summary_contexts.save(self.context)
+
+    @patch('weather_api.views.get_model')
+    def test_summary_is_cached_per_prompt(self, mock_get_model):
+        mock_get_model.return_value.generate_content.return_value.text = 'Sunny all week.\nEnjoy it.'
+
+        first = self.view(self.factory.get('/weather/generate-weather-summary/'))
+        second = self.view(self.factory.get('/weather/generate-weather-summary/'))
+
+        self.assertEqual(json.loads(first.content), {'summary': 'Sunny all week. Enjoy it.'})
+        self.assertEqual(json.loads(second.content), json.loads(first.content))
+        mock_get_model.return_value.generate_content.assert_called_once()
+        self.assertEqual(summary_cache.info()['hits'], 1)
+
+        # A different forecast produces a different prompt and a new generation
+        self.context['current']['temp_c'] = 25
+        summary_contexts.save(self.context)
+        self.view(self.factory.get('/weather/generate-weather-summary/'))
+        self.assertEqual(mock_get_model.return_value.generate_content.call_count, 2)
+
+    @patch('weather_api.views.get_model')
+    def test_summary_uses_requested_city(self, mock_get_model):
+        mock_get_model.return_value.generate_content.return_value.text = 'Rainy.'
+        summary_contexts.save(dict(self.context, city='Other City', country='OC'), query='other  city')
+
+        self.view(self.factory.get('/weather/generate-weather-summary/?city=test city'))
+        self.view(self.factory.get('/weather/generate-weather-summary/?city=Other%20City'))
+        self.view(self.factory.get('/weather/generate-weather-summary/?city=Test%20City&country=tc'))
+
+        prompts = [call.args[0] for call in mock_get_model.return_value.generate_content.call_args_list]
+        self.assertEqual(len(prompts), 2)
+        self.assertIn('for Test City, TC.', prompts[0])
+        self.assertIn('for Other City, OC.', prompts[1])
+
+    @patch('weather_api.views.get_model')
+    def test_summary_falls_back_to_latest_snapshot(self, mock_get_model):
+        mock_get_model.return_value.generate_content.return_value.text = 'Windy.'
+        Weather.objects.create(
+            city='Paris', country='FR', temperature=12.5, description='light rain', humidity=80,
+            wind_speed=7.2, pressure=1008, forecast=self.context['forecast'],
+        )
+
+        response = self.view(self.factory.get('/weather/generate-weather-summary/?city=paris'))
+        self.assertEqual(json.loads(response.content), {'summary': 'Windy.'})
+        prompt = mock_get_model.return_value.generate_content.call_args.args[0]
+        self.assertIn('for Paris, FR. Current temperature: 12.5°C.', prompt)
+
+        response = self.view(self.factory.get('/weather/generate-weather-summary/?city=Lyon'))
+        self.assertEqual(response.status_code, 400)
+
+    # the front-end flow: geolocate, fetch by coordinates, then summarize data.city
+    @patch('weather_api.views.snapshot_writer')
+    @patch('weather_api.views.SnapshotBatch')
+    @patch('weather_api.services.fetch_forecast')
+    @patch('weather_api.views.get_model')
+    def test_summary_of_a_city_fetched_by_coordinates(self, mock_get_model, mock_fetch, mock_batch, mock_writer):
+        mock_get_model.return_value.generate_content.return_value.text = 'Mild.'
+        mock_fetch.side_effect = lambda **query: forecast_response(*{48.86: ('Paris', 'FR')}.get(query.get('lat'), ('London', 'GB')))
+        GetWeatherByCoordinates.as_view()(self.factory.get('/weather/coordinates/?lat=48.8566&lon=2.3522'))
+        BatchWeatherView.as_view()(self.factory.get('/weather/batch/?coords=51.5074,-0.1278'))
+
+        for city in ('Paris', 'London'):
+            response = self.view(self.factory.get(f'/weather/generate-weather-summary/?city={city}'))
+            self.assertEqual(json.loads(response.content), {'summary': 'Mild.'})
+        prompts = [call.args[0] for call in mock_get_model.return_value.generate_content.call_args_list]
+        self.assertIn('for Paris, FR.', prompts[0])
+        self.assertIn('for London, GB.', prompts[1])
+
+    def test_unknown_city_misses_are_cached(self):
+        Weather.objects.create(
+            city='Paris', country='FR', temperature=12.5, description='light rain', humidity=80,
+            wind_speed=7.2, pressure=1008, forecast=self.context['forecast'],
+        )
+
+        # one exact lookup, then the miss is remembered
+        with self.assertNumQueries(1) as queries:
+            self.assertIsNone(summary_contexts.get('Atlantis'))
+            self.assertIsNone(summary_contexts.get('Atlantis'))
+        self.assertNotIn('LIKE', queries.captured_queries[0]['sql'].upper())
+        self.assertEqual(summary_contexts.get('paris', 'fr')['city'], 'Paris')
+
+    @override_settings(WEATHER_PERSISTENCE={'WRITE_BEHIND': True, 'ENQUEUE_TIMEOUT': 0})
+    def test_misses_are_not_cached_while_snapshots_are_queued(self):
+        writer = SnapshotWriter(background=False)
+        writer.enqueue(processed_forecast('Lyon', country='FR'))
+
+        with patch('weather_api.summaries.snapshot_writer', writer):
+            self.assertIsNone(summary_contexts.get('Lyon'))
+            writer.flush()
+            self.assertEqual(summary_contexts.get('Lyon')['city'], 'Lyon')
+
+    @patch('weather_api.views.get_model')
+    def test_failed_generation_is_not_cached(self, mock_get_model):
+        mock_get_model.return_value.generate_content.side_effect = RuntimeError('quota exceeded')
+
+        response = self.view(self.factory.get('/weather/generate-weather-summary/'))
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(summary_cache.local), 0)
+
+    @patch('weather_api.views.get_model')
+    def test_stream_summary(self, mock_get_model):
+        mock_get_model.return_value.generate_content.return_value = [
+            MagicMock(text='Sunny all\n'), MagicMock(text='week.'),
+        ]
+
+        response = self.view(self.factory.get('/weather/generate-weather-summary/?stream=1'))
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body, (
+            'event: chunk\ndata: {"text": "Sunny all "}\n\n'
+            'event: chunk\ndata: {"text": "week."}\n\n'
+            'event: done\ndata: {"summary": "Sunny all week."}\n\n'
+        ))
+        mock_get_model.return_value.generate_content.assert_called_once_with(ANY, stream=True)
+
+        # The streamed summary is cached and replayed without another generation
+        response = self.view(self.factory.get('/weather/generate-weather-summary/?stream=1'))
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('event: done\ndata: {"summary": "Sunny all week."}', body)
+        mock_get_model.return_value.generate_content.assert_called_once()
+
+    @patch('weather_api.views.get_model')
+    def test_stream_summary_error(self, mock_get_model):
+        def chunks():
+            yield MagicMock(text='Sunny')
+            raise RuntimeError('quota exceeded')
+        mock_get_model.return_value.generate_content.return_value = chunks()
+
+        response = self.view(self.factory.get('/weather/generate-weather-summary/?stream=1'))
+
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.endswith('event: error\ndata: {"error": "quota exceeded"}\n\n'))
+        self.assertEqual(len(summary_cache.local), 0)
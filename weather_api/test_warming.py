@@ -0,0 +1,65 @@
+from django.test import SimpleTestCase, override_settings
+from django.core.cache import cache
+from .cache import ForecastCache
+from .warming import CacheWarmer, PopularityTracker, city_query, coordinates_query
+
+
+@override_settings(
+    WEATHER_CACHE={'TTL': 600, 'STALE_TTL': 600, 'MAX_ENTRIES': 8, 'BACKEND': None},
+    WEATHER_WARMING={'TOP_N': 2, 'ALWAYS': ['New York'], 'REFRESH_AHEAD': 120, 'MAX_CALLS_PER_MINUTE': 30},
+)
+class WarmingTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.tracker = PopularityTracker()
+        self.cache = ForecastCache('test')
+        self.sleeps = []
+        self.loaded = []
+        self.warmer = CacheWarmer(
+            lambda city: self.loaded.append(city) or {'city': city},
+            lambda lat, lon: self.loaded.append((lat, lon)) or {'city': 'Point'},
+            tracker=self.tracker, cache=self.cache, sleep=self.sleeps.append,
+        )
+
+    def test_top_ranks_keys_across_flushes(self):
+        for _ in range(3):
+            self.tracker.record(*city_query('Paris'))
+        self.tracker.record(*coordinates_query(40.71, -74.01))
+        self.tracker.flush()
+        self.tracker.record(*city_query('paris'))
+        self.tracker.record(*city_query('Lyon'))
+        self.tracker.flush()
+
+        top = self.tracker.top(2)
+        self.assertEqual(top[0], ('city:paris', {'city': 'Paris'}, 4))
+        self.assertEqual(top[1][2], 1)
+
+    def test_warm_refreshes_popular_keys_within_budget(self):
+        self.tracker.record(*city_query('Paris'))
+        self.tracker.record(*coordinates_query(40.71, -74.01))
+
+        result = self.warmer.warm()
+
+        self.assertEqual(result, {'checked': 3, 'refreshed': 3, 'skipped': 0, 'errors': 0})
+        self.assertEqual(self.loaded, ['New York,US', 'Paris', (40.71, -74.01)])
+        self.assertEqual(self.cache.get('city:paris'), {'city': 'Paris'})
+        # 30 calls per minute: two seconds between upstream calls
+        self.assertEqual(self.sleeps, [2.0, 2.0])
+
+    def test_fresh_keys_are_skipped(self):
+        self.tracker.record(*city_query('Paris'))
+        self.cache.set('city:paris', {'city': 'Paris'})
+
+        result = self.warmer.warm()
+
+        self.assertEqual(result['skipped'], 1)
+        self.assertEqual(self.loaded, ['New York,US'])
+
+    def test_failed_refresh_is_counted(self):
+        self.warmer.city_loader = lambda city: 1 / 0
+
+        with self.assertLogs('weather_api.warming', 'WARNING'):
+            result = self.warmer.warm()
+
+        self.assertEqual(result['errors'], 1)
+        self.assertIsNone(self.cache.get('city:new york,us'))
@@ -0,0 +1,417 @@
+import asyncio
+import json as jsonlib
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from .metrics import span
+from .ratelimit import UpstreamBudget
+
+logger = logging.getLogger(__name__)
+
+# Default client settings, overridable through settings.UPSTREAM_HTTP
+DEFAULTS = {
+    'POOL_SIZE': 10,             # keep-alive connections per host, per worker process
+    'ASYNC_POOL_SIZE': 100,      # concurrent connections per event loop for the async client
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 10,
+    'RETRIES': 2,                # extra attempts on 5xx/429 and connection errors
+    'BACKOFF': 0.25,             # base delay in seconds, doubled per attempt with full jitter
+    'BACKOFF_MAX': 2.0,
+    'BREAKER_THRESHOLD': 5,      # consecutive failures that open the circuit
+    'BREAKER_RESET': 30,         # seconds the circuit stays open before a trial call
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def get_upstream_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'UPSTREAM_HTTP', {}))
+    return config
+
+
+# base class for failures talking to an upstream provider
+class UpstreamError(Exception):
+    pass
+
+
+# raised when the provider cannot be reached or the circuit is open
+class UpstreamUnavailable(UpstreamError):
+    pass
+
+
+# raised instead of calling a provider whose per-minute or per-day budget is spent
+class QuotaExceeded(UpstreamUnavailable):
+    pass
+
+
+# closed -> open after N consecutive failures, half-open after the reset timeout
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    # returns False while the circuit is open; once half-open a single trial call
+    # is let through and the timer restarts so others keep failing fast
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+# per-call latency and status counters for one upstream
+class CallMetrics:
+    def __init__(self, window=1024):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+        self.rejected = 0
+        self.over_budget = 0
+        self.statuses = {}
+
+    def record(self, latency, status=None):
+        with self._lock:
+            self.calls += 1
+            self._latencies.append(latency)
+            if status is None:
+                self.errors += 1
+            else:
+                self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+    def incr(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            data = {
+                'calls': self.calls,
+                'retries': self.retries,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'over_budget': self.over_budget,
+                'statuses': dict(self.statuses),
+            }
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        data['latency_ms'] = {
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99),
+            'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        }
+        return data
+
+
+# pooled keep-alive HTTP client with timeouts, jittered retries and a circuit breaker
+class UpstreamClient:
+    def __init__(self, name, base_url, read_timeout=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.read_timeout = read_timeout
+        self.metrics = CallMetrics()
+        self.budget = UpstreamBudget(name)
+        self._breaker = None
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def breaker(self):
+        if self._breaker is None:
+            config = get_upstream_settings()
+            self._breaker = CircuitBreaker(config['BREAKER_THRESHOLD'], config['BREAKER_RESET'])
+        return self._breaker
+
+    # one session per worker process, recreated after a fork
+    @property
+    def session(self):
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    pool_size = get_upstream_settings()['POOL_SIZE']
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    # one httpx.AsyncClient per event loop, reused by every request served on that loop;
+    # httpx is only imported by the async paths so WSGI workers start without it
+    def async_client(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            config = get_upstream_settings()
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self._timeout(config)[1], connect=config['CONNECT_TIMEOUT']),
+                limits=httpx.Limits(
+                    max_connections=config['ASYNC_POOL_SIZE'],
+                    max_keepalive_connections=config['POOL_SIZE'],
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def _timeout(self, config):
+        return config['CONNECT_TIMEOUT'], self.read_timeout or config['READ_TIMEOUT']
+
+    def _backoff(self, attempt, response=None):
+        config = get_upstream_settings()
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), config['BACKOFF_MAX'])
+        return random.uniform(0, min(config['BACKOFF_MAX'], config['BACKOFF'] * 2 ** attempt))
+
+    # the budget is spent before the breaker lets the call through, so a QuotaExceeded does not
+    # use up the half-open trial; an open circuit is rejected first without spending budget
+    def _before_call(self):
+        if self.breaker.state == CircuitBreaker.OPEN:
+            self._reject()
+        self.spend_budget()
+        if not self.breaker.allow():
+            self._reject()
+
+    async def _abefore_call(self):
+        if self.breaker.state == CircuitBreaker.OPEN:
+            self._reject()
+        await self.aspend_budget()
+        if not self.breaker.allow():
+            self._reject()
+
+    def _reject(self):
+        self.metrics.incr('rejected')
+        raise UpstreamUnavailable(f'{self.name} circuit is open')
+
+    # count a call against the provider's quota budget, raising QuotaExceeded when it is spent
+    # (also used before the Gemini SDK calls, which do not go through this client)
+    def spend_budget(self):
+        if not self.budget.spend():
+            self.metrics.incr('over_budget')
+            raise QuotaExceeded(f'{self.name} call budget is spent')
+
+    async def aspend_budget(self):
+        if not await self.budget.aspend():
+            self.metrics.incr('over_budget')
+            raise QuotaExceeded(f'{self.name} call budget is spent')
+
+    # record a connection error, returning the delay before the next attempt
+    def _after_error(self, attempt, retries, latency, error):
+        self.metrics.record(latency)
+        logger.warning('%s call failed (attempt %d): %s', self.name, attempt + 1, error)
+        if attempt == retries:
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(f'{self.name} unreachable') from error
+        return self._backoff(attempt)
+
+    # record a response, returning the delay before the next attempt or None when done
+    def _after_response(self, attempt, retries, latency, path, response):
+        self.metrics.record(latency, response.status_code)
+        logger.debug('%s %s -> %s in %.1fms', self.name, path, response.status_code, latency * 1000)
+
+        if response.status_code in RETRY_STATUSES:
+            if attempt < retries:
+                return self._backoff(attempt, response)
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(f'{self.name} responded with {response.status_code}')
+
+        self.breaker.record_success()
+        return None
+
+    # call base_url + path, returning the final response (any status) or raising UpstreamUnavailable
+    def request(self, method, path, params=None, json=None):
+        with span(f'upstream.{self.name}'):
+            return self._request(method, path, params, json)
+
+    def _request(self, method, path, params=None, json=None):
+        config = get_upstream_settings()
+        self._before_call()
+
+        url = self.base_url + path
+        retries = config['RETRIES']
+        for attempt in range(retries + 1):
+            if attempt:
+                # every retry is a call against the provider's quota too
+                self.metrics.incr('retries')
+                self.spend_budget()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, params=params, json=json, timeout=self._timeout(config))
+            except requests.RequestException as e:
+                time.sleep(self._after_error(attempt, retries, time.perf_counter() - start, e))
+                continue
+
+            delay = self._after_response(attempt, retries, time.perf_counter() - start, path, response)
+            if delay is None:
+                return response
+            time.sleep(delay)
+
+    def get(self, path, params=None):
+        return self.request('GET', path, params=params)
+
+    # asyncio version of request() on the per-loop httpx client
+    async def arequest(self, method, path, params=None, json=None):
+        with span(f'upstream.{self.name}'):
+            return await self._arequest(method, path, params, json)
+
+    async def _arequest(self, method, path, params=None, json=None):
+        import httpx
+
+        config = get_upstream_settings()
+        await self._abefore_call()
+
+        url = self.base_url + path
+        retries = config['RETRIES']
+        client = self.async_client()
+        for attempt in range(retries + 1):
+            if attempt:
+                # every retry is a call against the provider's quota too
+                self.metrics.incr('retries')
+                await self.aspend_budget()
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, params=params, json=json)
+            except httpx.HTTPError as e:
+                await asyncio.sleep(self._after_error(attempt, retries, time.perf_counter() - start, e))
+                continue
+
+            delay = self._after_response(attempt, retries, time.perf_counter() - start, path, response)
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+
+    async def aget(self, path, params=None):
+        return await self.arequest('GET', path, params=params)
+
+    # stream the response body line by line (no retries once the stream has started)
+    async def astream_lines(self, method, path, params=None, json=None):
+        import httpx
+
+        await self._abefore_call()
+        start = time.perf_counter()
+        try:
+            async with self.async_client().stream(method, self.base_url + path, params=params, json=json) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    self._after_response(0, 0, time.perf_counter() - start, path, response)
+                    raise UpstreamError(f'{self.name} responded with {response.status_code}')
+                async for line in response.aiter_lines():
+                    yield line
+        except httpx.HTTPError as e:
+            self._after_error(0, 0, time.perf_counter() - start, e)
+        self.metrics.record(time.perf_counter() - start, 200)
+        self.breaker.record_success()
+
+    def info(self):
+        info = self.metrics.snapshot()
+        info['breaker'] = self.breaker.state
+        info['budget'] = self.budget.info()
+        return info
+
+
+# shared clients used by the views
+openweathermap = UpstreamClient(
+    'openweathermap',
+    getattr(settings, 'OPENWEATHERMAP_BASE_URL', 'http://api.openweathermap.org/data/2.5'),
+)
+gemini = UpstreamClient(
+    'gemini',
+    getattr(settings, 'GEMINI_BASE_URL', 'https://generativelanguage.googleapis.com/v1beta'),
+    read_timeout=60,
+)
+
+
+def forecast_params(query):
+    return dict(query, appid=settings.OPENWEATHERMAP_API_KEY, units='metric')
+
+
+# function to fetch the raw 5 day / 3 hour forecast, params: q=city or lat/lon
+def fetch_forecast(**query):
+    return openweathermap.get('/forecast', params=forecast_params(query))
+
+
+async def afetch_forecast(**query):
+    return await openweathermap.aget('/forecast', params=forecast_params(query))
+
+
+# function to generate text with Gemini over its REST API (used by the async summary view)
+async def agenerate_content(prompt, model='gemini-1.5-flash'):
+    response = await gemini.arequest(
+        'POST',
+        f'/models/{model}:generateContent',
+        params={'key': settings.GEMINI_API_KEY},
+        json={'contents': [{'parts': [{'text': prompt}]}]},
+    )
+    if response.status_code != 200:
+        raise UpstreamError(f'Gemini responded with {response.status_code}')
+    parts = response.json()['candidates'][0]['content']['parts']
+    return ''.join(part.get('text', '') for part in parts)
+
+
+# stream generated text from Gemini's server-sent events endpoint, chunk by chunk
+async def astream_content(prompt, model='gemini-1.5-flash'):
+    lines = gemini.astream_lines(
+        'POST',
+        f'/models/{model}:streamGenerateContent',
+        params={'key': settings.GEMINI_API_KEY, 'alt': 'sse'},
+        json={'contents': [{'parts': [{'text': prompt}]}]},
+    )
+    async for line in lines:
+        if not line.startswith('data:'):
+            continue
+        candidates = jsonlib.loads(line[5:]).get('candidates') or [{}]
+        parts = candidates[0].get('content', {}).get('parts', [])
+        text = ''.join(part.get('text', '') for part in parts)
+        if text:
+            yield text
@@ -1,9 +1,27 @@
+from django.conf import settings
 from django.urls import path
-from .views import WeatherView, GetWeatherByCoordinates, GenerateWeatherSummary
+from .views import (
+    WeatherView, GetWeatherByCoordinates, GenerateWeatherSummary, BatchWeatherView, CacheStatsView,
+    PersistenceStatsView, UpstreamStatsView, CitySuggestView, WeatherHistoryView, MetricsView,
+)
+from .async_views import AsyncWeatherView, AsyncGetWeatherByCoordinates, AsyncGenerateWeatherSummary
+
+# Under ASGI the async variants serve the same routes
+if settings.WEATHER_ASYNC_VIEWS:
+    WeatherView, GetWeatherByCoordinates, GenerateWeatherSummary = (
+        AsyncWeatherView, AsyncGetWeatherByCoordinates, AsyncGenerateWeatherSummary
+    )
 
 urlpatterns = [
     path('weather/', WeatherView.as_view(), name='weather_by_city'),
     path('weather/coordinates/', GetWeatherByCoordinates.as_view(), name='weather_by_coordinates'),
     path('weather/generate-weather-summary/', GenerateWeatherSummary.as_view(), name='generate_weather_summary'),
+    path('weather/history/', WeatherHistoryView.as_view(), name='weather_history'),
+    path('weather/batch/', BatchWeatherView.as_view(), name='weather_batch'),
+    path('weather/cache-stats/', CacheStatsView.as_view(), name='weather_cache_stats'),
+    path('weather/persistence-stats/', PersistenceStatsView.as_view(), name='weather_persistence_stats'),
+    path('weather/upstream-stats/', UpstreamStatsView.as_view(), name='weather_upstream_stats'),
+    path('cities/suggest/', CitySuggestView.as_view(), name='city_suggest'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 
 ]
@@ -1,79 +1,83 @@
-from django.http import JsonResponse
+import json
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views import View
-import requests
 from django.conf import settings
-from .models import Weather
-import google.generativeai as genai
 from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from .cache import forecast_cache, city_cache_key, coordinates_cache_key
+from .geo import snap_coordinates
+from .upstream import UpstreamUnavailable, gemini, openweathermap
+from .services import fetch_city_weather, fetch_coordinates_weather, weather_response
+from .persistence import SnapshotBatch, snapshot_writer
+from .forecast import compact_forecast
+from .serialization import dumps
+from .conditional import body_etag, conditional_json, encoded_payload, forecast_cache_headers
+from .gazetteer import canonical_city, get_city_index, get_gazetteer_settings
+from .history import HistoryQuery, decode_cursor, get_history_settings, history_city, parse_time
+from .warming import city_query, coordinates_query, popularity
+from .metrics import prometheus_family, prometheus_histograms, registry, span
+from .summaries import (
+    SUMMARY_MAX_LENGTH, SummaryFormatter, get_model, sse_event, summary_cache, summary_cache_key, summary_contexts,
+)
+
+
+# ?compact=1 asks for the forecast as columns instead of a list of days
+def compact_requested(request):
+    return request.GET.get('compact', '').lower() in ('1', 'true', 'yes')
+
+
+# function to serialize a weather payload with the fast encoder (compact when asked), with an
+# ETag, Last-Modified and Cache-Control following its forecast cache entry; a matching
+# If-None-Match gets a 304 without serializing the payload again
+def weather_json(request, processed_data, cache_key):
+    with span('serialize'):
+        if compact_requested(request):
+            body, etag = encoded_payload(processed_data, 'compact', compact_forecast)
+        else:
+            body, etag = encoded_payload(processed_data)
+    last_modified, cache_control = forecast_cache_headers(cache_key)
+    return conditional_json(request, body, etag, last_modified, cache_control)
 
-# In-memory storage for weather data
-weather_data_store = {}
 
 # endpoint for weather data: parameters: city: string 
 class WeatherView(View):
     def get(self, request):
         # Get the city from the request, default to New York
         city = request.GET.get('city', 'New York')
-        api_key = settings.OPENWEATHERMAP_API_KEY
-        
-        # Fetch weather data from OpenWeatherMap
-        url = f'http://api.openweathermap.org/data/2.5/forecast?q={city}&appid={api_key}&units=metric'
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Process the data into a more usable format
-            processed_data = {
-                'city': data['city']['name'],
-                'country': data['city']['country'],
-                'current': {
-                    'temp_c': data['list'][0]['main']['temp'],
-                    'description': data['list'][0]['weather'][0]['description'],
-                    'wind_speed': data['list'][0]['wind']['speed'],
-                    'humidity': data['list'][0]['main']['humidity'],
-                    'pressure': data['list'][0]['main']['pressure']
-                },
-                'forecast': [
-                    {
-                        'date': item['dt_txt'].split()[0],
-                        'temp_min': item['main']['temp_min'],
-                        'temp_max': item['main']['temp_max'],
-                        'description': item['weather'][0]['description']
-                    } for item in data['list'][::8]  # Get data for every 24 hours
-                ]
-            }
-            # Store the data in the in-memory dictionary for AI summary generation 
-            weather_data_store['latest'] = processed_data
-            
-            # Retrieve the last saved weather data for the city
-            last_saved_weather = Weather.objects.filter(city=processed_data['city']).order_by('-id').first()
-            
-            # Check if the last saved city matches the current one and the data is different
-            if not last_saved_weather or (
-                last_saved_weather.country != processed_data['country'] or
-                last_saved_weather.temperature != processed_data['current']['temp_c'] or
-                last_saved_weather.description != processed_data['current']['description'] or
-                last_saved_weather.humidity != processed_data['current']['humidity'] or
-                last_saved_weather.wind_speed != processed_data['current']['wind_speed'] or
-                last_saved_weather.pressure != processed_data['current']['pressure'] or
-                last_saved_weather.forecast != processed_data['forecast']
-            ):
-                # Save the new weather data if it is different
-                Weather.objects.create(
-                    city=processed_data['city'],
-                    country=processed_data['country'],
-                    temperature=processed_data['current']['temp_c'],
-                    description=processed_data['current']['description'],
-                    humidity=processed_data['current']['humidity'],
-                    wind_speed=processed_data['current']['wind_speed'],
-                    pressure=processed_data['current']['pressure'],
-                    forecast=processed_data['forecast'],
-                    timestamp=timezone.now()
-                )
-            return JsonResponse(processed_data)
-        else:
-            return JsonResponse({'error': 'Unable to fetch weather data'}, status=400)
+
+        # Resolve names and aliases ("nyc", "New York ") to one canonical query
+        try:
+            city = canonical_city(city)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # Count the request so popular cities are kept warm (see warming.py)
+        popularity.record(*city_query(city))
+
+        # Serve from the forecast cache, only a miss or a stale entry reaches OpenWeatherMap
+        cache_key = city_cache_key(city)
+        with span('forecast'):
+            processed_data, status = weather_response(cache_key, lambda: self.fetch_weather(city))
+        if status != 200:
+            return JsonResponse(processed_data, status=status)
+        return weather_json(request, processed_data, cache_key)
+
+    # function to fetch, process and persist the forecast for a city (the cache loader)
+    def fetch_weather(self, city):
+        processed_data = fetch_city_weather(city)
+
+        # Keep the forecast as the city's AI summary context, shared by all workers
+        summary_contexts.save(processed_data, query=city)
+
+        # Queue the snapshot, it is saved in the background if it differs from the last one for the city
+        snapshot_writer.enqueue(processed_data)
+        return processed_data
+
 
 # endpoint for weather data of given coordinates: parameters: lat: float, lon: float
 class GetWeatherByCoordinates(View):
@@ -81,93 +85,169 @@ class GetWeatherByCoordinates(View):
         # Get latitude and longitude from the request
         latitude = request.GET.get('lat')
         longitude = request.GET.get('lon')
-        api_key = settings.OPENWEATHERMAP_API_KEY
         
         if not latitude or not longitude:
             return JsonResponse({'error': 'Latitude and Longitude are required parameters.'}, status=400)
-        
-        # Fetch weather data from OpenWeatherMap by coordinates
-        url = f'http://api.openweathermap.org/data/2.5/forecast?lat={latitude}&lon={longitude}&appid={api_key}&units=metric'
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Process the data
-            processed_data = {
-                'city': data['city']['name'],
-                'country': data['city']['country'],
-                'current': {
-                    'temp_c': data['list'][0]['main']['temp'],
-                    'description': data['list'][0]['weather'][0]['description'],
-                    'wind_speed': data['list'][0]['wind']['speed'],
-                    'humidity': data['list'][0]['main']['humidity'],
-                    'pressure': data['list'][0]['main']['pressure'], 
-                    "uv": 1  # Note: UV index is hardcoded to 1
-                },
-                
-                'forecast': [
-                    {
-                        'date': item['dt_txt'].split()[0],
-                        'temp_min': item['main']['temp_min'],
-                        'temp_max': item['main']['temp_max'],
-                        'description': item['weather'][0]['description']
-                    } for item in data['list'][::8]  # Get data for every 24 hours
-                ]
-            }
-            # Store the data in the in-memory dictionary
-            weather_data_store['latest'] = processed_data
-            
-            # Retrieve the last saved weather data for the city
-            last_saved_weather = Weather.objects.filter(city=processed_data['city']).order_by('-id').first()
-            
-            # Check if the last saved city matches the current one and the data is different
-            if not last_saved_weather or (
-                last_saved_weather.country != processed_data['country'] or
-                last_saved_weather.temperature != processed_data['current']['temp_c'] or
-                last_saved_weather.description != processed_data['current']['description'] or
-                last_saved_weather.humidity != processed_data['current']['humidity'] or
-                last_saved_weather.wind_speed != processed_data['current']['wind_speed'] or
-                last_saved_weather.pressure != processed_data['current']['pressure'] or
-                last_saved_weather.forecast != processed_data['forecast']
-            ):
-                # Save the new weather data if it is different
-                Weather.objects.create(
-                    city=processed_data['city'],
-                    country=processed_data['country'],
-                    temperature=processed_data['current']['temp_c'],
-                    description=processed_data['current']['description'],
-                    humidity=processed_data['current']['humidity'],
-                    wind_speed=processed_data['current']['wind_speed'],
-                    pressure=processed_data['current']['pressure'],
-                    forecast=processed_data['forecast'],
-                )
-            return JsonResponse(processed_data)
+
+        # Validate, round onto the cache grid and reuse a nearby cached point
+        try:
+            latitude, longitude = snap_coordinates(latitude, longitude)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        popularity.record(*coordinates_query(latitude, longitude))
+
+        # Serve from the forecast cache, keyed on the rounded coordinates
+        cache_key = coordinates_cache_key(latitude, longitude)
+        with span('forecast'):
+            processed_data, status = weather_response(cache_key, lambda: self.fetch_weather(latitude, longitude))
+        if status != 200:
+            return JsonResponse(processed_data, status=status)
+        return weather_json(request, processed_data, cache_key)
+
+    # function to fetch, process and persist the forecast for coordinates (the cache loader)
+    def fetch_weather(self, latitude, longitude):
+        processed_data = fetch_coordinates_weather(latitude, longitude)
+
+        # Keep the forecast as the AI summary context of the city it resolved to
+        summary_contexts.save(processed_data)
+
+        # Queue the snapshot, it is saved in the background if it differs from the last one for the city
+        snapshot_writer.enqueue(processed_data)
+        return processed_data
+
+
+# shared pool bounding the concurrent upstream calls made by batch requests
+_batch_executor = None
+
+
+def get_batch_executor():
+    global _batch_executor
+    if _batch_executor is None:
+        _batch_executor = ThreadPoolExecutor(
+            max_workers=settings.WEATHER_BATCH['WORKERS'], thread_name_prefix='weather-batch'
+        )
+    return _batch_executor
+
+
+# endpoint for weather data of many locations at once
+# GET parameters: city: string (repeatable), coords: "lat,lon" (repeatable)
+# POST JSON body: {"cities": ["Paris", ...], "coordinates": [[48.85, 2.35], {"lat": 40.7, "lon": -74.0}, ...]}
+@method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(gzip_page, name='dispatch')
+class BatchWeatherView(View):
+    def get(self, request):
+        coordinates = [item.split(',', 1) for item in request.GET.getlist('coords')]
+        return self.batch_response(request, request.GET.getlist('city'), coordinates)
+
+    def post(self, request):
+        try:
+            body = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Request body must be valid JSON.'}, status=400)
+        if not isinstance(body, dict):
+            return JsonResponse({'error': 'Request body must be a JSON object.'}, status=400)
+        cities, coordinates = body.get('cities') or [], body.get('coordinates') or []
+        if not isinstance(cities, list) or not isinstance(coordinates, list):
+            return JsonResponse({'error': 'cities and coordinates must be JSON arrays.'}, status=400)
+        return self.batch_response(request, cities, coordinates)
+
+    def batch_response(self, request, cities, coordinates):
+        items = [{'city': city} for city in cities] + [self.coordinate_item(pair) for pair in coordinates]
+        max_items = settings.WEATHER_BATCH['MAX_ITEMS']
+        if not items:
+            return JsonResponse({'error': 'Provide at least one city or coordinate pair.'}, status=400)
+        if len(items) > max_items:
+            return JsonResponse({'error': f'At most {max_items} locations are allowed per request.'}, status=400)
+
+        # Fetch every location concurrently, then save all new snapshots in one bulk insert
+        batch = SnapshotBatch()
+        results = list(get_batch_executor().map(lambda item: self.fetch_item(item, batch), items))
+        batch.flush()
+        if compact_requested(request):
+            for result in results:
+                if 'data' in result:
+                    result['data'] = compact_forecast(result['data'])
+        body = dumps({'count': len(results), 'results': results})
+        return conditional_json(request, body, body_etag(body), cache_control='no-cache')
+
+    # normalize a [lat, lon] pair or {"lat": .., "lon": ..} object
+    def coordinate_item(self, pair):
+        if isinstance(pair, dict):
+            pair = (pair.get('lat'), pair.get('lon'))
+        try:
+            latitude, longitude = pair
+            latitude, longitude = snap_coordinates(latitude, longitude)
+        except (TypeError, ValueError):
+            return {'invalid': pair}
+        return {'lat': latitude, 'lon': longitude}
+
+    def fetch_item(self, item, batch):
+        if 'invalid' in item:
+            return {'query': item['invalid'], 'status': 400, 'error': 'Coordinates must be a [lat, lon] pair of numbers.'}
+
+        if 'city' in item:
+            if not isinstance(item['city'], str):
+                return {'query': item, 'status': 400, 'error': 'City must be a place name.'}
+            try:
+                city = canonical_city(item['city'])
+            except ValueError as e:
+                return {'query': item, 'status': 400, 'error': str(e)}
+            cache_key, query = city_query(city)
+            loader = lambda: self.collect(fetch_city_weather(city), batch)
         else:
-            return JsonResponse({'error': 'Unable to fetch weather data'}, status=400)
+            cache_key, query = coordinates_query(item['lat'], item['lon'])
+            loader = lambda: self.collect(fetch_coordinates_weather(item['lat'], item['lon']), batch)
+        popularity.record(cache_key, query)
+
+        payload, status = weather_response(cache_key, loader)
+        if status != 200:
+            return {'query': item, 'status': status, 'error': payload['error']}
+        return {'query': item, 'status': status, 'data': payload}
+
+    def collect(self, processed_data, batch):
+        summary_contexts.save(processed_data)
+        batch.add(processed_data)
+        return processed_data
 
 
 # endpoint for generating a summary of the weather: parameters: city: string, country: string
 class GenerateWeatherSummary(View):
     def get(self, request):
-        # Retrieve the last weather data from the in-memory store
-        last_weather_data = weather_data_store.get('latest', None)
+        # Retrieve the forecast of the requested city (the most recently fetched one without a city)
+        last_weather_data = summary_contexts.get(*self.summary_city(request))
         
         if not last_weather_data:
             return JsonResponse({'error': 'No weather data available.'}, status=400)
         
         # Prepare the prompt for the AI
         prompt = self.prepare_prompt(last_weather_data)
+
+        # Stream the summary as Server-Sent Events when asked (?stream=1)
+        if self.wants_stream(request):
+            return self.stream_response(self.stream_events(prompt))
         
-        # Generate the summary using Gemini
+        # Generate the summary using Gemini, reusing a cached one for the same prompt
         try:
-            summary = self.generate_ai_summary(prompt)
+            summary = summary_cache.get_or_load(summary_cache_key(prompt), lambda: self.generate_ai_summary(prompt))
             # Ensure the summary is clean and formatted
             formatted_summary = self.format_summary(summary)
             return JsonResponse({'summary': formatted_summary})
+        except UpstreamUnavailable:
+            return JsonResponse({'error': 'AI summaries are unavailable right now, please try again later.'}, status=503)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
         
+    # function to pick the city/country to summarize, names and aliases resolve like in WeatherView
+    def summary_city(self, request):
+        city, country = request.GET.get('city'), request.GET.get('country')
+        if city and not country:
+            try:
+                city = canonical_city(city)
+            except ValueError:
+                pass
+        return city, country
+
     # function to prepare the prompt for the AI
     def prepare_prompt(self, weather_data):
         current = weather_data['current']
@@ -197,14 +277,209 @@ class GenerateWeatherSummary(View):
         return prompt
     # function to generate the summary using Gemini
     def generate_ai_summary(self, prompt):
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
+        gemini.spend_budget()
+        with span('upstream.gemini'):
+            response = get_model().generate_content(prompt)
         return response.text
     
+    # function to stream the summary from Gemini chunk by chunk
+    def generate_ai_summary_stream(self, prompt):
+        gemini.spend_budget()
+        for chunk in get_model().generate_content(prompt, stream=True):
+            yield chunk.text
+    
     # function to format the summary for display
     def format_summary(self, summary):
         # Replace new lines with spaces and limit the text length
         cleaned_summary = summary.replace('\n', ' ')
         # Ensure the text is concise and easy to read
-        return cleaned_summary[:5000]  # Limit to a reasonable length
\ No newline at end of file
+        return cleaned_summary[:SUMMARY_MAX_LENGTH]  # Limit to a reasonable length
+
+    def wants_stream(self, request):
+        return request.GET.get('stream', '').lower() in ('1', 'true', 'yes')
+
+    def stream_response(self, events):
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Keep proxies (nginx) from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    # function to produce the SSE events: "chunk" events with formatted text as it is
+    # generated, then "done" with the full summary (or "error")
+    def stream_events(self, prompt):
+        cache_key = summary_cache_key(prompt)
+        summary = summary_cache.get(cache_key)
+        if summary is not None:
+            summary = self.format_summary(summary)
+            yield sse_event('chunk', {'text': summary})
+            yield sse_event('done', {'summary': summary})
+            return
+
+        formatter = SummaryFormatter(self.format_summary)
+        try:
+            for chunk in self.generate_ai_summary_stream(prompt):
+                text = formatter.feed(chunk)
+                if text:
+                    yield sse_event('chunk', {'text': text})
+                if formatter.done:
+                    break
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+
+        summary_cache.set(cache_key, formatter.summary)
+        yield sse_event('done', {'summary': formatter.summary})
+
+
+# endpoint for stored weather snapshots of a city over time
+# parameters: city: string, country: string (optional), start/end: ISO date or datetime (optional),
+# resolution: raw|hour|day, limit: int, cursor: string (the "next" of the previous page), stream: 1
+@method_decorator(gzip_page, name='dispatch')
+class WeatherHistoryView(View):
+    def get(self, request):
+        config = get_history_settings()
+        city = request.GET.get('city')
+        if not city:
+            return JsonResponse({'error': 'City is a required parameter.'}, status=400)
+
+        # Default to the last DEFAULT_DAYS days
+        try:
+            end = parse_time(request.GET['end'], end=True) if request.GET.get('end') else timezone.now()
+            if request.GET.get('start'):
+                start = parse_time(request.GET['start'])
+            else:
+                start = end - timedelta(days=config['DEFAULT_DAYS'])
+        except ValueError:
+            return JsonResponse({'error': 'start and end must be ISO 8601 dates or datetimes.'}, status=400)
+        if start >= end:
+            return JsonResponse({'error': 'start must be before end.'}, status=400)
+
+        try:
+            limit = min(int(request.GET.get('limit', config['PAGE_SIZE'])), config['MAX_PAGE_SIZE'])
+        except ValueError:
+            return JsonResponse({'error': 'limit must be an integer.'}, status=400)
+        if limit < 1:
+            return JsonResponse({'error': 'limit must be positive.'}, status=400)
+
+        try:
+            query = HistoryQuery(*history_city(city, request.GET.get('country')), start, end,
+                                 request.GET.get('resolution', 'raw'))
+            cursor = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # Long ranges (?stream=1) are encoded row by row as the database returns them,
+        # through an async iterator when served over ASGI
+        if request.GET.get('stream', '').lower() in ('1', 'true', 'yes'):
+            chunks = query.astream(cursor) if isinstance(request, ASGIRequest) else query.stream(cursor)
+            response = StreamingHttpResponse(chunks, content_type='application/json')
+            response['Cache-Control'] = 'no-cache'
+            return response
+
+        body = dumps(query.page(limit, cursor))
+        return conditional_json(request, body, body_etag(body), cache_control='no-cache')
+
+
+# endpoint for city name autocomplete: parameters: q: string, limit: int
+class CitySuggestView(View):
+    def get(self, request):
+        config = get_gazetteer_settings()
+        try:
+            limit = min(int(request.GET.get('limit', config['SUGGEST_LIMIT'])), config['SUGGEST_MAX_LIMIT'])
+        except ValueError:
+            return JsonResponse({'error': 'limit must be an integer.'}, status=400)
+
+        cities = get_city_index().suggest(request.GET.get('q', ''), max(limit, 0))
+        results = [
+            {'name': city.name, 'country': city.country, 'lat': city.latitude, 'lon': city.longitude}
+            for city in cities
+        ]
+        response = JsonResponse({'results': results})
+        # The gazetteer only changes with a deploy, let browsers and proxies keep the answers
+        response['Cache-Control'] = 'public, max-age=86400'
+        return response
+
+
+# endpoint exposing the forecast and summary cache counters used to tune TTLs and sizes
+class CacheStatsView(View):
+    def get(self, request):
+        return JsonResponse({'forecast': forecast_cache.info(), 'summary': summary_cache.info()})
+
+
+# endpoint exposing the write-behind queue depth and flush latency
+class PersistenceStatsView(View):
+    def get(self, request):
+        return JsonResponse({'snapshots': snapshot_writer.info()})
+
+
+# endpoint exposing upstream call latency, status counts and circuit breaker state
+class UpstreamStatsView(View):
+    def get(self, request):
+        return JsonResponse({'openweathermap': openweathermap.info()})
+
+
+HISTOGRAM_HELP = {
+    'weather_request_duration_seconds': 'Request latency by endpoint, method and status class.',
+    'weather_stage_duration_seconds': 'Latency of request stages (upstream calls, parsing, database, serialization).',
+}
+
+
+# endpoint exposing latency histograms, upstream, cache and persistence counters in the
+# Prometheus text format (?format=json for p50/p95/p99 per endpoint and stage)
+class MetricsView(View):
+    def get(self, request):
+        upstreams = {client.name: client.info() for client in (openweathermap, gemini)}
+        caches = {'forecast': forecast_cache.info(), 'summary': summary_cache.info()}
+        snapshots = snapshot_writer.info()
+
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'latency_ms': registry.percentiles(),
+                'upstream': upstreams, 'cache': caches, 'snapshots': snapshots,
+            })
+
+        families = prometheus_histograms(HISTOGRAM_HELP)
+        families.append(prometheus_family(
+            'weather_upstream_responses_total', 'counter', 'Upstream responses by status code.',
+            [({'upstream': name, 'status': status}, count)
+             for name, info in upstreams.items() for status, count in sorted(info['statuses'].items())],
+        ))
+        for field, help_text in (
+            ('errors', 'Upstream calls that got no response.'),
+            ('retries', 'Upstream call retries.'),
+            ('rejected', 'Upstream calls refused by the open circuit breaker.'),
+            ('over_budget', 'Upstream calls refused by the call budget.'),
+        ):
+            families.append(prometheus_family(
+                f'weather_upstream_{field}_total', 'counter', help_text,
+                [({'upstream': name}, info[field]) for name, info in upstreams.items()],
+            ))
+        families.append(prometheus_family(
+            'weather_upstream_circuit_open', 'gauge', '1 while the circuit breaker is open.',
+            [({'upstream': name}, int(info['breaker'] == 'open')) for name, info in upstreams.items()],
+        ))
+        families.append(prometheus_family(
+            'weather_upstream_budget_used', 'gauge', 'Upstream calls counted in the current budget window.',
+            [({'upstream': name, 'window': window}, usage['used'])
+             for name, info in upstreams.items() for window, usage in info['budget'].items()],
+        ))
+        families.append(prometheus_family(
+            'weather_cache_events_total', 'counter', 'Cache lookups and loads by outcome.',
+            [({'cache': name, 'event': event}, info[event])
+             for name, info in caches.items() for event in ('hits', 'misses', 'stale', 'loads', 'coalesced', 'errors')],
+        ))
+        families.append(prometheus_family(
+            'weather_cache_entries', 'gauge', 'Entries in the in-process cache tier.',
+            [({'cache': name}, info['size']) for name, info in caches.items()],
+        ))
+        families.append(prometheus_family(
+            'weather_snapshots_total', 'counter', 'Weather snapshots by write-behind outcome.',
+            [({'event': event}, snapshots[event])
+             for event in ('enqueued', 'written', 'deduped', 'overflow', 'flushes', 'errors')],
+        ))
+        families.append(prometheus_family(
+            'weather_snapshot_queue_depth', 'gauge', 'Snapshots waiting to be written.',
+            [({}, snapshots['queue_depth'])],
+        ))
+        return HttpResponse('\n\n'.join(families) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,178 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from .cache import city_cache_key, coordinates_cache_key, forecast_cache
+from .gazetteer import canonical_city
+from .upstream import openweathermap
+
+logger = logging.getLogger(__name__)
+
+# Default warming settings, overridable through settings.WEATHER_WARMING
+DEFAULTS = {
+    'TOP_N': 20,                    # most requested keys kept warm
+    'ALWAYS': ['New York'],         # cities warmed regardless of traffic (the WeatherView default)
+    'REFRESH_AHEAD': 120,           # refresh entries with less than this many fresh seconds left
+    'INTERVAL': 60,                 # seconds between warming rounds
+    'MAX_CALLS_PER_MINUTE': 20,     # OpenWeatherMap calls the warmer may spend
+    'WINDOW': 3600,                 # popularity bucket length in seconds, the last two are ranked
+    'FLUSH_INTERVAL': 10,           # seconds request counts are buffered per process
+    'MAX_TRACKED': 1000,            # keys remembered per bucket
+    'BACKEND': 'default',           # Django cache alias shared by the workers and the warmer
+    'KEY_PREFIX': 'weather:popularity',
+}
+
+
+def get_warming_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'WEATHER_WARMING', {}))
+    return config
+
+
+# the query that loads a forecast cache key: {'city': ...} or {'lat': ..., 'lon': ...}
+def city_query(city):
+    return city_cache_key(city), {'city': city}
+
+
+def coordinates_query(latitude, longitude):
+    return coordinates_cache_key(latitude, longitude), {'lat': latitude, 'lon': longitude}
+
+
+# counts requests per forecast cache key; counts are buffered in memory and added to
+# per-window counters in the Django cache so the warmer sees the traffic of every worker
+class PopularityTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._queries = {}
+        self._flushed_at = time.monotonic()
+
+    def record(self, key, query):
+        config = get_warming_settings()
+        with self._lock:
+            self._counts[key] += 1
+            self._queries[key] = query
+            due = time.monotonic() - self._flushed_at >= config['FLUSH_INTERVAL']
+            if due:
+                self._flushed_at = time.monotonic()
+        if due:
+            self.flush()
+
+    def _bucket(self, config, offset=0):
+        return int(time.time() // config['WINDOW']) - offset
+
+    def _registry_key(self, config, bucket):
+        return f"{config['KEY_PREFIX']}:keys:{bucket}"
+
+    def _count_key(self, config, bucket, key):
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return f"{config['KEY_PREFIX']}:count:{bucket}:{digest}"
+
+    # add the buffered counts to the shared counters of the current window
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            queries, self._queries = self._queries, {}
+        if not counts:
+            return
+
+        config = get_warming_settings()
+        shared = caches[config['BACKEND']]
+        bucket = self._bucket(config)
+        timeout = config['WINDOW'] * 2
+
+        # the registry maps keys to their queries; concurrent flushes may drop a new key,
+        # which is registered again on its next flush
+        registry_key = self._registry_key(config, bucket)
+        registry = shared.get(registry_key) or {}
+        new_keys = [key for key in queries if key not in registry]
+        if new_keys:
+            for key in new_keys[:max(0, config['MAX_TRACKED'] - len(registry))]:
+                registry[key] = queries[key]
+            shared.set(registry_key, registry, timeout)
+
+        for key, count in counts.items():
+            count_key = self._count_key(config, bucket, key)
+            shared.add(count_key, 0, timeout)
+            try:
+                shared.incr(count_key, count)
+            except ValueError:
+                shared.set(count_key, count, timeout)
+
+    # [(key, query, count)] of the most requested keys over the current and previous window
+    def top(self, n):
+        config = get_warming_settings()
+        shared = caches[config['BACKEND']]
+        queries = {}
+        count_keys = {}
+        for bucket in (self._bucket(config, 1), self._bucket(config)):
+            registry = shared.get(self._registry_key(config, bucket)) or {}
+            queries.update(registry)
+            for key in registry:
+                count_keys[self._count_key(config, bucket, key)] = key
+
+        totals = Counter()
+        for count_key, count in shared.get_many(list(count_keys)).items():
+            totals[count_keys[count_key]] += count
+        return [(key, queries[key], count) for key, count in totals.most_common(n)]
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+            self._queries.clear()
+
+
+# refreshes the most requested forecasts shortly before they expire, spacing upstream
+# calls to stay within MAX_CALLS_PER_MINUTE; loaders are the views' fetch_weather methods
+# so warmed forecasts are processed and persisted exactly like requested ones
+class CacheWarmer:
+    def __init__(self, city_loader, coordinates_loader, tracker=None, cache=None, sleep=time.sleep, budget=None):
+        self.city_loader = city_loader
+        self.coordinates_loader = coordinates_loader
+        self.tracker = tracker or popularity
+        self.cache = cache or forecast_cache
+        self.sleep = sleep
+        self.budget = budget or openweathermap.budget
+
+    def loader(self, query):
+        if 'city' in query:
+            return lambda: self.city_loader(query['city'])
+        return lambda: self.coordinates_loader(query['lat'], query['lon'])
+
+    # the configured cities followed by the most requested keys, without duplicates
+    def candidates(self, config):
+        candidates = dict(city_query(canonical_city(city)) for city in config['ALWAYS'])
+        for key, query, count in self.tracker.top(config['TOP_N']):
+            candidates.setdefault(key, query)
+        return candidates
+
+    # one warming round, returns what it did
+    def warm(self):
+        config = get_warming_settings()
+        spacing = 60.0 / config['MAX_CALLS_PER_MINUTE']
+        self.tracker.flush()
+
+        result = dict.fromkeys(('checked', 'refreshed', 'skipped', 'errors'), 0)
+        for key, query in self.candidates(config).items():
+            result['checked'] += 1
+            # leave what is left of a low OpenWeatherMap budget to user requests
+            if self.cache.fresh_for(key) > config['REFRESH_AHEAD'] or self.budget.low():
+                result['skipped'] += 1
+                continue
+            if result['refreshed'] or result['errors']:
+                self.sleep(spacing)
+            try:
+                self.cache.refresh(key, self.loader(query))
+                result['refreshed'] += 1
+            except Exception:
+                result['errors'] += 1
+                logger.warning('Warming %s failed', key, exc_info=True)
+        return result
+
+
+# shared tracker fed by the weather views
+popularity = PopularityTracker()
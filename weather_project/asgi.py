@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "weather_project.settings")
+# Route the weather endpoints to the async views when served over ASGI
+os.environ.setdefault("WEATHER_ASYNC_VIEWS", "True")
 
 application = get_asgi_application()
@@ -19,6 +19,11 @@ DEBUG = True  # Temporarily set to True for debugging
 
 ALLOWED_HOSTS = ['weather-api-backend-eta.vercel.app', 'localhost', '127.0.0.1']
 
+# "Lean API" runtime profile for API-only deployments such as Vercel serverless: leaves out
+# the admin, sessions, messages and DRF apps and the middleware the JSON endpoints do not
+# use, to shorten cold starts (see benchmarks/cold_start.py)
+WEATHER_LEAN_API = env.bool('WEATHER_LEAN_API', default=False)
+
 # Application definition
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -33,7 +38,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'corsheaders.middleware.CorsMiddleware',  # Make sure this is at the top
+    'weather_api.metrics.TimingMiddleware',  # times the whole request, including the other middleware
+    'corsheaders.middleware.CorsMiddleware',  # Make sure this is at the top (after the timing middleware)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -41,6 +47,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'weather_api.ratelimit.RateLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'weather_project.urls'
@@ -61,6 +68,26 @@ TEMPLATES = [
     },
 ]
 
+if WEATHER_LEAN_API:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in (
+        'django.contrib.admin',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+        'django.contrib.staticfiles',
+        'rest_framework',
+    )]
+    MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in (
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',  # no cookie-authenticated forms to protect
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    )]
+    TEMPLATES[0]['OPTIONS']['context_processors'] = [
+        'django.template.context_processors.debug',
+        'django.template.context_processors.request',
+    ]
+
 WSGI_APPLICATION = 'weather_project.wsgi.application'
 
 # Database configuration
@@ -68,6 +95,118 @@ DATABASES = {
     'default': env.db('DATABASE_URL', default='sqlite:///db.sqlite3'),
 }
 
+# Cache backend shared by all workers (set CACHE_URL to e.g. redis:// in production)
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Forecast cache in front of OpenWeatherMap (see weather_api/cache.py)
+WEATHER_CACHE = {
+    'TTL': int(os.getenv('WEATHER_CACHE_TTL', 600)),
+    'STALE_TTL': int(os.getenv('WEATHER_CACHE_STALE_TTL', 1800)),
+    'MAX_ENTRIES': int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', 512)),
+    'BACKEND': 'default',
+    'COORDINATE_PRECISION': 2,
+    'NEAREST_KM': float(os.getenv('WEATHER_CACHE_NEAREST_KM', 2.0)),
+}
+
+# AI summary cache, keyed on the prompt hash
+WEATHER_SUMMARY_CACHE = {
+    'TTL': int(os.getenv('WEATHER_SUMMARY_CACHE_TTL', 1800)),
+    'STALE_TTL': 0,
+    'MAX_ENTRIES': int(os.getenv('WEATHER_SUMMARY_CACHE_MAX_ENTRIES', 256)),
+    'BACKEND': 'default',
+}
+
+# Forecast each city's AI summary is generated from, shared by all workers through the cache
+WEATHER_SUMMARY_CONTEXT = {
+    'TTL': int(os.getenv('WEATHER_SUMMARY_CONTEXT_TTL', 3600)),
+    'MISS_TTL': int(os.getenv('WEATHER_SUMMARY_CONTEXT_MISS_TTL', 60)),
+    'BACKEND': 'default',
+}
+
+# Pooled HTTP client for OpenWeatherMap (see weather_api/upstream.py)
+UPSTREAM_HTTP = {
+    'POOL_SIZE': int(os.getenv('UPSTREAM_POOL_SIZE', 10)),
+    'ASYNC_POOL_SIZE': int(os.getenv('UPSTREAM_ASYNC_POOL_SIZE', 100)),
+    'CONNECT_TIMEOUT': float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05)),
+    'READ_TIMEOUT': float(os.getenv('UPSTREAM_READ_TIMEOUT', 10)),
+    'RETRIES': int(os.getenv('UPSTREAM_RETRIES', 2)),
+    'BREAKER_THRESHOLD': 5,
+    'BREAKER_RESET': 30,
+}
+
+# Write-behind persistence of Weather snapshots (see weather_api/persistence.py). Off by
+# default on Vercel (which sets VERCEL=1) and in the lean API profile: serverless runtimes
+# freeze background threads between invocations, leaving queued snapshots unwritten.
+WEATHER_PERSISTENCE = {
+    'WRITE_BEHIND': env.bool(
+        'WEATHER_WRITE_BEHIND', default=not (WEATHER_LEAN_API or env.bool('VERCEL', default=False)),
+    ),
+    'QUEUE_SIZE': int(os.getenv('WEATHER_WRITE_QUEUE_SIZE', 1000)),
+    'BATCH_SIZE': int(os.getenv('WEATHER_WRITE_BATCH_SIZE', 100)),
+    'FLUSH_INTERVAL': float(os.getenv('WEATHER_WRITE_FLUSH_INTERVAL', 2.0)),
+}
+
+# Multi-city batch endpoint (see BatchWeatherView)
+WEATHER_BATCH = {
+    'MAX_ITEMS': int(os.getenv('WEATHER_BATCH_MAX_ITEMS', 50)),
+    'WORKERS': int(os.getenv('WEATHER_BATCH_WORKERS', 8)),
+}
+
+# Popular city prefetching (see weather_api/warming.py and the warm_weather_cache command)
+WEATHER_WARMING = {
+    'TOP_N': int(os.getenv('WEATHER_WARM_TOP_N', 20)),
+    'ALWAYS': [city for city in os.getenv('WEATHER_WARM_CITIES', 'New York').split(',') if city.strip()],
+    'REFRESH_AHEAD': int(os.getenv('WEATHER_WARM_REFRESH_AHEAD', 120)),
+    'INTERVAL': int(os.getenv('WEATHER_WARM_INTERVAL', 60)),
+    'MAX_CALLS_PER_MINUTE': int(os.getenv('WEATHER_WARM_MAX_CALLS_PER_MINUTE', 20)),
+}
+
+# Snapshot history endpoint (see weather_api/history.py)
+WEATHER_HISTORY = {
+    'DEFAULT_DAYS': int(os.getenv('WEATHER_HISTORY_DEFAULT_DAYS', 7)),
+    'PAGE_SIZE': int(os.getenv('WEATHER_HISTORY_PAGE_SIZE', 500)),
+    'MAX_PAGE_SIZE': int(os.getenv('WEATHER_HISTORY_MAX_PAGE_SIZE', 5000)),
+}
+
+# Rollup and deletion of old snapshots (see weather_api/retention.py and the rollup_weather_history command)
+WEATHER_RETENTION = {
+    'DAYS': int(os.getenv('WEATHER_RETENTION_DAYS', 90)),
+    'BATCH_SIZE': int(os.getenv('WEATHER_RETENTION_BATCH_SIZE', 1000)),
+    'PAUSE': float(os.getenv('WEATHER_RETENTION_PAUSE', 0.0)),
+}
+
+# Per-client rate limits and upstream call budgets (see weather_api/ratelimit.py). Set
+# WEATHER_RATE_LIMIT_BACKEND to a shared cache alias when running several workers.
+WEATHER_RATE_LIMITS = {
+    'ENABLED': env.bool('WEATHER_RATE_LIMIT_ENABLED', default=True),
+    'BACKEND': os.getenv('WEATHER_RATE_LIMIT_BACKEND') or None,
+    'TRUST_X_FORWARDED_FOR': env.bool('WEATHER_RATE_LIMIT_TRUST_X_FORWARDED_FOR', default=False),
+    'API_KEYS': [key for key in os.getenv('WEATHER_API_KEYS', '').split(',') if key.strip()],
+    'BUDGETS': {
+        'openweathermap': {
+            'PER_MINUTE': int(os.getenv('OPENWEATHERMAP_CALLS_PER_MINUTE', 60)),
+            'PER_DAY': int(os.getenv('OPENWEATHERMAP_CALLS_PER_DAY', 30000)),
+        },
+        'gemini': {
+            'PER_MINUTE': int(os.getenv('GEMINI_CALLS_PER_MINUTE', 15)),
+            'PER_DAY': int(os.getenv('GEMINI_CALLS_PER_DAY', 1500)),
+        },
+    },
+}
+
+# Request timing histograms, /api/metrics/ and the opt-in Server-Timing header (see weather_api/metrics.py)
+WEATHER_METRICS = {
+    'ENABLED': env.bool('WEATHER_METRICS_ENABLED', default=True),
+    'SERVER_TIMING': env.bool('WEATHER_SERVER_TIMING', default=True),
+}
+
+# City name resolution and autocomplete (see weather_api/gazetteer.py)
+WEATHER_GAZETTEER = {
+    'STRICT': env.bool('WEATHER_GAZETTEER_STRICT', default=False),
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -95,8 +234,16 @@ CORS_ALLOW_HEADERS = [
     'dnt',
     'origin',
     'user-agent',
+    'x-api-key',        # known API keys get larger rate limits (see WEATHER_API_KEYS)
     'x-csrftoken',
     'x-requested-with',
+    'x-server-timing',  # opt-in Server-Timing header (see WEATHER_SERVER_TIMING)
+]
+
+# Let browser clients read the stage timings and when to retry a 429
+CORS_EXPOSE_HEADERS = [
+    'retry-after',
+    'server-timing',
 ]
 
 # Internationalization
@@ -115,3 +262,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # API Keys
 OPENWEATHERMAP_API_KEY = os.getenv('OPENWEATHERMAP_API_KEY')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+# Upstream base URLs (overridable to point at a local mock for benchmarks)
+OPENWEATHERMAP_BASE_URL = os.getenv('OPENWEATHERMAP_BASE_URL', 'http://api.openweathermap.org/data/2.5')
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL', 'https://generativelanguage.googleapis.com/v1beta')
+
+# Serve the weather routes with the async views (set when running under ASGI)
+WEATHER_ASYNC_VIEWS = env.bool('WEATHER_ASYNC_VIEWS', default=False)
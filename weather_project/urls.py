@@ -1,13 +1,17 @@
-from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('weather_api.urls')),
 ]
 
+# the admin is left out of the lean API profile (WEATHER_LEAN_API)
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
+
 
 # static files and routes 
 if settings.DEBUG: